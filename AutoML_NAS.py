@@ -10,423 +10,221 @@ Modified by
 import optuna
 import copy
 import os
+import multiprocessing as mp
 import torch.nn as nn
 from datetime import datetime
 import wandb
 import torch
-from src.model import Model
-from src.utils.torch_utils import model_info, check_runtime
+from src.model import Model, ModelParser
+from src.utils.torch_utils import model_info, benchmark_runtime
 from src.utils.common import read_yaml
-from src.dataloader import TorchTrainer, create_dataloader
-from src.trainer import count_model_params
-from typing import Any, Dict, List, Tuple
+from src.utils.cost import LatencyModel
+from src.logger import create_logger
+from src.nas import (
+    ArchitectureCache,
+    StudyDataService,
+    LatencyTable,
+    SuperNet,
+    SuccessiveHalvingPruner,
+    architecture_hash,
+    compute_proxy,
+    context_hash,
+    create_study,
+    partition_cpus,
+    recalibrate_bn,
+    reject_by_proxy,
+    split_trials,
+    study_name,
+    suggest_model_config,
+)
+from src.trainer import TorchTrainer, count_model_params
+from typing import Any, Dict, List, Optional, Tuple
 import argparse
 
 DATA_CONFIG = read_yaml(cfg="configs/data/taco_tune.yaml")
 MODEL_CONFIG = read_yaml(cfg="configs/model/example.yaml")
-
-def search_model(trial: optuna.trial.Trial) -> List[Any]:
-    """Search model structure from user-specified search space."""
-    model = []
-    n_stride = 0
-    MAX_NUM_STRIDE = 5
-    UPPER_STRIDE = 2  
-
-    # Module 1
-    m1 = trial.suggest_categorical("m1", ["Conv", "DWConv"])
-    m1_args = []
-    m1_repeat = trial.suggest_int("m1/repeat", 1, 3)
-    m1_out_channel = trial.suggest_int("m1/out_channels", low=16, high=64, step=16)
-    m1_stride = trial.suggest_int("m1/stride", low=1, high=UPPER_STRIDE)
-    if m1_stride == 2:
-        n_stride += 1
-    m1_activation = trial.suggest_categorical("m1/activation", ["ReLU", "Hardswish"])
-    if m1 == "Conv":
-        # Conv args: [out_channel, kernel_size, stride, padding, groups, activation]
-        m1_args = [m1_out_channel, 3, m1_stride, None, 1, m1_activation]
-    elif m1 == "DWConv":
-        # DWConv args: [out_channel, kernel_size, stride, padding_size, activation]
-        m1_args = [m1_out_channel, 3, m1_stride, None, m1_activation]
-    model.append([m1_repeat, m1, m1_args])
-
-    # Module 2
-    m2 = trial.suggest_categorical(
-        "m2", ["Conv", "DWConv", "InvertedResidualv2", "InvertedResidualv3", "MBConv", "Pass"]
-    )
-    m2_args = []
-    m2_repeat = trial.suggest_int("m2/repeat", 1, 5)
-    m2_out_channel = trial.suggest_int("m2/out_channels", low=16, high=128, step=16)
-    m2_stride = trial.suggest_int("m2/stride", low=1, high=UPPER_STRIDE)
-    # force stride m2
-    if n_stride == 0:
-        m2_stride = 2
-    if m2 == "Conv":
-        # Conv args: [out_channel, kernel_size, stride, padding, groups, activation]
-        m2_kernel = trial.suggest_int("m2/kernel_size", low=1, high=5, step=2)
-        m2_activation = trial.suggest_categorical(
-            "m2/activation", ["ReLU", "Hardswish"]
-        )
-        m2_args = [m2_out_channel, m2_kernel, m2_stride, None, 1, m2_activation]
-    elif m2 == "DWConv":
-        # DWConv args: [out_channel, kernel_size, stride, padding_size, activation]
-        m2_kernel = trial.suggest_int("m2/kernel_size", low=1, high=5, step=2)
-        m2_activation = trial.suggest_categorical(
-            "m2/activation", ["ReLU", "Hardswish"]
-        )
-        m2_args = [m2_out_channel, m2_kernel, m2_stride, None, m2_activation]
-    elif m2 == "InvertedResidualv2":
-        m2_c = trial.suggest_int("m2/v2_c", low=16, high=32, step=16)
-        m2_t = trial.suggest_int("m2/v2_t", low=1, high=4)
-        m2_args = [m2_c, m2_t, m2_stride]
-    elif m2 == "InvertedResidualv3":
-        m2_kernel = trial.suggest_int("m2/kernel_size", low=3, high=5, step=2)
-        m2_t = round(trial.suggest_float("m2/v3_t", low=1.0, high=6.0, step=0.1), 1)
-        m2_c = trial.suggest_int("m2/v3_c", low=16, high=40, step=8)
-        m2_se = trial.suggest_categorical("m2/v3_se", [0, 1])
-        m2_hs = trial.suggest_categorical("m2/v3_hs", [0, 1])
-        # k t c SE HS s
-        m2_args = [m2_kernel, m2_t, m2_c, m2_se, m2_hs, m2_stride]
-    elif m2 == "MBConv":
-        # expand_ratio, out_channel, stride, kernel_size
-        m2_t = trial.suggest_categorical("m2/mb_t", [1, 6])
-        m2_s = trial.suggest_categorical("m2/mb_s", [1, 2])
-        m2_k = trial.suggest_categorical("m2/mb_k", [3, 5])
-        m2_args = [m2_t, m2_out_channel, m2_s, m2_k]  
-    if not m2 == "Pass":
-        if m2_stride == 2:
-            n_stride += 1
-            if n_stride >= MAX_NUM_STRIDE:
-                UPPER_STRIDE = 1
-        model.append([m2_repeat, m2, m2_args])
-
-    # Module 3
-    m3 = trial.suggest_categorical(
-        "m3", ["Conv", "DWConv", "InvertedResidualv2", "InvertedResidualv3", "MBConv", "Pass"]
-    )
-    m3_args = []
-    m3_repeat = trial.suggest_int("m3/repeat", 1, 5)
-    m3_out_channel = trial.suggest_int("m3/out_channels", low=16, high=128, step=16)
-    m3_stride = trial.suggest_int("m3/stride", low=1, high=UPPER_STRIDE)
-    if m3 == "Conv":
-        # Conv args: [out_channel, kernel_size, stride, padding, groups, activation]
-        m3_out_channel = trial.suggest_int("m3/out_channels", low=16, high=128, step=16)
-        m3_kernel = trial.suggest_int("m3/kernel_size", low=1, high=5, step=2)
-        m3_activation = trial.suggest_categorical(
-            "m3/activation", ["ReLU", "Hardswish"]
-        )
-        m3_args = [m3_out_channel, m3_kernel, m3_stride, None, 1, m3_activation]
-    elif m3 == "DWConv":
-        # DWConv args: [out_channel, kernel_size, stride, padding_size, activation]
-        m3_out_channel = trial.suggest_int("m3/out_channels", low=16, high=128, step=16)
-        m3_kernel = trial.suggest_int("m3/kernel_size", low=1, high=5, step=2)
-        m3_activation = trial.suggest_categorical(
-            "m3/activation", ["ReLU", "Hardswish"]
-        )
-        m3_args = [m3_out_channel, m3_kernel, m3_stride, None, m3_activation]
-    elif m3 == "InvertedResidualv2":
-        m3_c = trial.suggest_int("m3/v2_c", low=8, high=32, step=8)
-        m3_t = trial.suggest_int("m3/v2_t", low=1, high=8)
-        m3_args = [m3_c, m3_t, m3_stride]
-    elif m3 == "InvertedResidualv3":
-        m3_kernel = trial.suggest_int("m3/kernel_size", low=3, high=5, step=2)
-        m3_t = round(trial.suggest_float("m3/v3_t", low=1.0, high=6.0, step=0.1), 1)
-        m3_c = trial.suggest_int("m3/v3_c", low=8, high=40, step=8)
-        m3_se = trial.suggest_categorical("m3/v3_se", [0, 1])
-        m3_hs = trial.suggest_categorical("m3/v3_hs", [0, 1])
-        m3_args = [m3_kernel, m3_t, m3_c, m3_se, m3_hs, m3_stride]
-    elif m3 == "MBConv":
-        # expand_ratio, out_channel, stride, kernel_size
-        m3_t = trial.suggest_categorical("m3/mb_t", [1, 6])
-        m3_s = trial.suggest_categorical("m3/mb_s", [1, 2])
-        m3_k = trial.suggest_categorical("m3/mb_k", [3, 5])
-        m3_args = [m3_t, m3_out_channel, m3_s, m3_k]   
-    if not m3 == "Pass":
-        if m3_stride == 2:
-            n_stride += 1
-            if n_stride >= MAX_NUM_STRIDE:
-                UPPER_STRIDE = 1
-        model.append([m3_repeat, m3, m3_args])
-
-    # Module 4
-    m4 = trial.suggest_categorical(
-        "m4", ["Conv", "DWConv", "InvertedResidualv2", "InvertedResidualv3", "MBConv", "Pass"]
-    )
-    m4_args = []
-    m4_repeat = trial.suggest_int("m4/repeat", 1, 5)
-    m4_out_channel = trial.suggest_int("m4/out_channels", low=16, high=256, step=16)
-    m4_stride = trial.suggest_int("m4/stride", low=1, high=UPPER_STRIDE)
-    # force stride m4
-    if n_stride == 1:
-        m4_stride = 2
-    if m4 == "Conv":
-        # Conv args: [out_channel, kernel_size, stride, padding, groups, activation]
-        m4_kernel = trial.suggest_int("m4/kernel_size", low=1, high=5, step=2)
-        m4_activation = trial.suggest_categorical(
-            "m4/activation", ["ReLU", "Hardswish"]
-        )
-        m4_args = [m4_out_channel, m4_kernel, m4_stride, None, 1, m4_activation]
-    elif m4 == "DWConv":
-        # DWConv args: [out_channel, kernel_size, stride, padding_size, activation]
-        m4_kernel = trial.suggest_int("m4/kernel_size", low=1, high=5, step=2)
-        m4_activation = trial.suggest_categorical(
-            "m4/activation", ["ReLU", "Hardswish"]
-        )
-        m4_args = [m4_out_channel, m4_kernel, m4_stride, None, m4_activation]
-    elif m4 == "InvertedResidualv2":
-        m4_c = trial.suggest_int("m4/v2_c", low=8, high=64, step=8)
-        m4_t = trial.suggest_int("m4/v2_t", low=1, high=8)
-        m4_args = [m4_c, m4_t, m4_stride]
-    elif m4 == "InvertedResidualv3":
-        m4_kernel = trial.suggest_int("m4/kernel_size", low=3, high=5, step=2)
-        m4_t = round(trial.suggest_float("m4/v3_t", low=1.0, high=6.0, step=0.1), 1)
-        m4_c = trial.suggest_int("m4/v3_c", low=8, high=80, step=8)
-        m4_se = trial.suggest_categorical("m4/v3_se", [0, 1])
-        m4_hs = trial.suggest_categorical("m4/v3_hs", [0, 1])
-        m4_args = [m4_kernel, m4_t, m4_c, m4_se, m4_hs, m4_stride]
-    elif m4 == "MBConv":
-        # expand_ratio, out_channel, stride, kernel_size
-        m4_t = trial.suggest_categorical("m4/mb_t", [1, 6])
-        m4_s = trial.suggest_categorical("m4/mb_s", [1, 2])
-        m4_k = trial.suggest_categorical("m4/mb_k", [3, 5])
-        m4_args = [m4_t, m4_out_channel, m4_s, m4_k]   
-    if not m4 == "Pass":
-        if m4_stride == 2:
-            n_stride += 1
-            if n_stride >= MAX_NUM_STRIDE:
-                UPPER_STRIDE = 1
-        model.append([m4_repeat, m4, m4_args])
-
-    # Module 5
-    m5 = trial.suggest_categorical(
-        "m5", ["Conv", "DWConv", "InvertedResidualv2", "InvertedResidualv3", "MBConv", "Pass"]
-    )
-    m5_args = []
-    m5_repeat = trial.suggest_int("m5/repeat", 1, 5)
-    m5_out_channel = trial.suggest_int("m5/out_channels", low=16, high=256, step=16)
-    m5_stride = 1
-    if m5 == "Conv":
-        # Conv args: [out_channel, kernel_size, stride, padding, groups, activation]
-        m5_kernel = trial.suggest_int("m5/kernel_size", low=1, high=5, step=2)
-        m5_activation = trial.suggest_categorical(
-            "m5/activation", ["ReLU", "Hardswish"]
-        )
-        m5_stride = trial.suggest_int("m5/stride", low=1, high=UPPER_STRIDE)
-        m5_args = [m5_out_channel, m5_kernel, m5_stride, None, 1, m5_activation]
-    elif m5 == "DWConv":
-        # DWConv args: [out_channel, kernel_size, stride, padding_size, activation]
-        m5_kernel = trial.suggest_int("m5/kernel_size", low=1, high=5, step=2)
-        m5_activation = trial.suggest_categorical(
-            "m5/activation", ["ReLU", "Hardswish"]
-        )
-        m5_stride = trial.suggest_int("m5/stride", low=1, high=UPPER_STRIDE)
-        m5_args = [m5_out_channel, m5_kernel, m5_stride, None, m5_activation]
-    elif m5 == "InvertedResidualv2":
-        m5_c = trial.suggest_int("m5/v2_c", low=16, high=128, step=16)
-        m5_t = trial.suggest_int("m5/v2_t", low=1, high=8)
-        m5_stride = trial.suggest_int("m5/stride", low=1, high=UPPER_STRIDE)
-        m5_args = [m5_c, m5_t, m5_stride]
-    elif m5 == "InvertedResidualv3":
-        m5_kernel = trial.suggest_int("m5/kernel_size", low=3, high=5, step=2)
-        m5_t = round(trial.suggest_float("m5/v3_t", low=1.0, high=6.0, step=0.1), 1)
-        m5_c = trial.suggest_int("m5/v3_c", low=16, high=80, step=16)
-        m5_se = trial.suggest_categorical("m5/v3_se", [0, 1])
-        m5_hs = trial.suggest_categorical("m5/v3_hs", [0, 1])
-        m5_stride = trial.suggest_int("m5/stride", low=1, high=UPPER_STRIDE)
-        m5_args = [m5_kernel, m5_t, m5_c, m5_se, m5_hs, m5_stride]
-    elif m5 == "MBConv":
-        # expand_ratio, out_channel, stride, kernel_size
-        m5_t = trial.suggest_categorical("m5/mb_t", [1, 6])
-        m5_s = trial.suggest_categorical("m5/mb_s", [1, 2])
-        m5_k = trial.suggest_categorical("m5/mb_k", [3, 5])
-        m5_args = [m5_t, m5_out_channel, m5_s, m5_k]  
-    if not m5 == "Pass":
-        if m5_stride == 2:
-            n_stride += 1
-            if n_stride >= MAX_NUM_STRIDE:
-                UPPER_STRIDE = 1
-        model.append([m5_repeat, m5, m5_args])
-
-    # Module 6
-    m6 = trial.suggest_categorical(
-        "m6", ["Conv", "DWConv", "InvertedResidualv2", "InvertedResidualv3", "MBConv", "Pass"]
-    )
-    m6_args = []
-    m6_repeat = trial.suggest_int("m6/repeat", 1, 5)
-    m6_out_channel = trial.suggest_int("m6/out_channels", low=16, high=512, step=16)
-    m6_stride = trial.suggest_int("m6/stride", low=1, high=UPPER_STRIDE)
-    # force stride m6
-    if n_stride == 2:
-        m4_stride = 2
-    if m6 == "Conv":
-        # Conv args: [out_channel, kernel_size, stride, padding, groups, activation]
-        m6_kernel = trial.suggest_int("m6/kernel_size", low=1, high=5, step=2)
-        m6_activation = trial.suggest_categorical(
-            "m6/activation", ["ReLU", "Hardswish"]
-        )
-        m6_args = [m6_out_channel, m6_kernel, m6_stride, None, 1, m6_activation]
-    elif m6 == "DWConv":
-        # DWConv args: [out_channel, kernel_size, stride, padding_size, activation]
-        m6_kernel = trial.suggest_int("m6/kernel_size", low=1, high=5, step=2)
-        m6_activation = trial.suggest_categorical(
-            "m6/activation", ["ReLU", "Hardswish"]
-        )
-        m6_args = [m6_out_channel, m6_kernel, m6_stride, None, m6_activation]
-    elif m6 == "InvertedResidualv2":
-        m6_c = trial.suggest_int("m6/v2_c", low=16, high=128, step=16)
-        m6_t = trial.suggest_int("m6/v2_t", low=1, high=8)
-        m6_args = [m6_c, m6_t, m6_stride]
-    elif m6 == "InvertedResidualv3":
-        m6_kernel = trial.suggest_int("m6/kernel_size", low=3, high=5, step=2)
-        m6_t = round(trial.suggest_float("m6/v3_t", low=1.0, high=6.0, step=0.1), 1)
-        m6_c = trial.suggest_int("m6/v3_c", low=16, high=160, step=16)
-        m6_se = trial.suggest_categorical("m6/v3_se", [0, 1])
-        m6_hs = trial.suggest_categorical("m6/v3_hs", [0, 1])
-        m6_args = [m6_kernel, m6_t, m6_c, m6_se, m6_hs, m6_stride]
-    elif m6 == "MBConv":
-        # expand_ratio, out_channel, stride, kernel_size
-        m6_t = trial.suggest_categorical("m6/mb_t", [1, 6])
-        m6_s = trial.suggest_categorical("m6/mb_s", [1, 2])
-        m6_k = trial.suggest_categorical("m6/mb_k", [3, 5])
-        m6_args = [m6_t, m6_out_channel, m6_s, m6_k]   
-    if not m6 == "Pass":
-        if m6_stride == 2:
-            n_stride += 1
-            if n_stride >= MAX_NUM_STRIDE:
-                UPPER_STRIDE = 1
-        model.append([m6_repeat, m6, m6_args])
-
-    # Module 7
-    m7 = trial.suggest_categorical(
-        "m7", ["Conv", "DWConv", "InvertedResidualv2", "InvertedResidualv3", "MBConv", "Pass"]
+MAX_MEAN_TIME = 6
+LATENCY_TABLE = (
+    LatencyTable(DATA_CONFIG["NAS_LATENCY_TABLE"])
+    if DATA_CONFIG.get("NAS_LATENCY_TABLE")
+    else None
+)
+MAX_PARAMS = 500000
+# Timed and untimed forwards of the runtime check of each trial. The warmup
+# keeps the allocator and cuDNN autotune out of the measures, and 100 samples
+# are needed for p99. A few seconds per trial against minutes of training.
+RUNTIME_REPEAT = 100
+RUNTIME_WARMUP = 10
+
+
+def reject_reason(mean_time: float, params_nums: int) -> Optional[str]:
+    """Reason to skip an unsuitable model. None if the model is suitable."""
+    if mean_time >= MAX_MEAN_TIME:
+        return f"This model takes too much time:{mean_time}"
+    if params_nums >= MAX_PARAMS:
+        return f"This model has too many param:{params_nums}"
+    return None
+
+
+def evaluation_context(
+    data_config: Dict[str, Any], model_config: Dict[str, Any], device: torch.device
+) -> str:
+    """Hash of the settings which change the result of an architecture.
+
+    Logging and search options of the data config are not included.
+    """
+    return context_hash(
+        {
+            "data": {
+                k: v
+                for k, v in data_config.items()
+                if not k.startswith(("LOG", "NAS_")) and k != "CACHE_DIR"
+            },
+            "input_channel": model_config["input_channel"],
+            "device": torch.cuda.get_device_name(device)
+            if device.type == "cuda"
+            else device.type,
+        }
     )
-    m7_args = []
-    m7_repeat = trial.suggest_int("m7/repeat", 1, 5)
-    m7_out_channel = trial.suggest_int(
-            "m7/out_channels", low=128, high=1024, step=128
-        )
-    m7_stride = trial.suggest_int("m7/stride", low=1, high=UPPER_STRIDE)
-    if m7 == "Conv":
-        # Conv args: [out_channel, kernel_size, stride, padding, groups, activation]
 
-        m7_kernel = trial.suggest_int("m7/kernel_size", low=1, high=5, step=2)
-        m7_activation = trial.suggest_categorical(
-            "m7/activation", ["ReLU", "Hardswish"]
-        )
-        m7_args = [m7_out_channel, m7_kernel, m7_stride, None, 1, m7_activation]
-    elif m7 == "DWConv":
-        # DWConv args: [out_channel, kernel_size, stride, padding_size, activation]
-        m7_kernel = trial.suggest_int("m7/kernel_size", low=1, high=5, step=2)
-        m7_activation = trial.suggest_categorical(
-            "m7/activation", ["ReLU", "Hardswish"]
-        )
-        m7_args = [m7_out_channel, m7_kernel, m7_stride, None, m7_activation]
-    elif m7 == "InvertedResidualv2":
-        m7_c = trial.suggest_int("m7/v2_c", low=16, high=160, step=16)
-        m7_t = trial.suggest_int("m7/v2_t", low=1, high=8)
-        m7_args = [m7_c, m7_t, m7_stride]
-    elif m7 == "InvertedResidualv3":
-        m7_kernel = trial.suggest_int("m7/kernel_size", low=3, high=5, step=2)
-        m7_t = round(trial.suggest_float("m7/v3_t", low=1.0, high=6.0, step=0.1), 1)
-        m7_c = trial.suggest_int("m7/v3_c", low=8, high=160, step=8)
-        m7_se = trial.suggest_categorical("m7/v3_se", [0, 1])
-        m7_hs = trial.suggest_categorical("m7/v3_hs", [0, 1])
-        m7_args = [m7_kernel, m7_t, m7_c, m7_se, m7_hs, m7_stride]
-    elif m7 == "MBConv":
-        # expand_ratio, out_channel, stride, kernel_size
-        m7_t = trial.suggest_categorical("m7/mb_t", [1, 6])
-        m7_s = trial.suggest_categorical("m7/mb_s", [1, 2])
-        m7_k = trial.suggest_categorical("m7/mb_k", [3, 5])
-        m7_args = [m7_t, m7_out_channel, m7_s, m7_k]  
-    if not m7 == "Pass":
-        if m7_stride == 2:
-            n_stride += 1
-            if n_stride >= MAX_NUM_STRIDE:
-                UPPER_STRIDE = 1
-        model.append([m7_repeat, m7, m7_args])
-
-    # last layer
-    last_dim = trial.suggest_int("last_dim", low=128, high=1024, step=128)
-    # We can setup fixed structure as well
-    model.append([1, "Conv", [last_dim, 1, 1]])
-    model.append([1, "GlobalAvgPool", []])
-    model.append([1, "FixedConv", [6, 1, 1, None, 1, None]])
-
-    module_info = {}
-    module_info["m1"] = {"type": m1, "repeat": m1_repeat, "stride": m1_stride}
-    module_info["m2"] = {"type": m2, "repeat": m2_repeat, "stride": m2_stride}
-    module_info["m3"] = {"type": m3, "repeat": m3_repeat, "stride": m3_stride}
-    module_info["m4"] = {"type": m4, "repeat": m4_repeat, "stride": m4_stride}
-    module_info["m5"] = {"type": m5, "repeat": m5_repeat, "stride": m5_stride}
-    module_info["m6"] = {"type": m6, "repeat": m6_repeat, "stride": m6_stride}
-    module_info["m7"] = {"type": m7, "repeat": m7_repeat, "stride": m7_stride}
-
-    return model, module_info
-
-
-def objective(trial: optuna.trial.Trial, device) -> Tuple[float, int, float]:
+
+def objective(
+    trial: optuna.trial.Trial, device, data_service: StudyDataService
+) -> Tuple[float, int, float]:
     """Optuna objective.
     Args:
         trial
+        data_service: dataloaders shared by every trial
     Returns:
         float: score1(e.g. accuracy)
         int: score2(e.g. params)
     """
     torch.cuda.empty_cache()
     
-    model_config = copy.deepcopy(MODEL_CONFIG)
     data_config = copy.deepcopy(DATA_CONFIG)
     
+    # model config
+    model_config = suggest_model_config(trial, MODEL_CONFIG, data_config["IMG_SIZE"])
+
+    # analytic constraint check before building the model
+    cost = ModelParser(model_config, build=False).estimate()
+    if LATENCY_TABLE is not None:
+        prediction = LATENCY_TABLE.predict(model_config)
+        est_time = prediction.latency_ms
+        # layers missing in the table are estimated with LatencyModel
+        trial.set_user_attr("latency_table_missing", prediction.n_missing)
+    else:
+        est_time = LatencyModel()(cost)
+    trial.set_user_attr("macs", cost.total_macs)
+    trial.set_user_attr("estimated_time", est_time)
+    if cost.params >= MAX_PARAMS:
+        print(f" trial: {trial.number}, (estimated) {reject_reason(0, cost.params)}")
+        raise optuna.TrialPruned()
+    if (
+        data_config.get("NAS_LATENCY_MARGIN")
+        and est_time >= MAX_MEAN_TIME * data_config["NAS_LATENCY_MARGIN"]
+    ):
+        print(f" trial: {trial.number}, (estimated) {reject_reason(est_time, 0)}")
+        raise optuna.TrialPruned()
+ 
+    model = Model(model_config, verbose=True)
+
+    # skip the architecture which has been evaluated before
+    arch_cache = None
+    if data_config.get("NAS_ARCH_CACHE"):
+        arch_cache = ArchitectureCache(data_config["NAS_ARCH_CACHE"])
+        arch_hash = architecture_hash(model.model)
+        context = evaluation_context(data_config, model_config, device)
+        trial.set_user_attr("arch_hash", arch_hash)
+        cached = arch_cache.get(arch_hash, context)
+        if cached is not None:
+            reason = reject_reason(cached["mean_time"], cached["params"])
+            if reason is not None:
+                print(f" trial: {trial.number}, (cached) {reason}")
+                raise optuna.TrialPruned()
+            if cached["status"] == ArchitectureCache.COMPLETE:
+                print(f" trial: {trial.number}, Architecture {arch_hash} is cached")
+                trial.set_user_attr("cached", True)
+                return cached["f1"], cached["params"], cached["mean_time"]
+
     # save dir
     log_dir = os.path.join("exp/NAS_EFF", datetime.now().strftime(f"Trial_{trial.number}_%Y-%m-%d_%H-%M-%S"))
     os.makedirs(log_dir, exist_ok=True)
 
     # wandb init
-    wandb.init(entity="cv4",
-                project='lightweight',
-                group="NAS_EFF",
-                name=f'Trial_{trial.number}',
-                config=model_config,
-                reinit=True
-                )
+    if data_config.get("LOGGER", "wandb") == "wandb":
+        wandb.init(entity="cv4",
+                    project='lightweight',
+                    group="NAS_EFF",
+                    name=f'Trial_{trial.number}',
+                    config=model_config,
+                    reinit=True
+                    )
+    logger = create_logger(data_config, log_dir)
 
-    # model config
-    model_config["depth_multiple"] = trial.suggest_categorical(
-        "depth_multiple", [0.25, 0.5, 0.75, 1.0]
-    )
-    model_config["width_multiple"] = trial.suggest_categorical(
-        "width_multiple", [0.25, 0.5, 0.75, 1.0]
-    )
-    model_config["INPUT_SIZE"] = [data_config["IMG_SIZE"], data_config["IMG_SIZE"]]
-    model_config["backbone"], module_info = search_model(trial)
- 
-    model = Model(model_config, verbose=True)
     model.to(device)
     model.model.to(device)
 
     model_info(model, verbose=True)
 
     # check current model runtime
-    mean_time = check_runtime(
+    runtime = benchmark_runtime(
         model.model,
         [model_config["input_channel"]] + model_config["INPUT_SIZE"],
         device,
+        repeat=RUNTIME_REPEAT,
+        warmup=RUNTIME_WARMUP,
     )
+    mean_time = runtime.mean_ms
+    trial.set_user_attr("runtime", runtime._asdict())
 
     # check current model params_nums
     params_nums = count_model_params(model)
 
     # skip unsuitable model 
-    if mean_time >= 6: 
-        print(f' trial: {trial.number}, This model takes too much time:{mean_time}')
-        raise optuna.structs.TrialPruned()
-
-    if params_nums >= 500000:
-        print(f' trial: {trial.number}, This model has too many param:{params_nums}')
-        raise optuna.structs.TrialPruned()
+    reason = reject_reason(mean_time, params_nums)
+    if reason is not None:
+        print(f" trial: {trial.number}, {reason}")
+        if arch_cache is not None:
+            arch_cache.put(
+                arch_hash,
+                context,
+                "rejected",
+                params=params_nums,
+                mean_time=mean_time,
+            )
+        logger.close()
+        raise optuna.TrialPruned()
         
-    train_loader, val_loader, test_loader = create_dataloader(data_config)
+    train_loader, val_loader, test_loader = data_service.loaders()
 
     criterion = nn.CrossEntropyLoss()
+
+    # reject unpromising architecture with zero-cost proxy before training
+    if data_config.get("NAS_PROXY"):
+        data, labels = next(iter(train_loader))
+        data = data.to(device)
+        if data_service.batch_transform is not None:
+            data = data_service.batch_transform(data)
+        proxy_score = compute_proxy(
+            data_config["NAS_PROXY"],
+            model.model,
+            data,
+            labels.to(device),
+            criterion,
+        )
+        try:
+            reject_by_proxy(
+                trial,
+                proxy_score,
+                quantile=data_config.get("NAS_PROXY_QUANTILE", 0.25),
+                n_warmup=data_config.get("NAS_PROXY_WARMUP", 10),
+            )
+        except optuna.TrialPruned as e:
+            print(f" trial: {trial.number}, {e}")
+            logger.close()
+            raise
+
     optimizer = torch.optim.AdamW(
         model.parameters(), lr=data_config["INIT_LR"]
     )
@@ -438,6 +236,15 @@ def objective(trial: optuna.trial.Trial, device) -> Tuple[float, int, float]:
         pct_start=0.05,
     )
 
+    # successive halving on the per-epoch validation f1
+    epoch_callback = None
+    if data_config.get("NAS_PRUNER") == "sha":
+        pruner = SuccessiveHalvingPruner(
+            min_resource=data_config.get("NAS_MIN_EPOCHS", 1),
+            reduction_factor=data_config.get("NAS_REDUCTION_FACTOR", 3),
+        )
+        epoch_callback = lambda epoch, f1, acc: pruner.report(trial, epoch, f1)
+
     trainer = TorchTrainer(
         model,
         criterion,
@@ -446,15 +253,116 @@ def objective(trial: optuna.trial.Trial, device) -> Tuple[float, int, float]:
         device=device,
         verbose=1,
         model_path=log_dir,
+        logger=logger,
+        batch_transform=data_service.batch_transform,
     )
-    trainer.train(train_loader, data_config["EPOCHS"], val_dataloader=val_loader)
+    try:
+        trainer.train(
+            train_loader,
+            data_config["EPOCHS"],
+            val_dataloader=val_loader,
+            epoch_callback=epoch_callback,
+        )
+    except optuna.TrialPruned as e:
+        print(f" trial: {trial.number}, {e}")
+        logger.close()
+        raise
     loss, test_f1, acc_percent = trainer.test(model, test_dataloader=val_loader)
     
-    wandb.log({'f1':test_f1,'params_nums':params_nums, 'mean_time':mean_time})
+    logger.log({'f1':test_f1,'params_nums':params_nums, 'mean_time':mean_time})
+    logger.close()
+
+    if arch_cache is not None:
+        arch_cache.put(
+            arch_hash,
+            context,
+            ArchitectureCache.COMPLETE,
+            f1=test_f1,
+            params=params_nums,
+            mean_time=mean_time,
+        )
     
     return test_f1, params_nums, mean_time
 
 
+def supernet_objective(
+    trial: optuna.trial.Trial,
+    device,
+    data_service: StudyDataService,
+    supernet: SuperNet,
+) -> Tuple[float, int, float]:
+    """Optuna objective evaluating the sub-architecture with the supernet weights.
+    Args:
+        trial
+        data_service: dataloaders shared by every trial
+        supernet: trained weight-sharing supernet
+    Returns:
+        float: score1(e.g. accuracy)
+        int: score2(e.g. params)
+    """
+    data_config = copy.deepcopy(DATA_CONFIG)
+    arch = supernet.suggest_arch(trial)
+    model_config = supernet.to_model_config(arch)
+    model_config["INPUT_SIZE"] = [data_config["IMG_SIZE"], data_config["IMG_SIZE"]]
+
+    cost = ModelParser(model_config, build=False).estimate()
+    trial.set_user_attr("macs", cost.total_macs)
+    if cost.params >= MAX_PARAMS:
+        print(f" trial: {trial.number}, (estimated) {reject_reason(0, cost.params)}")
+        raise optuna.TrialPruned()
+
+    model = supernet.export(arch).to(device)
+    runtime = benchmark_runtime(
+        model.model,
+        [model_config["input_channel"]] + model_config["INPUT_SIZE"],
+        device,
+        repeat=RUNTIME_REPEAT,
+        warmup=RUNTIME_WARMUP,
+    )
+    mean_time = runtime.mean_ms
+    trial.set_user_attr("runtime", runtime._asdict())
+    params_nums = count_model_params(model)
+    reason = reject_reason(mean_time, params_nums)
+    if reason is not None:
+        print(f" trial: {trial.number}, {reason}")
+        raise optuna.TrialPruned()
+
+    train_loader, val_loader, _ = data_service.loaders()
+    recalibrate_bn(
+        model,
+        train_loader,
+        n_batches=data_config.get("NAS_SUPERNET_BN_BATCHES", 20),
+        device=device,
+    )
+
+    log_dir = os.path.join("exp/NAS_EFF", datetime.now().strftime(f"Trial_{trial.number}_%Y-%m-%d_%H-%M-%S"))
+    os.makedirs(log_dir, exist_ok=True)
+    if data_config.get("LOGGER", "wandb") == "wandb":
+        wandb.init(entity="cv4",
+                    project='lightweight',
+                    group="NAS_EFF",
+                    name=f'Trial_{trial.number}',
+                    config=model_config,
+                    reinit=True
+                    )
+    logger = create_logger(data_config, log_dir)
+    trainer = TorchTrainer(
+        model,
+        nn.CrossEntropyLoss(),
+        None,
+        None,
+        device=device,
+        verbose=1,
+        model_path=log_dir,
+        logger=logger,
+    )
+    _, test_f1, _ = trainer.test(model, test_dataloader=val_loader)
+    logger.log({'f1':test_f1,'params_nums':params_nums, 'mean_time':mean_time})
+    logger.close()
+    trial.set_user_attr("model_config", model_config)
+    return test_f1, params_nums, mean_time
+
+
 def get_best_trial_with_condition(optuna_study: optuna.study.Study) -> Dict[str, Any]:
     """Get best trial that satisfies the minimum condition(e.g. accuracy > 0.8).
     Args:
@@ -490,25 +398,116 @@ def get_best_trial_with_condition(optuna_study: optuna.study.Study) -> Dict[str,
     return best_trial_
 
 
-def tune(gpu_id, seed, storage: str = None):
+def tune_worker(
+    worker_id: int,
+    gpu_id: int,
+    seed: int,
+    storage: Optional[str],
+    n_trials: int,
+    cpus: Optional[List[int]] = None,
+    supernet: Optional[str] = None,
+    supernet_config: str = "configs/nas/supernet.yaml",
+) -> optuna.study.Study:
+    """Run trials of the study in the current process.
+
+    Args:
+        worker_id: worker index. Used to offset the gpu id and the sampler seed.
+        gpu_id: first GPU id to use.
+        seed: sampler seed.
+        storage: RDB storage url. In-memory storage if None is given.
+        n_trials: number of trials to run in this worker.
+        cpus: CPU cores to pin this worker to. Not pinned if None is given.
+        supernet: trained supernet weights. Trials are evaluated with the
+            inherited weights instead of training in the study
+            "NAS_supernet" if given.
+        supernet_config: search space config of the supernet.
+
+    Returns:
+        study
+    """
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+        torch.set_num_threads(len(cpus))
     if not torch.cuda.is_available():
         device = torch.device("cpu")
-    elif 0 <= gpu_id < torch.cuda.device_count():
-        device = torch.device(f"cuda:{gpu_id}")
-    sampler = optuna.samplers.MOTPESampler(seed=seed)
-    if storage is not None:
-        rdb_storage = optuna.storages.RDBStorage(url=storage)
     else:
-        rdb_storage = None
-
-    study = optuna.create_study(
-        directions=["maximize", "minimize", "minimize"],
-        study_name="NAS",
-        sampler=sampler,
-        storage=rdb_storage, 
-        load_if_exists=True,
+        device = torch.device(f"cuda:{(gpu_id + worker_id) % torch.cuda.device_count()}")
+
+    study = create_study(seed + worker_id, storage, study_name(supernet is not None))
+    data_service = StudyDataService(DATA_CONFIG)
+    if supernet is not None:
+        weight_sharing = SuperNet(supernet_config)
+        weight_sharing.load_state_dict(torch.load(supernet, map_location="cpu"))
+        weight_sharing.to(device).eval()
+        study.optimize(
+            lambda trial: supernet_objective(trial, device, data_service, weight_sharing),
+            n_trials=n_trials,
+        )
+        return study
+    study.optimize(
+        lambda trial: objective(trial, device, data_service), n_trials=n_trials
     )
-    study.optimize(lambda trial: objective(trial, device), n_trials=100)
+    return study
+
+
+def tune(
+    gpu_id: int,
+    seed: int,
+    storage: str = None,
+    n_workers: int = 1,
+    n_trials: int = 100,
+    supernet: Optional[str] = None,
+    supernet_config: str = "configs/nas/supernet.yaml",
+) -> None:
+    """Run the NAS study.
+
+    Args:
+        gpu_id: first GPU id to use. Workers use the GPUs round-robin from {gpu_id}.
+        seed: sampler seed.
+        storage: RDB storage url. Required if {n_workers} > 1.
+        n_workers: number of trial worker processes. Each worker is pinned to
+            a disjoint set of CPU cores.
+        n_trials: total number of trials.
+        supernet: trained supernet weights(train_supernet.py). Trials are
+            evaluated with the inherited weights instead of training if given,
+            in the separate study "NAS_supernet" of the same storage.
+        supernet_config: search space config of the supernet.
+    """
+    name = study_name(supernet is not None)
+    if n_workers == 1:
+        study = tune_worker(
+            0, gpu_id, seed, storage, n_trials, None, supernet, supernet_config
+        )
+    else:
+        if storage is None:
+            raise ValueError("Parallel workers need a shared storage.")
+        # create tables before the workers race to do it
+        create_study(seed, storage, name)
+        # decode the images once here instead of in every worker
+        StudyDataService.build_cache(DATA_CONFIG)
+        cpus = partition_cpus(os.sched_getaffinity(0), n_workers)
+        trials = split_trials(n_trials, n_workers)
+        ctx = mp.get_context("spawn")
+        workers = []
+        for i in range(n_workers):
+            worker = ctx.Process(
+                target=tune_worker,
+                args=(
+                    i,
+                    gpu_id,
+                    seed,
+                    storage,
+                    trials[i],
+                    cpus[i],
+                    supernet,
+                    supernet_config,
+                ),
+            )
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+        study = create_study(seed, storage, name)
 
     pruned_trials = [
         t for t in study.trials if t.state == optuna.trial.TrialState.PRUNED
@@ -540,5 +539,17 @@ if __name__ == "__main__":
     parser.add_argument("--gpu", default=0, type=int, help="GPU id to use")
     parser.add_argument("--storage", default="sqlite:///automl.db", type=str, help="Optuna database storage path.")
     parser.add_argument("--seed", default=42, type=int, help="Sampler seed")
+    parser.add_argument("--n_workers", default=1, type=int, help="Number of parallel trial workers")
+    parser.add_argument("--n_trials", default=100, type=int, help="Total number of trials")
+    parser.add_argument("--supernet", default=None, type=str, help="Trained supernet weights. Evaluate trials with the inherited weights")
+    parser.add_argument("--supernet_config", default="configs/nas/supernet.yaml", type=str, help="Supernet search space config")
     args = parser.parse_args()
-    tune(args.gpu, args.seed, storage=args.storage if args.storage != "" else None)
+    tune(
+        args.gpu,
+        args.seed,
+        storage=args.storage if args.storage != "" else None,
+        n_workers=args.n_workers,
+        n_trials=args.n_trials,
+        supernet=args.supernet,
+        supernet_config=args.supernet_config,
+    )
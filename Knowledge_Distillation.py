@@ -14,7 +14,13 @@ import torch.optim as optim
 import yaml
 import wandb
 
-from src.dataloader import create_dataloader
+from src.dataloader import (
+    create_dataloader,
+    get_batch_transform,
+    get_seeded_dataloader,
+)
+from src.distillation import precompute_teacher_logits
+from src.logger import create_logger
 from src.loss import CustomCriterion, CustomCriterion_KD
 from src.model import Model
 from src.trainer import TorchTrainer
@@ -69,6 +75,7 @@ def train(
     scaler = (
         torch.cuda.amp.GradScaler() if fp16 and device != torch.device("cpu") else None
     )
+    logger = create_logger(data_config, log_dir)
 
     # Create trainer
     trainer = TorchTrainer(
@@ -80,6 +87,8 @@ def train(
         device=device,
         model_path=model_path,
         verbose=1,
+        log_interval=data_config.get("LOG_INTERVAL", 1),
+        logger=logger,
     )
     best_acc, best_f1 = trainer.train(
         train_dataloader=train_dl,
@@ -92,6 +101,7 @@ def train(
     test_loss, test_f1, test_acc = trainer.test(
         model=model_instance.model, test_dataloader=val_dl if val_dl else test_dl
     )
+    logger.close()
     return test_loss, test_f1, test_acc
 
 
@@ -146,6 +156,37 @@ def train_kd(
 
     # Create dataloader
     train_dl, val_dl, test_dl = create_dataloader(data_config)
+    batch_transform = get_batch_transform(data_config)
+
+    # Precompute teacher logits of the reproducible augmented views
+    teacher_logits = None
+    if data_config.get("KD_TEACHER_LOGITS"):
+        if batch_transform is not None:
+            raise ValueError(
+                "KD_TEACHER_LOGITS requires the augmentation on the dataset. "
+                f"{data_config['AUG_TRAIN']} augments the batch in the trainer."
+            )
+        n_views = data_config.get("KD_TEACHER_VIEWS", data_config["EPOCHS"])
+        seed = data_config.get("KD_SEED", 0)
+        teacher_logits = precompute_teacher_logits(
+            teacher_model,
+            train_dl.dataset,
+            data_config["KD_TEACHER_LOGITS"],
+            n_views=n_views,
+            seed=seed,
+            batch_size=data_config["BATCH_SIZE"],
+            num_workers=train_dl.num_workers,
+            device=device,
+        )
+        train_dl = get_seeded_dataloader(
+            train_dl.dataset,
+            data_config["BATCH_SIZE"],
+            n_views=n_views,
+            seed=seed,
+            num_workers=train_dl.num_workers,
+        )
+        # the teacher is not used in the training loop
+        teacher_model.cpu()
 
     # Create optimizer, scheduler, criterion
     optimizer = torch.optim.SGD(
@@ -168,6 +209,7 @@ def train_kd(
     scaler = (
         torch.cuda.amp.GradScaler() if fp16 and device != torch.device("cpu") else None
     )
+    logger = create_logger(data_config, log_dir)
 
     # Create trainer
     trainer = TorchTrainer(
@@ -180,18 +222,23 @@ def train_kd(
         device=device,
         model_path=model_path,
         verbose=1,
+        log_interval=data_config.get("LOG_INTERVAL", 1),
+        logger=logger,
+        batch_transform=batch_transform,
     )
     
     best_acc, best_f1 = trainer.train_kd(
         train_dataloader=train_dl,
         n_epoch=data_config["EPOCHS"],
         val_dataloader=val_dl if val_dl else test_dl,
+        teacher_logits=teacher_logits,
     )
 
     student_model.load_state_dict(torch.load(model_path))
     test_loss, test_f1, test_acc = trainer.test(
         model=student_model, test_dataloader=val_dl if val_dl else test_dl
     )
+    logger.close()
     return test_loss, test_f1, test_acc
 
 if __name__ == "__main__":
@@ -261,11 +308,12 @@ if __name__ == "__main__":
     os.makedirs(log_dir, exist_ok=True)
 
     # for wandb
-    wandb.init(project='lightweight', entity='cv4', name = args.run_name, save_code = True)
-    wandb.run.name = args.run_name
-    wandb.run.save()
-    wandb.config.update(model_config)
-    wandb.config.update(data_config)
+    if data_config.get("LOGGER", "wandb") == "wandb":
+        wandb.init(project='lightweight', entity='cv4', name = args.run_name, save_code = True)
+        wandb.run.name = args.run_name
+        wandb.run.save()
+        wandb.config.update(model_config)
+        wandb.config.update(data_config)
 
     # Distill mode check
     if args.distill_mode == True:
@@ -0,0 +1,101 @@
+"""Deployment export.
+
+Export the trained model of an experiment directory as a frozen TorchScript
+module or an ONNX model which inference.py can load.
+
+    python export.py --model_dir exp/latest --weight_name best.pt
+    python inference.py --model_dir exp/latest --weight_name best_opt.ts
+
+    python export.py --model_dir exp/latest --format onnx
+    python inference.py --model_dir exp/latest --weight_name best.onnx
+"""
+
+import argparse
+import os
+
+import torch
+
+from src.model import Model
+from src.utils.common import read_yaml
+from src.utils.torch_utils import (
+    OnnxRuntimeModel,
+    benchmark_runtime,
+    export_onnx,
+    export_torchscript,
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deployment export.")
+    parser.add_argument(
+        "--model_dir",
+        default="exp/latest",
+        type=str,
+        help="experiment directory which includes the weight, model.yml and data.yml",
+    )
+    parser.add_argument(
+        "--weight_name", default="best.pt", type=str, help="state_dict file"
+    )
+    parser.add_argument(
+        "--format",
+        default="torchscript",
+        choices=["torchscript", "onnx"],
+        help="torchscript runs with PyTorch, onnx with ONNX Runtime on CPU",
+    )
+    parser.add_argument(
+        "--method",
+        default="script",
+        choices=["script", "trace"],
+        help="TorchScript conversion. trace is used if the scripting fails",
+    )
+    parser.add_argument(
+        "--device",
+        default="cpu",
+        type=str,
+        help="device to run the TorchScript module on",
+    )
+    parser.add_argument(
+        "--no_optimize",
+        action="store_true",
+        help="skip torch.jit.optimize_for_inference",
+    )
+    parser.add_argument(
+        "--opset", default=11, type=int, help="ONNX opset version"
+    )
+    parser.add_argument(
+        "--out",
+        default=None,
+        type=str,
+        help="output file in --model_dir. best_opt.ts or best.onnx if None",
+    )
+    args = parser.parse_args()
+
+    model_config = read_yaml(os.path.join(args.model_dir, "model.yml"))
+    data_config = read_yaml(os.path.join(args.model_dir, "data.yml"))
+    model_instance = Model(model_config)
+    model_instance.model.load_state_dict(
+        torch.load(os.path.join(args.model_dir, args.weight_name), map_location="cpu")
+    )
+    model = model_instance.model.eval()
+
+    img_size = [3, data_config["IMG_SIZE"], data_config["IMG_SIZE"]]
+    if args.format == "onnx":
+        out_path = os.path.join(args.model_dir, args.out or "best.onnx")
+        export_onnx(model, out_path, img_size, opset_version=args.opset)
+        device, exported = "cpu", OnnxRuntimeModel(out_path)
+    else:
+        out_path = os.path.join(args.model_dir, args.out or "best_opt.ts")
+        device = args.device
+        exported = export_torchscript(
+            model,
+            out_path,
+            img_size,
+            method=args.method,
+            device=args.device,
+            optimize=not args.no_optimize,
+        )
+
+    model.to(device)
+    for name, runtime_model in (("eager", model), (args.format, exported)):
+        runtime = benchmark_runtime(runtime_model, img_size, device, repeat=100)
+        print(f"{name:>11}: {runtime.mean_ms:.2f}ms on {device}")
+    print(f"Exported model saved at {out_path}")
@@ -4,7 +4,6 @@
 - Contact: placidus36@gmail.com, lim.jeikei@gmail.com
 """
 import argparse
-import json
 import os
 import time
 from datetime import datetime
@@ -12,17 +11,16 @@ from datetime import datetime
 import torch
 from torch.utils.data import DataLoader
 from torchvision.datasets import ImageFolder
-from torchvision.transforms import Resize
-from tqdm import tqdm
 
 from src.augmentation.policies import simple_augment_test
 from src.model import Model
+from src.quantization import INT8_BACKEND_FILE
 from src.utils.common import read_yaml
-
-if torch.__version__ >= "1.8.1":
-    from torch import profiler
-else:
-    from torch.autograd import profiler
+from src.utils.inference import inference
+from src.utils.torch_utils import (
+    EXPORT_DEVICE_FILE,
+    OnnxRuntimeModel,
+)
 
 CLASSES = [
     "Metal",
@@ -44,9 +42,17 @@ class CustomImageFolder(ImageFolder):
         return img_gt + (fname,)
 
 
-def get_dataloader(img_root: str, data_config: str) -> DataLoader:
+def get_dataloader(
+    img_root: str, data_config: str, batch_size: int = 1, num_workers: int = 8
+) -> DataLoader:
     """Get dataloader.
 
+    Args:
+        img_root: image folder root.
+        data_config: data config path.
+        batch_size: number of images per batch.
+        num_workers: number of dataloader workers.
+
     Note:
         Don't forget to set normalization.
     """
@@ -54,7 +60,7 @@ def get_dataloader(img_root: str, data_config: str) -> DataLoader:
     data_config = read_yaml(data_config)
 
     transform_test_args = (
-        data_confg["AUG_TEST_PARAMS"] if data_config.get("AUG_TEST_PARAMS") else None
+        data_config["AUG_TEST_PARAMS"] if data_config.get("AUG_TEST_PARAMS") else None
     )
     # Transformation for test
     transform_test = getattr(
@@ -63,84 +69,15 @@ def get_dataloader(img_root: str, data_config: str) -> DataLoader:
     )(dataset=data_config["DATASET"], img_size=data_config["IMG_SIZE"])
 
     dataset = CustomImageFolder(root=img_root, transform=transform_test)
-    dataloader = DataLoader(dataset=dataset, batch_size=1, num_workers=8)
+    dataloader = DataLoader(
+        dataset=dataset,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+    )
     return dataloader
 
 
-@torch.no_grad()
-def inference(model, dataloader, dst_path: str, t0: float) -> None:
-    """Run inference with given model and dataloader.
-
-    Args:
-        model: PyTorch model.
-        dataloader: PyTorch dataset loader.
-        dst_path: destination path for inference result to be written.
-        t0: initial time prior to creating model and dataset
-            by time.monotonic().
-    """
-    model = model.to(device)
-    model.eval()
-
-    profile_ = torch.rand(1, 3, 512, 512).to(device)
-    for transform in dataloader.dataset.transform.transforms:
-        if isinstance(transform, Resize):
-            profile_input = torch.rand(1, 3, *transform.size).to(device)
-            break
-
-    n_profile = 100
-    print(f"Profile input shape: {profile_input.shape}")
-    with profiler.profile(use_cuda=True, profile_memory=False) as prof:
-        for _ in tqdm(range(100), "Running profile ..."):
-            x = model(profile_input)
-    avg_time = prof.total_average()
-
-    if hasattr(avg_time, "self_cuda_time_total"):
-        cuda_time = avg_time.self_cuda_time_total / 1e6 / n_profile
-    else:
-        cuda_time = avg_time.cuda_time_total / 1e6 / n_profile
-
-    cpu_time = avg_time.self_cpu_time_total / 1e6 / n_profile
-    print(prof.key_averages())
-    print(f"Average CUDA time: {cuda_time}, CPU time: {cpu_time}")
-
-    result = {
-        "inference": {},
-        "time": {
-            "profile": {"cuda": float("inf"), "cpu": float("inf")},
-            "runtime": {"all": 0, "inference_only": 0},
-            "inference": {},
-        },
-        "macs": float("inf"),
-    }
-    time_measure_inference = 0
-    for img, _, fname in tqdm(dataloader, "Running inference ..."):
-        t_start = torch.cuda.Event(enable_timing=True)
-        t_end = torch.cuda.Event(enable_timing=True)
-
-        t_start.record()
-        img = img.to(device)
-        pred = model(img)
-        pred = torch.argmax(pred)
-
-        t_end.record()
-        torch.cuda.synchronize()
-        t_inference = t_start.elapsed_time(t_end) / 1000
-        time_measure_inference += t_inference
-
-        result["inference"][fname[0]] = CLASSES[int(pred.detach())]
-        result["time"]["inference"][fname[0]] = t_inference
-
-    result["time"]["profile"]["cuda"] = cuda_time
-    result["time"]["profile"]["cpu"] = cpu_time
-    result["time"]["runtime"]["all"] = time.monotonic() - t0
-    result["time"]["runtime"]["inference_only"] = time_measure_inference
-
-    j = json.dumps(result, indent=4)
-    save_path = os.path.join(dst_path, "output.csv")
-    with open(save_path, "w") as outfile:
-        json.dump(result, outfile)
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Submit.")
     parser.add_argument(
@@ -148,13 +85,33 @@ if __name__ == "__main__":
         default=os.environ.get('SM_OUTPUT_DATA_DIR')
     )
     parser.add_argument("--model_dir", type=str, help="Saved model root directory which includes 'best.pt', 'data.yml', and, 'model.yml'", default='/opt/ml/code/exp/latest')
-    parser.add_argument("--weight_name", type=str, help="Model weight file name. (best.pt, best.ts, ...)", default="best.pt")
+    parser.add_argument("--weight_name", type=str, help="Model weight file name. (best.pt, best.ts, best.onnx, ...)", default="best.pt")
     parser.add_argument(
         "--img_root",
         type=str,
         help="image folder root. e.g) 'data/test'",
         default='/opt/ml/data/test'
     )
+    parser.add_argument("--batch_size", type=int, help="Number of images per batch", default=1)
+    parser.add_argument("--num_workers", type=int, help="Number of dataloader workers", default=8)
+    parser.add_argument(
+        "--profile_every",
+        type=int,
+        help="Record per-image time of every N-th batch. 0 disables per-image timing",
+        default=1,
+    )
+    parser.add_argument(
+        "--intra_op_threads",
+        type=int,
+        help="ONNX Runtime threads of an operator. 0 uses the default",
+        default=0,
+    )
+    parser.add_argument(
+        "--inter_op_threads",
+        type=int,
+        help="ONNX Runtime threads running independent operators. 0 or 1 is sequential",
+        default=0,
+    )
     args = parser.parse_args()
     assert args.model_dir != '' and args.img_root != '', "'--model_dir' and '--img_root' must be provided."
 
@@ -166,11 +123,32 @@ if __name__ == "__main__":
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
     # prepare datalaoder
-    dataloader = get_dataloader(img_root=args.img_root, data_config=args.data_config)
+    dataloader = get_dataloader(
+        img_root=args.img_root,
+        data_config=args.data_config,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+    )
 
     # prepare model
     if args.weight.endswith("ts"):
-        model = torch.jit.load(args.weight)
+        # int8 models of quantize.py run on CPU with the engine they were built for
+        extra_files = {INT8_BACKEND_FILE: "", EXPORT_DEVICE_FILE: ""}
+        model = torch.jit.load(args.weight, map_location="cpu", _extra_files=extra_files)
+        if extra_files[INT8_BACKEND_FILE]:
+            torch.backends.quantized.engine = extra_files[INT8_BACKEND_FILE].decode()
+            device = torch.device("cpu")
+        elif extra_files[EXPORT_DEVICE_FILE]:
+            # frozen models of export.py keep their constants on the export device
+            device = torch.device(extra_files[EXPORT_DEVICE_FILE].decode())
+            model = torch.jit.load(args.weight, map_location=device)
+    elif args.weight.endswith("onnx"):
+        model = OnnxRuntimeModel(
+            args.weight,
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads,
+        )
+        device = torch.device("cpu")
     else:
         model_instance = Model(args.model_config, verbose=True)
         model_instance.model.load_state_dict(
@@ -179,5 +157,13 @@ if __name__ == "__main__":
         model = model_instance.model
 
     # inference
-    inference(model, dataloader, args.dst, t0)
+    inference(
+        model,
+        dataloader,
+        args.dst,
+        t0,
+        device,
+        CLASSES,
+        profile_every=args.profile_every,
+    )
 
@@ -4,7 +4,6 @@
 - Contact: placidus36@gmail.com, lim.jeikei@gmail.com
 """
 import argparse
-import json
 import os
 import time
 from datetime import datetime
@@ -12,20 +11,14 @@ from datetime import datetime
 import torch
 from torch.utils.data import DataLoader
 from torchvision.datasets import ImageFolder
-from torchvision.transforms import Resize
-from tqdm import tqdm
 
 from src.augmentation.policies import simple_augment_test
 from src.utils.common import read_yaml
+from src.utils.inference import inference
 
 from swin.models import build_model
 from swin.config import get_config
 
-if torch.__version__ >= "1.8.1":
-    from torch import profiler
-else:
-    from torch.autograd import profiler
-
 CLASSES = [
     "Metal",
     "Paper",
@@ -46,9 +39,17 @@ class CustomImageFolder(ImageFolder):
         return img_gt + (fname,)
 
 
-def get_dataloader(img_root: str, data_config: str) -> DataLoader:
+def get_dataloader(
+    img_root: str, data_config: str, batch_size: int = 1, num_workers: int = 8
+) -> DataLoader:
     """Get dataloader.
 
+    Args:
+        img_root: image folder root.
+        data_config: data config path.
+        batch_size: number of images per batch.
+        num_workers: number of dataloader workers.
+
     Note:
         Don't forget to set normalization.
     """
@@ -56,7 +57,7 @@ def get_dataloader(img_root: str, data_config: str) -> DataLoader:
     data_config = read_yaml(data_config)
 
     transform_test_args = (
-        data_confg["AUG_TEST_PARAMS"] if data_config.get("AUG_TEST_PARAMS") else None
+        data_config["AUG_TEST_PARAMS"] if data_config.get("AUG_TEST_PARAMS") else None
     )
     # Transformation for test
     transform_test = getattr(
@@ -65,84 +66,15 @@ def get_dataloader(img_root: str, data_config: str) -> DataLoader:
     )(dataset=data_config["DATASET"], img_size=data_config["IMG_SIZE"])
 
     dataset = CustomImageFolder(root=img_root, transform=transform_test)
-    dataloader = DataLoader(dataset=dataset, batch_size=1, num_workers=8)
+    dataloader = DataLoader(
+        dataset=dataset,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+    )
     return dataloader
 
 
-@torch.no_grad()
-def inference(model, dataloader, dst_path: str, t0: float) -> None:
-    """Run inference with given model and dataloader.
-
-    Args:
-        model: PyTorch model.
-        dataloader: PyTorch dataset loader.
-        dst_path: destination path for inference result to be written.
-        t0: initial time prior to creating model and dataset
-            by time.monotonic().
-    """
-    model = model.to(device)
-    model.eval()
-
-    profile_ = torch.rand(1, 3, 512, 512).to(device)
-    for transform in dataloader.dataset.transform.transforms:
-        if isinstance(transform, Resize):
-            profile_input = torch.rand(1, 3, *transform.size).to(device)
-            break
-
-    n_profile = 100
-    print(f"Profile input shape: {profile_input.shape}")
-    with profiler.profile(use_cuda=True, profile_memory=False) as prof:
-        for _ in tqdm(range(100), "Running profile ..."):
-            x = model(profile_input)
-    avg_time = prof.total_average()
-
-    if hasattr(avg_time, "self_cuda_time_total"):
-        cuda_time = avg_time.self_cuda_time_total / 1e6 / n_profile
-    else:
-        cuda_time = avg_time.cuda_time_total / 1e6 / n_profile
-
-    cpu_time = avg_time.self_cpu_time_total / 1e6 / n_profile
-    print(prof.key_averages())
-    print(f"Average CUDA time: {cuda_time}, CPU time: {cpu_time}")
-
-    result = {
-        "inference": {},
-        "time": {
-            "profile": {"cuda": float("inf"), "cpu": float("inf")},
-            "runtime": {"all": 0, "inference_only": 0},
-            "inference": {},
-        },
-        "macs": float("inf"),
-    }
-    time_measure_inference = 0
-    for img, _, fname in tqdm(dataloader, "Running inference ..."):
-        t_start = torch.cuda.Event(enable_timing=True)
-        t_end = torch.cuda.Event(enable_timing=True)
-
-        t_start.record()
-        img = img.to(device)
-        pred = model(img)
-        pred = torch.argmax(pred)
-
-        t_end.record()
-        torch.cuda.synchronize()
-        t_inference = t_start.elapsed_time(t_end) / 1000
-        time_measure_inference += t_inference
-
-        result["inference"][fname[0]] = CLASSES[int(pred.detach())]
-        result["time"]["inference"][fname[0]] = t_inference
-
-    result["time"]["profile"]["cuda"] = cuda_time
-    result["time"]["profile"]["cpu"] = cpu_time
-    result["time"]["runtime"]["all"] = time.monotonic() - t0
-    result["time"]["runtime"]["inference_only"] = time_measure_inference
-
-    j = json.dumps(result, indent=4)
-    save_path = os.path.join(dst_path, "output.csv")
-    with open(save_path, "w") as outfile:
-        json.dump(result, outfile)
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Submit.")
     parser.add_argument(
@@ -157,6 +89,14 @@ if __name__ == "__main__":
         help="image folder root. e.g) 'data/test'",
         default='/opt/ml/data/test'
     )
+    parser.add_argument("--batch_size", type=int, help="Number of images per batch", default=1)
+    parser.add_argument("--num_workers", type=int, help="Number of dataloader workers", default=8)
+    parser.add_argument(
+        "--profile_every",
+        type=int,
+        help="Record per-image time of every N-th batch. 0 disables per-image timing",
+        default=1,
+    )
     args = parser.parse_args()
     assert args.model_dir != '' and args.img_root != '', "'--model_dir' and '--img_root' must be provided."
 
@@ -168,7 +108,12 @@ if __name__ == "__main__":
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
     # prepare datalaoder
-    dataloader = get_dataloader(img_root=args.img_root, data_config=args.data_config)
+    dataloader = get_dataloader(
+        img_root=args.img_root,
+        data_config=args.data_config,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+    )
 
     # prepare model
     if args.weight.endswith("ts"):
@@ -183,5 +128,13 @@ if __name__ == "__main__":
         model = model
 
     # inference
-    inference(model, dataloader, args.dst, t0)
+    inference(
+        model,
+        dataloader,
+        args.dst,
+        t0,
+        device,
+        CLASSES,
+        profile_every=args.profile_every,
+    )
 
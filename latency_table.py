@@ -0,0 +1,101 @@
+"""Latency lookup table
+
+Build the per-layer latency table of the NAS search space and predict the
+latency of a model config from the table.
+
+Build from the layers of random AutoML_NAS trials at IMG_SIZE of --data:
+    python latency_table.py --n_samples 2000 --table latency_table.json
+Build from a layer grid:
+    python latency_table.py --grid grid.yaml --table latency_table.json
+Predict:
+    python latency_table.py --table latency_table.json --model configs/model/model_79.yaml --img_size 112
+"""
+
+import argparse
+
+import torch
+
+from src.nas import LatencyTable, sample_model_configs
+from src.utils.common import read_yaml
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency lookup table.")
+    parser.add_argument(
+        "--table", default="latency_table.json", type=str, help="latency table path"
+    )
+    parser.add_argument(
+        "--n_samples",
+        default=0,
+        type=int,
+        help="number of random search space trials whose layers are measured",
+    )
+    parser.add_argument(
+        "--data",
+        default="configs/data/taco_tune.yaml",
+        type=str,
+        help="NAS data config. IMG_SIZE is the input size of the sampled trials",
+    )
+    parser.add_argument("--seed", default=0, type=int, help="sampler seed")
+    parser.add_argument(
+        "--grid", default=None, type=str, help="layer grid config to build the table"
+    )
+    parser.add_argument(
+        "--model", default=None, type=str, help="model config to predict the latency"
+    )
+    parser.add_argument("--img_size", default=112, type=int, help="input image size")
+    parser.add_argument("--device", default="cpu", type=str, help="device to measure")
+    parser.add_argument(
+        "--num_threads", default=None, type=int, help="number of CPU threads"
+    )
+    parser.add_argument(
+        "--repeat", default=50, type=int, help="number of measurements of each layer"
+    )
+    parser.add_argument(
+        "--measure_missing",
+        action="store_true",
+        help="measure the layers missing in the table and save them",
+    )
+    args = parser.parse_args()
+
+    table = LatencyTable(args.table)
+    device = torch.device(args.device)
+    if args.n_samples:
+        configs = sample_model_configs(
+            args.n_samples,
+            {"input_channel": 3},
+            read_yaml(cfg=args.data)["IMG_SIZE"],
+            seed=args.seed,
+        )
+        table.build_from_configs(
+            configs,
+            device=device,
+            num_threads=args.num_threads,
+            n_repeat=args.repeat,
+        )
+        print(f"{len(table)} layers in {args.table}")
+    if args.grid:
+        table.build(
+            read_yaml(cfg=args.grid),
+            device=device,
+            num_threads=args.num_threads,
+            n_repeat=args.repeat,
+        )
+        print(f"{len(table)} layers in {args.table}")
+
+    if args.model:
+        prediction = table.predict(
+            args.model,
+            input_size=[args.img_size, args.img_size],
+            measure_missing=args.measure_missing,
+            device=device,
+            num_threads=args.num_threads,
+        )
+        for name, latency, source in prediction.layers:
+            print(f"{name:>20} | {latency:8.3f} ms | {source}")
+        print(
+            f"Predicted latency: {prediction.latency_ms:.3f} ms "
+            f"({prediction.n_missing} layers estimated without the table)"
+        )
+        if args.measure_missing:
+            table.save()
@@ -0,0 +1,40 @@
+"""Pack the TACO image folders into shard files.
+
+Each of the train, val and test splits of --data is packed into
+{out}/{split}. Use the output with DATASET: "TACO_SHARD" and
+DATA_PATH: {out} in the data config.
+
+    python pack_shards.py --data /opt/ml/data --out /opt/ml/data_shard
+"""
+
+import argparse
+import os
+
+from src.shard import pack_image_folder
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack image folders into shards.")
+    parser.add_argument(
+        "--data", default="/opt/ml/data", type=str, help="image folder root"
+    )
+    parser.add_argument(
+        "--out", default="/opt/ml/data_shard", type=str, help="output directory"
+    )
+    parser.add_argument(
+        "--shard_size", default=256, type=int, help="shard size in MiB"
+    )
+    parser.add_argument("--seed", default=0, type=int, help="seed of the sample order")
+    args = parser.parse_args()
+
+    for split in ("train", "val", "test"):
+        root = os.path.join(args.data, split)
+        if not os.path.isdir(root):
+            print(f"Skip {split}: {root} does not exist")
+            continue
+        n_shards = pack_image_folder(
+            root,
+            os.path.join(args.out, split),
+            shard_size=args.shard_size * 2 ** 20,
+            seed=args.seed,
+        )
+        print(f"{split}: {n_shards} shards")
@@ -0,0 +1,101 @@
+"""Structured channel pruning.
+
+Prune the trained model of an experiment directory, save the pruned model
+config and weights and fine-tune them.
+
+    python prune.py --model_dir exp/latest --ratio 0.3 --epochs 30
+    python inference.py --model_dir exp/pruned --weight_name best.pt
+"""
+
+import argparse
+import os
+
+import torch
+import wandb
+import yaml
+
+from src.model import Model
+from src.pruning import CRITERIA, prune_channels
+from src.utils.common import read_yaml
+from src.utils.torch_utils import benchmark_runtime
+from train import train
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Structured channel pruning.")
+    parser.add_argument(
+        "--model_dir",
+        default="exp/latest",
+        type=str,
+        help="experiment directory which includes the weight, model.yml and data.yml",
+    )
+    parser.add_argument(
+        "--weight_name", default="best.pt", type=str, help="state_dict file"
+    )
+    parser.add_argument(
+        "--ratio",
+        default=0.3,
+        type=float,
+        help="fraction of the channels to be removed from each layer",
+    )
+    parser.add_argument(
+        "--criterion", default="l1", choices=CRITERIA, help="channel importance"
+    )
+    parser.add_argument(
+        "--out", default="exp/pruned", type=str, help="output experiment directory"
+    )
+    parser.add_argument(
+        "--epochs",
+        default=0,
+        type=int,
+        help="fine-tuning epochs of the pruned model. 0 skips the fine-tuning",
+    )
+    parser.add_argument(
+        "--lr", default=None, type=float, help="fine-tuning INIT_LR. data.yml if None"
+    )
+    parser.add_argument(
+        "--run_name", default="prune", type=str, help="run name for wandb"
+    )
+    args = parser.parse_args()
+
+    model_config = read_yaml(os.path.join(args.model_dir, "model.yml"))
+    data_config = read_yaml(os.path.join(args.model_dir, "data.yml"))
+    model_instance = Model(model_config)
+    model_instance.model.load_state_dict(
+        torch.load(os.path.join(args.model_dir, args.weight_name), map_location="cpu")
+    )
+
+    pruned_config, pruned = prune_channels(
+        model_config, model_instance, args.ratio, criterion=args.criterion
+    )
+    img_size = [3, data_config["IMG_SIZE"], data_config["IMG_SIZE"]]
+    for name, model in (("model", model_instance), ("pruned", pruned)):
+        n_params = sum(p.numel() for p in model.parameters())
+        with torch.no_grad():
+            runtime = benchmark_runtime(model.eval(), img_size, repeat=50)
+        print(f"{name:>6}: {n_params:,d} parameters, {runtime.mean_ms:.2f}ms on CPU")
+
+    os.makedirs(args.out, exist_ok=True)
+    weight = os.path.join(args.out, "pruned.pt")
+    torch.save(pruned.model.state_dict(), weight)
+    if args.epochs > 0:
+        data_config["EPOCHS"] = args.epochs
+        data_config["INIT_LR"] = args.lr or data_config["INIT_LR"]
+    with open(os.path.join(args.out, "model.yml"), "w") as f:
+        yaml.dump(pruned_config, f, default_flow_style=False)
+    with open(os.path.join(args.out, "data.yml"), "w") as f:
+        yaml.dump(data_config, f, default_flow_style=False)
+    print(f"Pruned model saved at {args.out}")
+
+    if args.epochs > 0:
+        if data_config.get("LOGGER", "wandb") == "wandb":
+            wandb.init(project="lightweight", entity="cv4", name=args.run_name)
+            wandb.config.update(pruned_config)
+            wandb.config.update(data_config)
+        train(
+            model_config=pruned_config,
+            data_config=data_config,
+            log_dir=args.out,
+            fp16=data_config["FP16"],
+            device=torch.device("cuda:0" if torch.cuda.is_available() else "cpu"),
+            init_weight=weight,
+        )
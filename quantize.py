@@ -0,0 +1,91 @@
+"""Post-training int8 quantization.
+
+Quantize the trained model of an experiment directory, compare it with the
+float model and save it as TorchScript which inference.py can load.
+
+    python quantize.py --model_dir exp/latest --weight_name best.pt
+    python inference.py --model_dir exp/latest --weight_name best_int8.ts
+"""
+
+import argparse
+import json
+import os
+
+import torch
+
+from src.dataloader import create_dataloader, get_batch_transform
+from src.model import Model
+from src.quantization import (
+    compare_quantized,
+    default_backend,
+    quantize_static,
+    save_int8_torchscript,
+)
+from src.utils.common import read_yaml
+
+
+def _calibration_batches(dataloader, batch_transform):
+    """Train batches with the batch transform of the policy."""
+    for data, labels, *_ in dataloader:
+        if batch_transform is not None:
+            data = batch_transform(data)
+        yield data, labels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post-training int8 quantization.")
+    parser.add_argument(
+        "--model_dir",
+        default="exp/latest",
+        type=str,
+        help="experiment directory which includes the weight, model.yml and data.yml",
+    )
+    parser.add_argument(
+        "--weight_name", default="best.pt", type=str, help="float state_dict file"
+    )
+    parser.add_argument(
+        "--n_calib",
+        default=None,
+        type=int,
+        help="number of calibration batches. QUANT_CALIB_BATCHES of data.yml or 32",
+    )
+    parser.add_argument(
+        "--backend",
+        default=default_backend(),
+        choices=["fbgemm", "qnnpack"],
+        help="quantized engine. fbgemm for x86, qnnpack for ARM",
+    )
+    parser.add_argument(
+        "--out", default="best_int8.ts", type=str, help="output file in --model_dir"
+    )
+    args = parser.parse_args()
+
+    model_config = read_yaml(os.path.join(args.model_dir, "model.yml"))
+    data_config = read_yaml(os.path.join(args.model_dir, "data.yml"))
+    n_calib = args.n_calib or data_config.get("QUANT_CALIB_BATCHES", 32)
+
+    model_instance = Model(model_config, verbose=True)
+    model_instance.model.load_state_dict(
+        torch.load(os.path.join(args.model_dir, args.weight_name), map_location="cpu")
+    )
+    model = model_instance.model.eval()
+
+    train_dl, val_dl, test_dl = create_dataloader(data_config)
+    int8_model = quantize_static(
+        model,
+        _calibration_batches(train_dl, get_batch_transform(data_config)),
+        n_batches=n_calib,
+        backend=args.backend,
+    )
+
+    img_size = [3, data_config["IMG_SIZE"], data_config["IMG_SIZE"]]
+    report = compare_quantized(
+        model, int8_model, val_dl if len(val_dl) else test_dl, img_size
+    )
+    print(report)
+
+    out_path = os.path.join(args.model_dir, args.out)
+    save_int8_torchscript(int8_model, out_path, torch.rand(1, *img_size), args.backend)
+    with open(os.path.splitext(out_path)[0] + ".json", "w") as f:
+        json.dump({**report._asdict(), "speedup": report.speedup}, f, indent=4)
+    print(f"int8 model saved at {out_path}")
@@ -1,5 +1,6 @@
-from .dataset import AlbuImageFolder
+from .dataset import AlbuImageFolder, CachedImageFolder
 
 __all__ = [
-    "AlbuImageFolder"
-]
\ No newline at end of file
+    "AlbuImageFolder",
+    "CachedImageFolder",
+]
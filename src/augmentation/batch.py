@@ -0,0 +1,272 @@
+"""Batched tensor augmentation.
+
+RandomResizedCrop, flips, RandAugment operations and Cutout applied to a
+whole batch of uint8 images on the training device. Every sample draws its
+own crop, operations and magnitudes. Dataloader workers only decode and
+resize, which is the sample transform of the BatchPolicy.
+"""
+
+import math
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+
+import torch
+from torch.nn import functional as F
+
+# RandAugment operations and their magnitude ranges as in transforms_info()
+OPS_INFO = {
+    "Identity": (0.0, 0.0),
+    "AutoContrast": (0.0, 0.0),
+    "Rotate": (0.0, 30.0),
+    "Solarize": (256.0, 0.0),
+    "Color": (0.0, 0.9),
+    "Posterize": (8, 4),
+    "Contrast": (0.0, 0.9),
+    "Brightness": (0.0, 0.9),
+    "ShearX": (0.0, 0.3),
+    "ShearY": (0.0, 0.3),
+    "TranslateX": (0.0, 150 / 331),
+    "TranslateY": (0.0, 150 / 331),
+}
+GEOMETRIC_OPS = ("Rotate", "ShearX", "ShearY", "TranslateX", "TranslateY")
+FILL = 128 / 255
+
+
+class BatchPolicy(NamedTuple):
+    """Augmentation policy split into the per-sample and the batch transform.
+
+    sample: transform of the dataset. Returns a uint8 tensor of a fixed size.
+    batch: transform of the uint8 batch on the device. Returns the normalized batch.
+    """
+
+    sample: Callable
+    batch: Callable[[torch.Tensor], torch.Tensor]
+
+
+def _uniform(
+    n: int, low: float, high: float, device: torch.device, generator=None
+) -> torch.Tensor:
+    return torch.rand(n, device=device, generator=generator) * (high - low) + low
+
+
+def _sign(n: int, device: torch.device, generator=None) -> torch.Tensor:
+    return torch.randint(0, 2, (n,), device=device, generator=generator) * 2.0 - 1.0
+
+
+def _grayscale(x: torch.Tensor) -> torch.Tensor:
+    """ITU-R 601-2 luma as PIL. (B, 1, H, W)"""
+    return (0.299 * x[:, 0] + 0.587 * x[:, 1] + 0.114 * x[:, 2]).unsqueeze(1)
+
+
+def _blend(
+    x: torch.Tensor, degenerate: torch.Tensor, factor: torch.Tensor
+) -> torch.Tensor:
+    """PIL ImageEnhance blend with a per-sample factor."""
+    return (degenerate + factor.view(-1, 1, 1, 1) * (x - degenerate)).clamp(0.0, 1.0)
+
+
+def _affine(
+    x: torch.Tensor,
+    theta: torch.Tensor,
+    size: Optional[Tuple[int, int]] = None,
+    fill: float = FILL,
+) -> torch.Tensor:
+    """Sample {x} with the per-sample affine {theta} of shape (B, 2, 3).
+
+    theta maps the normalized output coordinates to the input coordinates.
+    """
+    size = size or tuple(x.shape[-2:])
+    grid = F.affine_grid(theta, [x.size(0), x.size(1), *size], align_corners=False)
+    return F.grid_sample(x - fill, grid, align_corners=False) + fill
+
+
+def _geometric_theta(name: str, magnitude: torch.Tensor) -> torch.Tensor:
+    """Affine theta of a geometric RandAugment operation."""
+    theta = torch.zeros(magnitude.size(0), 2, 3, device=magnitude.device)
+    theta[:, 0, 0] = 1.0
+    theta[:, 1, 1] = 1.0
+    if name == "Rotate":
+        radian = magnitude * math.pi / 180
+        theta[:, 0, 0] = torch.cos(radian)
+        theta[:, 0, 1] = -torch.sin(radian)
+        theta[:, 1, 0] = torch.sin(radian)
+        theta[:, 1, 1] = torch.cos(radian)
+    elif name == "ShearX":
+        theta[:, 0, 1] = magnitude
+    elif name == "ShearY":
+        theta[:, 1, 0] = magnitude
+    elif name == "TranslateX":
+        theta[:, 0, 2] = 2 * magnitude
+    elif name == "TranslateY":
+        theta[:, 1, 2] = 2 * magnitude
+    return theta
+
+
+def apply_op(x: torch.Tensor, name: str, magnitude: torch.Tensor) -> torch.Tensor:
+    """Apply a RandAugment operation with per-sample magnitudes.
+
+    Args:
+        x: float images in [0, 1] of shape (B, C, H, W).
+        name: operation name. One of OPS_INFO.
+        magnitude: signed magnitude of each sample of shape (B,).
+
+    Returns:
+        augmented images
+    """
+    if name == "Identity":
+        return x
+    if name in GEOMETRIC_OPS:
+        return _affine(x, _geometric_theta(name, magnitude))
+    if name == "AutoContrast":
+        low = x.amin(dim=(2, 3), keepdim=True)
+        high = x.amax(dim=(2, 3), keepdim=True)
+        scale = torch.where(high > low, 1.0 / (high - low), torch.ones_like(high))
+        return torch.where(high > low, (x - low) * scale, x)
+    if name == "Solarize":
+        threshold = (magnitude / 255).view(-1, 1, 1, 1)
+        return torch.where(x >= threshold, 1.0 - x, x)
+    if name == "Posterize":
+        shift = (8 - magnitude.floor()).view(-1, 1, 1, 1)
+        bucket = torch.pow(2.0, shift)
+        return torch.floor(torch.floor(x * 255) / bucket) * bucket / 255
+    if name == "Color":
+        return _blend(x, _grayscale(x), 1 + magnitude)
+    if name == "Contrast":
+        mean = _grayscale(x).mean(dim=(1, 2, 3), keepdim=True)
+        return _blend(x, mean.expand_as(x), 1 + magnitude)
+    if name == "Brightness":
+        return _blend(x, torch.zeros_like(x), 1 + magnitude)
+    raise ValueError(f"Unknown operation {name}")
+
+
+class BatchAugmentation:
+    """RandomResizedCrop, flips, RandAugment and Cutout on a uint8 batch."""
+
+    def __init__(
+        self,
+        img_size: int,
+        mean: Sequence[float],
+        std: Sequence[float],
+        n_select: int = 0,
+        level: Optional[int] = 14,
+        n_level: int = 31,
+        ops: Sequence[str] = tuple(OPS_INFO),
+        hflip: float = 0.5,
+        vflip: float = 0.0,
+        cutout: Optional[Tuple[float, int]] = None,
+        scale: Tuple[float, float] = (0.08, 1.0),
+        ratio: Tuple[float, float] = (3 / 4, 4 / 3),
+    ) -> None:
+        """Initialize.
+
+        Args:
+            img_size: output size.
+            mean, std: normalization.
+            n_select: number of RandAugment operations of each sample.
+                RandAugment is disabled if 0.
+            level: magnitude level in [0, n_level]. Random for each sample and
+                operation if None is given.
+            n_level: number of magnitude levels.
+            ops: RandAugment operations to choose from.
+            hflip, vflip: flip probabilities.
+            cutout: (probability, level in [0, 10]) of Cutout. Disabled if None.
+            scale, ratio: RandomResizedCrop area scale and aspect ratio ranges.
+        """
+        self.img_size = img_size
+        self.mean = torch.tensor(mean).view(1, -1, 1, 1)
+        self.std = torch.tensor(std).view(1, -1, 1, 1)
+        self.n_select = n_select
+        self.level = level if isinstance(level, int) and 0 <= level <= n_level else None
+        self.n_level = n_level
+        self.ops = list(ops)
+        self.hflip = hflip
+        self.vflip = vflip
+        self.cutout = cutout
+        self.scale = scale
+        self.ratio = ratio
+
+    def _crop_theta(self, x: torch.Tensor, generator=None) -> torch.Tensor:
+        """Affine theta of RandomResizedCrop with the flips."""
+        n, device = x.size(0), x.device
+        height, width = x.shape[-2:]
+        log_ratio = [math.log(r) for r in self.ratio]
+        area = _uniform(n, *self.scale, device, generator)
+        aspect = torch.exp(_uniform(n, *log_ratio, device, generator)) * height / width
+        # crop width and height relative to the image
+        crop_w = torch.sqrt(area * aspect).clamp(max=1.0)
+        crop_h = torch.sqrt(area / aspect).clamp(max=1.0)
+        center_x = (1 - crop_w) * _uniform(n, -1.0, 1.0, device, generator)
+        center_y = (1 - crop_h) * _uniform(n, -1.0, 1.0, device, generator)
+        flip_x = 1 - 2 * (_uniform(n, 0.0, 1.0, device, generator) < self.hflip).float()
+        flip_y = 1 - 2 * (_uniform(n, 0.0, 1.0, device, generator) < self.vflip).float()
+        theta = torch.zeros(n, 2, 3, device=device)
+        theta[:, 0, 0] = crop_w * flip_x
+        theta[:, 0, 2] = center_x
+        theta[:, 1, 1] = crop_h * flip_y
+        theta[:, 1, 2] = center_y
+        return theta
+
+    def _randaugment(self, x: torch.Tensor, generator=None) -> torch.Tensor:
+        n, device = x.size(0), x.device
+        # n_select distinct operations of each sample
+        scores = torch.rand(n, len(self.ops), device=device, generator=generator)
+        chosen = scores.argsort(dim=1)[:, : self.n_select]
+        for step in range(self.n_select):
+            for op_index, name in enumerate(self.ops):
+                index = (chosen[:, step] == op_index).nonzero(as_tuple=True)[0]
+                size = index.numel()
+                if size == 0:
+                    continue
+                if self.level is None:
+                    level = torch.randint(
+                        0, self.n_level + 1, (size,), device=device, generator=generator
+                    ).float()
+                else:
+                    level = torch.full((size,), float(self.level), device=device)
+                low, high = OPS_INFO[name]
+                magnitude = level * (high - low) / self.n_level + low
+                if name not in ("Solarize", "Posterize"):
+                    magnitude = magnitude * _sign(size, device, generator)
+                x[index] = apply_op(x[index], name, magnitude)
+        return x
+
+    def _cutout(self, x: torch.Tensor, generator=None) -> torch.Tensor:
+        probability, level = self.cutout
+        n, device = x.size(0), x.device
+        height, width = x.shape[-2:]
+        ratio = 0.5 * level / 10
+        apply = _uniform(n, 0.0, 1.0, device, generator) < probability
+        center_y = (_uniform(n, 0.0, 1.0, device, generator) * height).view(-1, 1, 1)
+        center_x = (_uniform(n, 0.0, 1.0, device, generator) * width).view(-1, 1, 1)
+        half_h, half_w = int(ratio * height) // 2, int(ratio * width) // 2
+        rows = torch.arange(height, device=device).view(1, -1, 1)
+        cols = torch.arange(width, device=device).view(1, 1, -1)
+        mask = (
+            (rows >= center_y - half_h)
+            & (rows < center_y + half_h)
+            & (cols >= center_x - half_w)
+            & (cols < center_x + half_w)
+            & apply.view(-1, 1, 1)
+        )
+        return torch.where(mask.unsqueeze(1), torch.full_like(x, FILL), x)
+
+    def __call__(self, images: torch.Tensor, generator=None) -> torch.Tensor:
+        """Augment a batch.
+
+        Args:
+            images: uint8 images of shape (B, C, H, W).
+            generator: torch generator on the device of {images}.
+
+        Returns:
+            normalized float images of shape (B, C, img_size, img_size)
+        """
+        x = images.float() / 255
+        x = _affine(
+            x,
+            self._crop_theta(x, generator),
+            size=(self.img_size, self.img_size),
+        )
+        if self.n_select > 0:
+            x = self._randaugment(x, generator)
+        if self.cutout is not None:
+            x = self._cutout(x, generator)
+        return (x - self.mean.to(x.device)) / self.std.to(x.device)
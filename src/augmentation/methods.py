@@ -9,10 +9,13 @@
 
 import random
 from abc import ABC
-from typing import List, Tuple
+from typing import Any, List, Optional, Tuple
 
+import torch
+import torchvision.transforms as transforms
 from PIL.Image import Image
 
+from src.augmentation.seed import current_seed
 from src.augmentation.transforms import transforms_info
 
 
@@ -24,19 +27,22 @@ class Augmentation(ABC):
         self.transforms_info = transforms_info()
         self.n_level = n_level
 
-    def _apply_augment(self, img: Image, name: str, level: int) -> Image:
+    def _apply_augment(
+        self, img: Image, name: str, level: int, rng: Optional[random.Random] = None
+    ) -> Image:
         """Apply and get the augmented image.
 
         Args:
             img (Image): an image to augment
             level (int): magnitude of augmentation in [0, n_level]
+            rng (random.Random): generator to draw from. Global random if None.
 
         returns:
             Image: an augmented image
         """
         assert 0 <= level <= self.n_level
         augment_fn, low, high = self.transforms_info[name]
-        return augment_fn(img.copy(), level * (high - low) / self.n_level + low)
+        return augment_fn(img.copy(), level * (high - low) / self.n_level + low, rng)
 
 
 class SequentialAugmentation(Augmentation):
@@ -51,12 +57,13 @@ class SequentialAugmentation(Augmentation):
         super().__init__(n_level)
         self.policies = policies
 
-    def __call__(self, img: Image) -> Image:
+    def __call__(self, img: Image, rng: Optional[random.Random] = None) -> Image:
         """Run augmentations."""
+        rng = rng or random
         for name, pr, level in self.policies:
-            if random.random() > pr:
+            if rng.random() > pr:
                 continue
-            img = self._apply_augment(img, name, level)
+            img = self._apply_augment(img, name, level, rng)
         return img
 
 
@@ -82,10 +89,34 @@ class RandAugmentation(Augmentation):
         self.level = level if isinstance(level, int) and 0 <= level <= n_level else None
         self.transforms = transforms
 
-    def __call__(self, img: Image) -> Image:
+    def __call__(self, img: Image, rng: Optional[random.Random] = None) -> Image:
         """Run augmentations."""
-        chosen_transforms = random.sample(self.transforms, k=self.n_select)
+        rng = rng or random
+        chosen_transforms = rng.sample(self.transforms, k=self.n_select)
         for transf in chosen_transforms:
-            level = self.level if self.level else random.randint(0, self.n_level)
-            img = self._apply_augment(img, transf, level)
+            level = self.level if self.level else rng.randint(0, self.n_level)
+            img = self._apply_augment(img, transf, level, rng)
+        return img
+
+
+class SeededCompose(transforms.Compose):
+    """Compose whose random transforms are reproducible with a seed.
+
+    Augmentation methods draw from a random.Random of the seed and the
+    torchvision random transforms from the torch generator seeded with it,
+    so the same seed gives the same output in any process. The seed of the
+    enclosing augmentation_seed() is used if no seed is given, and it is the
+    same as transforms.Compose without any seed.
+    """
+
+    def __call__(self, img: Any, seed: Optional[int] = None) -> Any:
+        """Run transforms."""
+        seed = current_seed() if seed is None else seed
+        if seed is None:
+            return super().__call__(img)
+        rng = random.Random(seed)
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(seed)
+            for t in self.transforms:
+                img = t(img, rng) if isinstance(t, Augmentation) else t(img)
         return img
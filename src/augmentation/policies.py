@@ -8,7 +8,12 @@
 
 import torchvision.transforms as transforms
 
-from src.augmentation.methods import RandAugmentation, SequentialAugmentation
+from src.augmentation.batch import BatchAugmentation, BatchPolicy
+from src.augmentation.methods import (
+    RandAugmentation,
+    SeededCompose,
+    SequentialAugmentation,
+)
 from src.augmentation.transforms import FILLCOLOR, SquarePad
 
 DATASET_NORMALIZE_INFO = {
@@ -16,15 +21,16 @@ DATASET_NORMALIZE_INFO = {
     "CIFAR100": {"MEAN": (0.5071, 0.4865, 0.4409), "STD": (0.2673, 0.2564, 0.2762)},
     "IMAGENET": {"MEAN": (0.485, 0.456, 0.406), "STD": (0.229, 0.224, 0.225)},
     "TACO": {"MEAN": (0.485, 0.456, 0.406), "STD": (0.229, 0.224, 0.225)},
+    "TACO_SHARD": {"MEAN": (0.485, 0.456, 0.406), "STD": (0.229, 0.224, 0.225)},
     "TUNE": {"MEAN": (0.485, 0.456, 0.406), "STD": (0.229, 0.224, 0.225)},
 }
 
 
 def simple_augment_train(
     dataset: str = "CIFAR10", img_size: float = 32
-) -> transforms.Compose:
+) -> SeededCompose:
     """Simple data augmentation rule for training CIFAR100."""
-    return transforms.Compose(
+    return SeededCompose(
         [
             SquarePad(),
             transforms.Resize((int(img_size * 1.2), int(img_size * 1.2))),
@@ -43,9 +49,9 @@ def simple_augment_train(
 
 def simple_augment_test(
     dataset: str = "CIFAR10", img_size: float = 32
-) -> transforms.Compose:
+) -> SeededCompose:
     """Simple data augmentation rule for testing CIFAR100."""
-    return transforms.Compose(
+    return SeededCompose(
         [
             SquarePad(),
             transforms.Resize((img_size, img_size)),
@@ -64,7 +70,7 @@ def randaugment_train(
     n_select: int = 2,
     level: int = 14,
     n_level: int = 31,
-) -> transforms.Compose:
+) -> SeededCompose:
     """Random augmentation policy for training CIFAR100."""
     operators = [
         "Identity",
@@ -82,7 +88,7 @@ def randaugment_train(
         "TranslateX",
         "TranslateY",
     ]
-    return transforms.Compose(
+    return SeededCompose(
         [
             SquarePad(),
             transforms.Resize((img_size, img_size)),
@@ -100,9 +106,9 @@ def randaugment_train(
 
 def custom_augment_train(
     dataset: str = "CIFAR10", img_size: float = 32
-) -> transforms.Compose:
+) -> SeededCompose:
     """Custom data augmentation rule for training TACO."""
-    return transforms.Compose(
+    return SeededCompose(
         [
             transforms.Resize((int(img_size), int(img_size))),
             transforms.RandomResizedCrop(
@@ -119,6 +125,70 @@ def custom_augment_train(
         ]
     )
 
+def _batch_sample_transform(size: int) -> SeededCompose:
+    """Decode and resize only. The uint8 tensor is augmented by the batch transform."""
+    return SeededCompose(
+        [SquarePad(), transforms.Resize((size, size)), transforms.PILToTensor()]
+    )
+
+
+def batch_simple_augment_train(
+    dataset: str = "CIFAR10", img_size: float = 32
+) -> BatchPolicy:
+    """simple_augment_train on the batch tensors."""
+    return BatchPolicy(
+        sample=_batch_sample_transform(int(img_size * 1.2)),
+        batch=BatchAugmentation(
+            img_size,
+            DATASET_NORMALIZE_INFO[dataset]["MEAN"],
+            DATASET_NORMALIZE_INFO[dataset]["STD"],
+            ratio=(0.75, 1.0),
+        ),
+    )
+
+
+def batch_randaugment_train(
+    dataset: str = "CIFAR10",
+    img_size: float = 32,
+    n_select: int = 2,
+    level: int = 14,
+    n_level: int = 31,
+) -> BatchPolicy:
+    """randaugment_train on the batch tensors.
+
+    Equalize and Sharpness are not supported by the batch transform.
+    """
+    return BatchPolicy(
+        sample=_batch_sample_transform(img_size),
+        batch=BatchAugmentation(
+            img_size,
+            DATASET_NORMALIZE_INFO[dataset]["MEAN"],
+            DATASET_NORMALIZE_INFO[dataset]["STD"],
+            n_select=n_select,
+            level=level,
+            n_level=n_level,
+            cutout=(0.8, 9),
+            scale=(1.0, 1.0),
+            ratio=(1.0, 1.0),
+        ),
+    )
+
+
+def batch_custom_augment_train(
+    dataset: str = "CIFAR10", img_size: float = 32
+) -> BatchPolicy:
+    """custom_augment_train on the batch tensors."""
+    return BatchPolicy(
+        sample=_batch_sample_transform(img_size),
+        batch=BatchAugmentation(
+            img_size,
+            DATASET_NORMALIZE_INFO[dataset]["MEAN"],
+            DATASET_NORMALIZE_INFO[dataset]["STD"],
+            vflip=0.5,
+            ratio=(0.75, 1.0),
+        ),
+    )
+
 import albumentations as A
 from albumentations.pytorch import ToTensorV2
 import cv2
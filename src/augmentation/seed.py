@@ -0,0 +1,55 @@
+"""Per-sample augmentation seed.
+
+- Reference:
+    https://pytorch.org/docs/stable/random.html#torch.random.fork_rng
+"""
+
+import random
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+import numpy as np
+import torch
+
+_SEED: Optional[int] = None
+
+
+def current_seed() -> Optional[int]:
+    """Seed of the enclosing augmentation_seed(). None outside of the context."""
+    return _SEED
+
+
+@contextmanager
+def augmentation_seed(seed: int) -> Iterator[None]:
+    """Make the augmentations applied inside the context reproducible.
+
+    SeededCompose and seed_albumentations() use {seed}. The global random,
+    numpy and torch generators are also seeded for the other transforms and
+    restored on exit.
+    """
+    global _SEED  # pylint: disable=global-statement
+    previous = _SEED
+    random_state = random.getstate()
+    numpy_state = np.random.get_state()
+    with torch.random.fork_rng(devices=[]):
+        random.seed(seed)
+        np.random.seed(seed % 2 ** 32)
+        torch.manual_seed(seed)
+        _SEED = seed
+        try:
+            yield
+        finally:
+            _SEED = previous
+            random.setstate(random_state)
+            np.random.set_state(numpy_state)
+
+
+def seed_albumentations(transform: Any) -> None:
+    """Seed an albumentations Compose with the current seed.
+
+    albumentations >= 1.4 draws from the generators of the Compose instead
+    of the global generators.
+    """
+    seed = current_seed()
+    if seed is not None and hasattr(transform, "set_random_seed"):
+        transform.set_random_seed(seed)
@@ -7,7 +7,7 @@
 """
 
 import random
-from typing import Callable, Dict, Tuple
+from typing import Callable, Dict, Optional, Tuple
 
 import numpy as np
 import PIL
@@ -23,10 +23,17 @@ FILLCOLOR = (128, 128, 128)
 FILLCOLOR_RGBA = (128, 128, 128, 128)
 
 
-def transforms_info() -> Dict[
-    str, Tuple[Callable[[Image, float], Image], float, float]
-]:
-    """Return augmentation functions and their ranges."""
+def _sign(rng: Optional[random.Random]) -> int:
+    """Random sign."""
+    return (rng or random).choice([-1, 1])
+
+
+def transforms_info() -> Dict[str, Tuple[Callable[..., Image], float, float]]:
+    """Return augmentation functions and their ranges.
+
+    Each function is called as f(img, magnitude, rng) where rng is the
+    random.Random to draw from. The global random module is used if rng is None.
+    """
     transforms_list = [
         (Identity, 0.0, 0.0),
         (Invert, 0.0, 0.0),
@@ -48,29 +55,29 @@ def transforms_info() -> Dict[
     return {f.__name__: (f, low, high) for f, low, high in transforms_list}
 
 
-def Identity(img: Image, _: float) -> Image:
+def Identity(img: Image, _: float, rng: Optional[random.Random] = None) -> Image:
     """Identity map."""
     return img
 
 
-def Invert(img: Image, _: float) -> Image:
+def Invert(img: Image, _: float, rng: Optional[random.Random] = None) -> Image:
     """Invert the image."""
     return PIL.ImageOps.invert(img)
 
 
-def Contrast(img: Image, magnitude: float) -> Image:
+def Contrast(
+    img: Image, magnitude: float, rng: Optional[random.Random] = None
+) -> Image:
     """Put contrast effect on the image."""
-    return PIL.ImageEnhance.Contrast(img).enhance(
-        1 + magnitude * random.choice([-1, 1])
-    )
+    return PIL.ImageEnhance.Contrast(img).enhance(1 + magnitude * _sign(rng))
 
 
-def AutoContrast(img: Image, _: float) -> Image:
+def AutoContrast(img: Image, _: float, rng: Optional[random.Random] = None) -> Image:
     """Put contrast effect on the image."""
     return PIL.ImageOps.autocontrast(img)
 
 
-def Rotate(img: Image, magnitude: float) -> Image:
+def Rotate(img: Image, magnitude: float, rng: Optional[random.Random] = None) -> Image:
     """Rotate the image (degree)."""
     rot = img.convert("RGBA").rotate(magnitude)
     return PIL.Image.composite(
@@ -78,89 +85,97 @@ def Rotate(img: Image, magnitude: float) -> Image:
     ).convert(img.mode)
 
 
-def TranslateX(img: Image, magnitude: float) -> Image:
+def TranslateX(
+    img: Image, magnitude: float, rng: Optional[random.Random] = None
+) -> Image:
     """Translate the image on x-axis."""
     return img.transform(
         img.size,
         PIL.Image.AFFINE,
-        (1, 0, magnitude * img.size[0] * random.choice([-1, 1]), 0, 1, 0),
+        (1, 0, magnitude * img.size[0] * _sign(rng), 0, 1, 0),
         fillcolor=FILLCOLOR,
     )
 
 
-def TranslateY(img: Image, magnitude: float) -> Image:
+def TranslateY(
+    img: Image, magnitude: float, rng: Optional[random.Random] = None
+) -> Image:
     """Translate the image on y-axis."""
     return img.transform(
         img.size,
         PIL.Image.AFFINE,
-        (1, 0, 0, 0, 1, magnitude * img.size[1] * random.choice([-1, 1])),
+        (1, 0, 0, 0, 1, magnitude * img.size[1] * _sign(rng)),
         fillcolor=FILLCOLOR,
     )
 
 
-def Sharpness(img: Image, magnitude: float) -> Image:
+def Sharpness(
+    img: Image, magnitude: float, rng: Optional[random.Random] = None
+) -> Image:
     """Adjust the sharpness of the image."""
-    return PIL.ImageEnhance.Sharpness(img).enhance(
-        1 + magnitude * random.choice([-1, 1])
-    )
+    return PIL.ImageEnhance.Sharpness(img).enhance(1 + magnitude * _sign(rng))
 
 
-def ShearX(img: Image, magnitude: float) -> Image:
+def ShearX(img: Image, magnitude: float, rng: Optional[random.Random] = None) -> Image:
     """Shear the image on x-axis."""
     return img.transform(
         img.size,
         PIL.Image.AFFINE,
-        (1, magnitude * random.choice([-1, 1]), 0, 0, 1, 0),
+        (1, magnitude * _sign(rng), 0, 0, 1, 0),
         PIL.Image.BICUBIC,
         fillcolor=FILLCOLOR,
     )
 
 
-def ShearY(img: Image, magnitude: float) -> Image:
+def ShearY(img: Image, magnitude: float, rng: Optional[random.Random] = None) -> Image:
     """Shear the image on y-axis."""
     return img.transform(
         img.size,
         PIL.Image.AFFINE,
-        (1, 0, 0, magnitude * random.choice([-1, 1]), 1, 0),
+        (1, 0, 0, magnitude * _sign(rng), 1, 0),
         PIL.Image.BICUBIC,
         fillcolor=FILLCOLOR,
     )
 
 
-def Color(img: Image, magnitude: float) -> Image:
+def Color(img: Image, magnitude: float, rng: Optional[random.Random] = None) -> Image:
     """Adjust the color balance of the image."""
-    return PIL.ImageEnhance.Color(img).enhance(1 + magnitude * random.choice([-1, 1]))
+    return PIL.ImageEnhance.Color(img).enhance(1 + magnitude * _sign(rng))
 
 
-def Brightness(img: Image, magnitude: float) -> Image:
+def Brightness(
+    img: Image, magnitude: float, rng: Optional[random.Random] = None
+) -> Image:
     """Adjust brightness of the image."""
-    return PIL.ImageEnhance.Brightness(img).enhance(
-        1 + magnitude * random.choice([-1, 1])
-    )
+    return PIL.ImageEnhance.Brightness(img).enhance(1 + magnitude * _sign(rng))
 
 
-def Equalize(img: Image, _: float) -> Image:
+def Equalize(img: Image, _: float, rng: Optional[random.Random] = None) -> Image:
     """Equalize the image."""
     return PIL.ImageOps.equalize(img)
 
 
-def Solarize(img: Image, magnitude: float) -> Image:
+def Solarize(
+    img: Image, magnitude: float, rng: Optional[random.Random] = None
+) -> Image:
     """Solarize the image."""
     return PIL.ImageOps.solarize(img, magnitude)
 
 
-def Posterize(img: Image, magnitude: float) -> Image:
+def Posterize(
+    img: Image, magnitude: float, rng: Optional[random.Random] = None
+) -> Image:
     """Posterize the image."""
     magnitude = int(magnitude)
     return PIL.ImageOps.posterize(img, magnitude)
 
 
-def Cutout(img: Image, magnitude: float) -> Image:
+def Cutout(img: Image, magnitude: float, rng: Optional[random.Random] = None) -> Image:
     """Cutout some region of the image."""
     if magnitude == 0.0:
         return img
     w, h = img.size
-    xy = get_rand_bbox_coord(w, h, magnitude)
+    xy = get_rand_bbox_coord(w, h, magnitude, rng)
 
     img = img.copy()
     PIL.ImageDraw.Draw(img).rectangle(xy, fill=FILLCOLOR)
@@ -6,26 +6,45 @@
     https://github.com/j-marple-dev/model_compression
 """
 import glob
+import itertools
 import os
-from typing import Any, Dict, List, Tuple, Union
+import random
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import torch
 import yaml
 from torch.utils.data import DataLoader, random_split
 from torchvision.datasets import ImageFolder, VisionDataset
 
+from src.augmentation.batch import BatchPolicy
 from src.utils.data import weights_for_balanced_classes
 from src.utils.torch_utils import split_dataset_index
 
-from src.dataset import AlbuImageFolder
+from src.dataset import (
+    AlbuImageFolder,
+    CachedImageFolder,
+    SeededDataset,
+    SeededSampler,
+    decode_size,
+    reduced_loader,
+)
+from src.shard import ShardDataset, ShardShuffleSampler
 
 def create_dataloader(
     config: Dict[str, Any],
+    persistent_workers: Optional[bool] = None,
 ) -> Tuple[DataLoader, DataLoader, DataLoader]:
     """Simple dataloader.
 
     Args:
         cfg: yaml file path or dictionary type of the data.
+        persistent_workers: keep the train worker processes alive between epochs.
+            PERSISTENT_WORKERS of {config}(default True) if None is given.
+            Validation and test workers follow EVAL_PERSISTENT_WORKERS of
+            {config}(default False).
 
     Returns:
         train_loader
@@ -33,7 +52,35 @@ def create_dataloader(
         test_loader
     """
     # Data Setup
-    train_dataset, val_dataset, test_dataset = get_dataset(
+    train_dataset, val_dataset, test_dataset = create_dataset(config)
+
+    return get_dataloader(
+        train_dataset=train_dataset,
+        val_dataset=val_dataset,
+        test_dataset=test_dataset,
+        batch_size=config["BATCH_SIZE"],
+        persistent_workers=(
+            config.get("PERSISTENT_WORKERS", True)
+            if persistent_workers is None
+            else persistent_workers
+        ),
+        eval_persistent_workers=config.get("EVAL_PERSISTENT_WORKERS", False),
+        shard_buffer_size=config.get("SHARD_BUFFER_SIZE", 1024),
+        num_workers=config.get("NUM_WORKERS"),
+        eval_num_workers=config.get("EVAL_NUM_WORKERS"),
+        prefetch_factor=config.get("PREFETCH_FACTOR", 2),
+        autotune_batches=config.get("AUTOTUNE_BATCHES", 20),
+    )
+
+
+def create_dataset(
+    config: Dict[str, Any]
+) -> Tuple[VisionDataset, VisionDataset, VisionDataset]:
+    """Get the train, validation and test datasets of the data config.
+
+    The image cache of CACHE_DIR is built here if it does not exist.
+    """
+    return get_dataset(
         data_path=config["DATA_PATH"],
         dataset_name=config["DATASET"],
         img_size=config["IMG_SIZE"],
@@ -42,13 +89,8 @@ def create_dataloader(
         transform_test=config["AUG_TEST"],
         transform_train_params=config["AUG_TRAIN_PARAMS"],
         transform_test_params=config.get("AUG_TEST_PARAMS"),
-    )
-
-    return get_dataloader(
-        train_dataset=train_dataset,
-        val_dataset=val_dataset,
-        test_dataset=test_dataset,
-        batch_size=config["BATCH_SIZE"],
+        cache_dir=config.get("CACHE_DIR"),
+        reduced_decode=config.get("REDUCED_DECODE", True),
     )
 
 
@@ -61,8 +103,17 @@ def get_dataset(
     transform_test: str = "simple_augment_test",
     transform_train_params: Dict[str, int] = None,
     transform_test_params: Dict[str, int] = None,
+    cache_dir: Optional[str] = None,
+    reduced_decode: bool = True,
 ) -> Tuple[VisionDataset, VisionDataset, VisionDataset]:
-    """Get dataset for training and testing."""
+    """Get dataset for training and testing.
+
+    Args:
+        cache_dir: If given, TACO and TUNE images are decoded and resized only once
+            and read from the preprocessed cache in {cache_dir}.
+        reduced_decode: decode TACO, TUNE and TACO_SHARD JPEG images at the
+            smallest scale which is still larger than the first resize of the transform.
+    """
     if not transform_train_params:
         transform_train_params = dict()
     if not transform_test_params:
@@ -79,6 +130,29 @@ def get_dataset(
         __import__("src.augmentation.policies", fromlist=[""]),
         transform_test,
     )(dataset=dataset_name, img_size=img_size, **transform_test_params)
+    # the batch part is applied by the trainer. See get_batch_transform().
+    if isinstance(transform_train, BatchPolicy):
+        transform_train = transform_train.sample
+
+    def image_folder(root: str, transform: Any, albu: bool = False) -> VisionDataset:
+        if cache_dir:
+            return CachedImageFolder(
+                root=root,
+                transform=transform,
+                cache_dir=cache_dir,
+                img_size=img_size,
+                albu=albu,
+                reduced_decode=reduced_decode,
+            )
+        loader = partial(
+            reduced_loader,
+            size=decode_size(transform) if reduced_decode else None,
+            exif_transpose=albu,
+        )
+        if albu:
+            print("Calling Albu Dataset")
+            return AlbuImageFolder(root=root, transform=transform, loader=loader)
+        return ImageFolder(root=root, transform=transform, loader=loader)
 
     label_weights = None
     # pytorch dataset
@@ -86,26 +160,36 @@ def get_dataset(
         train_path = os.path.join(data_path, "train")
         val_path = os.path.join(data_path, "val")
         test_path = os.path.join(data_path, "test")
-        if albu:
-            print("Calling Albu Dataset")
-            train_dataset = AlbuImageFolder(root=train_path, transform=transform_train)
-        else:
-            train_dataset = ImageFolder(root=train_path, transform=transform_train)
-        val_dataset = ImageFolder(root=val_path, transform=transform_test)
-        test_dataset = ImageFolder(root=test_path, transform=transform_test)
+        train_dataset = image_folder(train_path, transform_train, albu=albu)
+        val_dataset = image_folder(val_path, transform_test)
+        test_dataset = image_folder(test_path, transform_test)
     
     elif dataset_name == "TUNE":
         train_path = os.path.join(data_path, "train")
         val_path = os.path.join(data_path, "val")
         test_path = os.path.join(data_path, "test")
 
-        train_dataset = ImageFolder(root=train_path, transform=transform_train)
+        train_dataset = image_folder(train_path, transform_train)
         train_length = int(len(train_dataset) * (1.0-val_ratio))
         train_dataset, _ = random_split(
             train_dataset, [train_length, len(train_dataset) - train_length]
         )
-        val_dataset = ImageFolder(root=val_path, transform=transform_test)
-        test_dataset = ImageFolder(root=test_path, transform=transform_test)
+        val_dataset = image_folder(val_path, transform_test)
+        test_dataset = image_folder(test_path, transform_test)
+
+    elif dataset_name == "TACO_SHARD":
+        # splits packed by pack_shards.py
+        def shard_dataset(split: str, transform: Any, albu: bool = False):
+            return ShardDataset(
+                os.path.join(data_path, split),
+                transform=transform,
+                albu=albu,
+                decode_size=decode_size(transform) if reduced_decode else None,
+            )
+
+        train_dataset = shard_dataset("train", transform_train, albu=albu)
+        val_dataset = shard_dataset("val", transform_test)
+        test_dataset = shard_dataset("test", transform_test)
 
     else:
         Dataset = getattr(
@@ -125,34 +209,193 @@ def get_dataset(
     return train_dataset, val_dataset, test_dataset
 
 
+def get_batch_transform(config: Dict[str, Any]) -> Optional[Callable]:
+    """Batch transform of the AUG_TRAIN policy.
+
+    Returns:
+        the device-side transform of a batch_* policy, None for the others.
+    """
+    policy = getattr(
+        __import__("src.augmentation.policies", fromlist=[""]),
+        config["AUG_TRAIN"],
+    )(
+        dataset=config["DATASET"],
+        img_size=config["IMG_SIZE"],
+        **(config.get("AUG_TRAIN_PARAMS") or dict()),
+    )
+    return policy.batch if isinstance(policy, BatchPolicy) else None
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _worker_kwargs(
+    num_workers: int, prefetch_factor: int, persistent_workers: bool
+) -> Dict[str, Any]:
+    """DataLoader worker arguments. Prefetch and persistence need worker processes."""
+    if num_workers == 0:
+        return {"num_workers": 0}
+    return {
+        "num_workers": num_workers,
+        "prefetch_factor": prefetch_factor,
+        "persistent_workers": persistent_workers,
+    }
+
+
+def autotune_dataloader(
+    make_loader: Callable[[int, int], DataLoader],
+    n_batches: int = 20,
+    candidates: Optional[List[Tuple[int, int]]] = None,
+) -> Tuple[int, int]:
+    """Pick the fastest (num_workers, prefetch_factor) on this host.
+
+    Each candidate loads {n_batches} batches after its first batch, so the
+    worker startup is not measured. The global random states are restored.
+
+    Args:
+        make_loader: builds a dataloader with (num_workers, prefetch_factor).
+        n_batches: number of timed batches of each candidate.
+        candidates: (num_workers, prefetch_factor) to try. Default is 0, 2, 4, 8
+            and 16 workers below the available CPUs and the available CPUs,
+            with the prefetch factor 2 and 4.
+
+    Returns:
+        num_workers, prefetch_factor
+    """
+    if candidates is None:
+        cpus = available_cpus()
+        workers = sorted({0, cpus} | {w for w in (2, 4, 8, 16) if w < cpus})
+        candidates = [(w, p) for w in workers for p in ((2,) if w == 0 else (2, 4))]
+
+    random_state = random.getstate()
+    numpy_state = np.random.get_state()
+    best, best_time = candidates[0], float("inf")
+    with torch.random.fork_rng(devices=[]):
+        for num_workers, prefetch_factor in candidates:
+            batches = iter(make_loader(num_workers, prefetch_factor))
+            next(batches, None)
+            start = time.perf_counter()
+            n_loaded = sum(1 for _ in itertools.islice(batches, n_batches))
+            batch_time = (time.perf_counter() - start) / max(n_loaded, 1)
+            # shut down the workers before the next candidate
+            del batches
+            print(
+                f"Autotune num_workers: {num_workers}, prefetch_factor: "
+                f"{prefetch_factor}, {batch_time * 1000:.1f}ms/batch"
+            )
+            if batch_time < best_time:
+                best, best_time = (num_workers, prefetch_factor), batch_time
+    random.setstate(random_state)
+    np.random.set_state(numpy_state)
+    print(f"Autotune selected num_workers: {best[0]}, prefetch_factor: {best[1]}")
+    return best
+
+
 def get_dataloader(
     train_dataset: VisionDataset,
     val_dataset: VisionDataset,
     test_dataset: VisionDataset,
     batch_size: int,
+    persistent_workers: bool = False,
+    eval_persistent_workers: bool = False,
+    shard_buffer_size: int = 1024,
+    num_workers: Optional[Union[int, str]] = None,
+    eval_num_workers: Optional[int] = None,
+    prefetch_factor: int = 2,
+    autotune_batches: int = 20,
 ) -> Tuple[DataLoader, DataLoader, DataLoader]:
-    """Get dataloader for training and testing."""
+    """Get dataloader for training and testing.
 
-    train_loader = DataLoader(
-        dataset=train_dataset,
-        pin_memory=(torch.cuda.is_available()),
-        shuffle=True,
-        batch_size=batch_size,
-        num_workers=10,
-        drop_last=True
-    )
+    Args:
+        persistent_workers: keep the train worker processes alive after the
+            dataloader is exhausted so that they are reused by the next iteration.
+        eval_persistent_workers: same for the validation and test workers.
+            Off by default since the persistent train, validation and test
+            workers together would exceed the available CPUs.
+        shard_buffer_size: shuffle buffer size of ShardShuffleSampler.
+            Used if {train_dataset} is a ShardDataset.
+        num_workers: number of train workers. min(10, available CPUs) if None is
+            given. "auto" benchmarks the train loader with autotune_dataloader().
+        eval_num_workers: number of validation and test workers.
+            min(5, available CPUs), or half of the autotuned workers if None is given.
+        prefetch_factor: batches loaded in advance by each worker.
+        autotune_batches: number of timed batches of each autotune candidate.
+    """
+    train_sampler = None
+    if isinstance(train_dataset, ShardDataset):
+        train_sampler = ShardShuffleSampler(
+            train_dataset, buffer_size=shard_buffer_size
+        )
+
+    def train_loader_with(workers: int, prefetch: int, persistent: bool) -> DataLoader:
+        return DataLoader(
+            dataset=train_dataset,
+            pin_memory=(torch.cuda.is_available()),
+            shuffle=train_sampler is None,
+            sampler=train_sampler,
+            batch_size=batch_size,
+            drop_last=True,
+            **_worker_kwargs(workers, prefetch, persistent),
+        )
+
+    cpus = available_cpus()
+    if num_workers == "auto":
+        num_workers, prefetch_factor = autotune_dataloader(
+            lambda workers, prefetch: train_loader_with(workers, prefetch, False),
+            n_batches=autotune_batches,
+        )
+        if eval_num_workers is None:
+            eval_num_workers = num_workers // 2
+    if num_workers is None:
+        num_workers = min(10, cpus)
+    if eval_num_workers is None:
+        eval_num_workers = min(5, cpus)
+
+    train_loader = train_loader_with(num_workers, prefetch_factor, persistent_workers)
     valid_loader = DataLoader(
         dataset=val_dataset,
         pin_memory=(torch.cuda.is_available()),
         shuffle=False,
         batch_size=batch_size,
-        num_workers=5
+        **_worker_kwargs(eval_num_workers, prefetch_factor, eval_persistent_workers),
     )
     test_loader = DataLoader(
         dataset=test_dataset,
         pin_memory=(torch.cuda.is_available()),
         shuffle=False,
         batch_size=batch_size,
-        num_workers=5
+        **_worker_kwargs(eval_num_workers, prefetch_factor, eval_persistent_workers),
     )
     return train_loader, valid_loader, test_loader
+
+
+def get_seeded_dataloader(
+    dataset: VisionDataset,
+    batch_size: int,
+    n_views: int = 1,
+    seed: int = 0,
+    shuffle: bool = True,
+    num_workers: int = 10,
+    drop_last: bool = True,
+) -> DataLoader:
+    """Dataloader of reproducible augmented samples.
+
+    Batches are (data, labels, keys) where keys are the (view, index) of
+    each sample. Call dataloader.sampler.set_epoch() before every epoch.
+
+    Args:
+        n_views: number of augmented views of each sample.
+        seed: augmentation and order seed.
+    """
+    return DataLoader(
+        dataset=SeededDataset(dataset, seed=seed),
+        sampler=SeededSampler(len(dataset), n_views, shuffle=shuffle, seed=seed),
+        pin_memory=(torch.cuda.is_available()),
+        batch_size=batch_size,
+        num_workers=num_workers,
+        drop_last=drop_last,
+    )
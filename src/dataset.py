@@ -1,16 +1,94 @@
+import hashlib
+import json
+import os
+import re
+from functools import partial
+from typing import Any, BinaryIO, Callable, Iterator, List, Optional, Tuple, Union
+
+import albumentations as A
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+from torch.utils.data import DataLoader, Dataset, Sampler
+from torchvision.datasets import VisionDataset
 from torchvision.datasets.folder import ImageFolder, default_loader
-from typing import Any, Callable, Optional, Tuple
-import cv2
+from tqdm import tqdm
+
+from src.augmentation.methods import SeededCompose
+from src.augmentation.seed import augmentation_seed, seed_albumentations
 
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
 
+# Transforms whose output depends only on the input image.
+# Only these may be baked into the preprocessed cache.
+DETERMINISTIC_TRANSFORMS = ("SquarePad", "Resize", "LongestMaxSize", "PadIfNeeded")
+# Deterministic transforms which always produce the same output shape.
+FIXED_SIZE_TRANSFORMS = ("Resize", "PadIfNeeded")
+# EXIF tag of the camera orientation
+EXIF_ORIENTATION = 0x0112
+
+
+def decode_image(
+    fp: BinaryIO, size: Optional[int] = None, exif_transpose: bool = False
+) -> Image.Image:
+    """Decode an RGB image. JPEG is decoded at a reduced size if {size} is given.
+
+    The DCT scaling of the JPEG decoder(draft mode) picks the smallest
+    1/2, 1/4 or 1/8 scale whose width and height are still >= {size}.
+
+    Args:
+        fp: image file object.
+        size: smallest side required after the decode. Full size if None.
+        exif_transpose: rotate the image by its EXIF orientation as
+            cv2.imread does. PIL and the torchvision loader do not.
+    """
+    img = Image.open(fp)
+    if size is not None and img.format == "JPEG":
+        img.draft("RGB", (size, size))
+    if exif_transpose and img.getexif().get(EXIF_ORIENTATION, 1) != 1:
+        img = ImageOps.exif_transpose(img)
+    if img.mode == "RGB":
+        img.load()
+        return img
+    return img.convert("RGB")
+
+
+def reduced_loader(
+    path: str, size: Optional[int] = None, exif_transpose: bool = False
+) -> Image.Image:
+    """Load an RGB image with decode_image()."""
+    with open(path, "rb") as f:
+        return decode_image(f, size, exif_transpose)
+
+
+def decode_size(transform: Callable) -> Optional[int]:
+    """Smallest image side required by the leading resize of the transform.
+
+    Returns:
+        target size of the first resize if only deterministic transforms
+        precede it. None if the image must be decoded at full size.
+    """
+    for t in getattr(transform, "transforms", [transform]):
+        name = t.__class__.__name__
+        if name not in DETERMINISTIC_TRANSFORMS:
+            return None
+        if name == "Resize":
+            size = getattr(t, "size", None)
+            if size is None:
+                size = (t.height, t.width)
+            return size if isinstance(size, int) else max(size)
+        if name == "LongestMaxSize":
+            return t.max_size if isinstance(t.max_size, int) else max(t.max_size)
+    return None
+
+
 class AlbuImageFolder(ImageFolder):
     def __init__(
             self,
             root: str,
             transform: Optional[Callable] = None,
             target_transform: Optional[Callable] = None,
-            loader: Callable[[str], Any] = default_loader,
+            loader: Callable[[str], Any] = partial(reduced_loader, exif_transpose=True),
             is_valid_file: Optional[Callable[[str], bool]] = None,
     ):
         super(ImageFolder, self).__init__(root, loader, IMG_EXTENSIONS if is_valid_file is None else None,
@@ -21,12 +99,279 @@ class AlbuImageFolder(ImageFolder):
 
     def __getitem__(self, index: int) -> Tuple[Any, Any]:
         path, target = self.samples[index]
-        sample = cv2.imread(path)
-        sample = cv2.cvtColor(sample, cv2.COLOR_BGR2RGB)
+        # RGB array of the decoded image. np.asarray copies the pixels out of
+        # PIL once, as the BGR to RGB conversion after cv2.imread did.
+        sample = np.asarray(self.loader(path))
         if self.transform is not None:
+            seed_albumentations(self.transform)
             augmented = self.transform(image=sample)
             sample = augmented['image'].float()
         if self.target_transform is not None:
             target = self.target_transform(target)
 
-        return sample, target
\ No newline at end of file
+        return sample, target
+
+
+def split_transform(transform: Callable) -> Tuple[List[Callable], List[Callable]]:
+    """Split a transform into its deterministic prefix and random tail.
+
+    The prefix is cut right after the last transform which fixes the image size
+    so that every cached sample has the same shape.
+
+    Args:
+        transform: torchvision or albumentations Compose.
+
+    Returns:
+        deterministic prefix transforms, remaining tail transforms.
+        Prefix is empty if the transform can not be cached.
+    """
+    transforms = list(getattr(transform, "transforms", [transform]))
+    n_prefix = 0
+    for i, t in enumerate(transforms):
+        name = t.__class__.__name__
+        if name not in DETERMINISTIC_TRANSFORMS:
+            break
+        if name in FIXED_SIZE_TRANSFORMS and (
+            name != "Resize" or not isinstance(getattr(t, "size", None), int)
+        ):
+            n_prefix = i + 1
+    return transforms[:n_prefix], transforms[n_prefix:]
+
+
+def _transform_key(transforms: List[Callable]) -> List[str]:
+    """Stable description of transforms to be used as a cache key."""
+    return [re.sub(r" at 0x[0-9a-f]+", "", repr(t)) for t in transforms]
+
+
+class _PrefixDataset(Dataset):
+    """Decode images and apply the deterministic prefix for the cache build."""
+
+    def __init__(
+        self,
+        samples: List[Tuple[str, int]],
+        prefix: List[Callable],
+        albu: bool,
+        loader: Callable[[str], Image.Image] = default_loader,
+    ):
+        self.samples = samples
+        self.prefix = prefix
+        self.albu = albu
+        self.loader = loader
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __getitem__(self, index: int) -> torch.Tensor:
+        path = self.samples[index][0]
+        sample = self.loader(path)
+        if self.albu:
+            sample = np.asarray(sample)
+            for t in self.prefix:
+                sample = t(image=sample)["image"]
+        else:
+            for t in self.prefix:
+                sample = t(sample)
+        return torch.from_numpy(np.array(sample, dtype=np.uint8))
+
+
+class CachedImageFolder(VisionDataset):
+    """ImageFolder which reads preprocessed images from an on-disk cache.
+
+    The deterministic prefix of the transform(decode, SquarePad, Resize, ...)
+    is applied once and stored as a memory-mapped uint8 array of (N, H, W, 3).
+    Only the random tail of the transform is applied on every __getitem__.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        transform: Callable,
+        cache_dir: str,
+        img_size: int,
+        albu: bool = False,
+        target_transform: Optional[Callable] = None,
+        num_workers: int = 8,
+        reduced_decode: bool = True,
+    ) -> None:
+        """Initialize and build the cache if it does not exist.
+
+        Args:
+            root: image folder root. e.g) '/opt/ml/data/train'
+            transform: torchvision or albumentations Compose.
+            cache_dir: directory to save the cache files.
+            img_size: image size. Used as a part of the cache key.
+            albu: whether {transform} is an albumentations transform.
+            target_transform: transform for the target.
+            num_workers: number of workers used to build the cache.
+            reduced_decode: decode JPEG at the reduced size of the prefix resize.
+        """
+        super().__init__(root, transform=transform, target_transform=target_transform)
+        folder = ImageFolder(root=root)
+        self.classes = folder.classes
+        self.class_to_idx = folder.class_to_idx
+        self.samples = folder.samples
+        self.targets = folder.targets
+        self.imgs = self.samples
+        self.albu = albu
+
+        prefix, tail = split_transform(transform)
+        if not prefix:
+            raise ValueError(f"Transform can not be cached. {transform}")
+        if albu:
+            self.tail = A.Compose(tail)
+        else:
+            self.tail = SeededCompose(tail)
+        self.decode_size = decode_size(prefix) if reduced_decode else None
+
+        key = hashlib.sha1(
+            json.dumps(
+                {
+                    "root": os.path.abspath(root),
+                    "img_size": img_size,
+                    "albu": albu,
+                    "prefix": _transform_key(prefix),
+                    "decode_size": self.decode_size,
+                    "exif_transpose": albu,
+                    "n_samples": len(self.samples),
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir, f"{key}.npy")
+        if not os.path.exists(self.cache_path):
+            os.makedirs(cache_dir, exist_ok=True)
+            self._build_cache(prefix, num_workers)
+        self._data: Optional[np.ndarray] = None
+
+    def _build_cache(self, prefix: List[Callable], num_workers: int) -> None:
+        """Decode every image once and write the preprocessed array."""
+        loader = DataLoader(
+            _PrefixDataset(
+                self.samples,
+                prefix,
+                self.albu,
+                loader=partial(
+                    reduced_loader, size=self.decode_size, exif_transpose=self.albu
+                ),
+            ),
+            batch_size=64,
+            num_workers=num_workers,
+        )
+        tmp_path = self.cache_path + f".{os.getpid()}.tmp"
+        data = None
+        offset = 0
+        for batch in tqdm(loader, f"Building cache {self.cache_path}"):
+            if data is None:
+                data = np.lib.format.open_memmap(
+                    tmp_path,
+                    mode="w+",
+                    dtype=np.uint8,
+                    shape=(len(self.samples), *batch.shape[1:]),
+                )
+            data[offset : offset + len(batch)] = batch.numpy()
+            offset += len(batch)
+        data.flush()
+        del data
+        os.replace(tmp_path, self.cache_path)
+
+    @property
+    def data(self) -> np.ndarray:
+        """Memory-mapped cache. Opened lazily so that each worker maps it itself."""
+        if self._data is None:
+            self._data = np.load(self.cache_path, mmap_mode="r")
+        return self._data
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __getitem__(self, index: int) -> Tuple[Any, Any]:
+        sample = self.data[index]
+        target = self.targets[index]
+        if self.albu:
+            seed_albumentations(self.tail)
+            sample = self.tail(image=np.array(sample))["image"].float()
+        else:
+            sample = self.tail(Image.fromarray(sample))
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return sample, target
+
+
+def sample_seed(seed: int, view: int, index: int) -> int:
+    """Augmentation seed of a sample in a view. Same in every process."""
+    return int(np.random.SeedSequence([seed, view, index]).generate_state(1)[0])
+
+
+class SeededDataset(Dataset):
+    """Dataset whose random augmentation is reproducible per (view, index).
+
+    Indexed with the (view, index) keys of SeededSampler. Each sample is
+    loaded inside augmentation_seed(sample_seed()), so the same key gives the
+    same augmented sample in any worker process.
+    """
+
+    def __init__(self, dataset: Dataset, seed: int = 0) -> None:
+        """Initialize.
+
+        Args:
+            dataset: dataset which returns (sample, target).
+            seed: base seed of the augmentation.
+        """
+        self.dataset = dataset
+        self.seed = seed
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def __getitem__(
+        self, key: Union[int, Tuple[int, int]]
+    ) -> Tuple[Any, Any, torch.Tensor]:
+        """Returns (sample, target, [view, index]). An int key is view 0."""
+        view, index = key if isinstance(key, tuple) else (0, key)
+        with augmentation_seed(sample_seed(self.seed, view, index)):
+            sample, target = self.dataset[index]
+        return sample, target, torch.tensor([view, index])
+
+
+class SeededSampler(Sampler):
+    """Shuffled (view, index) keys of SeededDataset.
+
+    The view of an epoch is epoch % n_views, so the augmentation of a sample
+    repeats every {n_views} epochs. Call set_epoch() before every epoch.
+    """
+
+    def __init__(
+        self, n_samples: int, n_views: int = 1, shuffle: bool = True, seed: int = 0
+    ) -> None:
+        """Initialize.
+
+        Args:
+            n_samples: number of samples.
+            n_views: number of augmented views of each sample.
+            shuffle: shuffle the order in every epoch.
+            seed: seed of the order.
+        """
+        self.n_samples = n_samples
+        self.n_views = n_views
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch of the next iteration."""
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return self.n_samples
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        view = self.epoch % self.n_views
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            order = torch.randperm(self.n_samples, generator=generator).tolist()
+        else:
+            order = range(self.n_samples)
+        for index in order:
+            yield view, index
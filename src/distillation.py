@@ -0,0 +1,163 @@
+"""Teacher logits for knowledge distillation.
+
+The teacher logits of every (augmented view, sample) are computed once and
+stored as a memory-mapped float16 array, so the KD loop reads them instead
+of running the teacher on every batch.
+"""
+import json
+import os
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import Dataset
+from tqdm import tqdm
+
+from src.dataloader import get_seeded_dataloader
+
+
+@torch.no_grad()
+def teacher_forward(teacher: nn.Module, data: torch.Tensor) -> torch.Tensor:
+    """Teacher logits(float32) without autograd.
+
+    The input is cast to the teacher dtype, so a half teacher runs in half precision.
+    """
+    dtype = next(teacher.parameters()).dtype
+    return teacher(data.to(dtype)).flatten(1).float()
+
+
+class TeacherLogitStore:
+    """Memory-mapped float16 teacher logits of shape (n_views, n_samples, n_classes).
+
+    The settings are saved as {path}.json. The store is complete after every
+    view has been written and finalize() is called.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open the store if it exists.
+
+        Args:
+            path: npy file path of the logits.
+        """
+        self.path = path
+        self.meta_path = f"{path}.json"
+        self.meta: Dict[str, Any] = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        self._logits: Optional[np.ndarray] = None
+
+    @property
+    def complete(self) -> bool:
+        """Whether every view has been written."""
+        return self.meta.get("complete", False)
+
+    def compatible(self, n_samples: int, n_views: int, seed: int) -> bool:
+        """Whether the store has the logits of the given samples and views."""
+        return (
+            self.meta.get("n_samples") == n_samples
+            and self.meta.get("n_views", 0) >= n_views
+            and self.meta.get("seed") == seed
+        )
+
+    def create(self, n_samples: int, n_classes: int, n_views: int, seed: int) -> None:
+        """Create an empty store, overwriting the existing one."""
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._logits = np.lib.format.open_memmap(
+            self.path, mode="w+", dtype=np.float16, shape=(n_views, n_samples, n_classes)
+        )
+        self.meta = {
+            "n_samples": n_samples,
+            "n_classes": n_classes,
+            "n_views": n_views,
+            "seed": seed,
+            "complete": False,
+        }
+        self._save_meta()
+
+    def _save_meta(self) -> None:
+        with open(self.meta_path, "w") as f:
+            json.dump(self.meta, f)
+
+    @property
+    def logits(self) -> np.ndarray:
+        """Memory-mapped logits. Opened lazily so that each process maps it itself."""
+        if self._logits is None:
+            self._logits = np.load(self.path, mmap_mode="r")
+        return self._logits
+
+    def write(self, keys: torch.Tensor, logits: torch.Tensor) -> None:
+        """Write the logits of the (view, index) keys of shape (N, 2)."""
+        keys = keys.numpy()
+        self.logits[keys[:, 0], keys[:, 1]] = logits.cpu().numpy().astype(np.float16)
+
+    def finalize(self) -> None:
+        """Flush the logits and mark the store as complete."""
+        self.logits.flush()
+        self._logits = None
+        self.meta["complete"] = True
+        self._save_meta()
+
+    def read(self, keys: torch.Tensor) -> torch.Tensor:
+        """Logits(float32) of the (view, index) keys of shape (N, 2)."""
+        keys = keys.numpy()
+        return torch.from_numpy(
+            self.logits[keys[:, 0], keys[:, 1]].astype(np.float32)
+        )
+
+
+def precompute_teacher_logits(
+    teacher: nn.Module,
+    dataset: Dataset,
+    path: str,
+    n_views: int = 1,
+    seed: int = 0,
+    batch_size: int = 64,
+    num_workers: int = 10,
+    device: Union[str, torch.device] = "cpu",
+) -> TeacherLogitStore:
+    """Compute the teacher logits of every augmented view of the dataset.
+
+    The existing store is reused if it is complete and has the same samples,
+    views and seed.
+
+    Args:
+        teacher: teacher model.
+        dataset: train dataset with the random augmentation.
+        path: npy file path of the store.
+        n_views: number of augmented views of each sample.
+        seed: augmentation seed. Must be the seed of the training dataloader.
+        device: device to run the teacher.
+
+    Returns:
+        TeacherLogitStore
+    """
+    store = TeacherLogitStore(path)
+    if store.complete and store.compatible(len(dataset), n_views, seed):
+        print(f"Teacher logits loaded: {path}")
+        return store
+
+    teacher.to(device)
+    teacher.eval()
+    dataloader = get_seeded_dataloader(
+        dataset,
+        batch_size,
+        n_views=n_views,
+        seed=seed,
+        shuffle=False,
+        num_workers=num_workers,
+        drop_last=False,
+    )
+    created = False
+    for view in range(n_views):
+        dataloader.sampler.set_epoch(view)
+        for data, _, keys in tqdm(dataloader, f"Teacher logits [{view + 1}/{n_views}]"):
+            logits = teacher_forward(teacher, data.to(device, non_blocking=True))
+            if not created:
+                store.create(len(dataset), logits.size(1), n_views, seed)
+                created = True
+            store.write(keys, logits)
+    store.finalize()
+    return store
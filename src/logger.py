@@ -0,0 +1,272 @@
+"""Metrics logger.
+
+Metrics are buffered in memory and written by a background thread so that
+logging never blocks the training loop. Records are flushed to the backend
+every {flush_steps} records or {flush_secs} seconds.
+
+Backends
+    - wandb: wandb.log (requires wandb.init)
+    - jsonl: one json record per line in {log_dir}/metrics.jsonl
+    - csv: (step, time, key, value) rows in {log_dir}/metrics.csv
+"""
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import wandb
+
+from src.metrics import wandb_confusion_matrix
+
+
+class LoggerBackend(ABC):
+    """Abstract logger backend."""
+
+    @abstractmethod
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        """Write buffered scalar records. Each record has 'step' and 'time' keys."""
+
+    @abstractmethod
+    def write_confusion_matrix(
+        self, name: str, matrix: np.ndarray, class_names: List[str], step: int
+    ) -> None:
+        """Write a confusion matrix."""
+
+    def close(self) -> None:
+        """Close backend."""
+
+
+class WandbBackend(LoggerBackend):
+    """Log to wandb. wandb.init must have been called."""
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            wandb.log({k: v for k, v in record.items() if k not in ("step", "time")})
+
+    def write_confusion_matrix(
+        self, name: str, matrix: np.ndarray, class_names: List[str], step: int
+    ) -> None:
+        wandb.log({name: wandb_confusion_matrix(matrix, class_names)})
+
+
+class JSONLBackend(LoggerBackend):
+    """Log to a local jsonl file. Works without network access."""
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, "a")
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        self.file.writelines(json.dumps(record) + "\n" for record in records)
+        self.file.flush()
+
+    def write_confusion_matrix(
+        self, name: str, matrix: np.ndarray, class_names: List[str], step: int
+    ) -> None:
+        self.write(
+            [
+                {
+                    "step": step,
+                    "time": time.time(),
+                    name: {"class_names": class_names, "matrix": matrix.tolist()},
+                }
+            ]
+        )
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class CSVBackend(LoggerBackend):
+    """Log to a local csv file of (step, time, key, value) rows."""
+
+    def __init__(self, path: str) -> None:
+        write_header = not os.path.exists(path)
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if write_header:
+            self.writer.writerow(["step", "time", "key", "value"])
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            for key, value in record.items():
+                if key in ("step", "time"):
+                    continue
+                self.writer.writerow([record["step"], record["time"], key, value])
+        self.file.flush()
+
+    def write_confusion_matrix(
+        self, name: str, matrix: np.ndarray, class_names: List[str], step: int
+    ) -> None:
+        self.write(
+            [{"step": step, "time": time.time(), name: json.dumps(matrix.tolist())}]
+        )
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class MetricsLogger:
+    """Buffered metrics logger running the backend on a background thread."""
+
+    _FLUSH = "flush"
+    _CLOSE = "close"
+
+    def __init__(
+        self,
+        backend: LoggerBackend,
+        flush_steps: int = 50,
+        flush_secs: float = 30.0,
+    ) -> None:
+        """Initialize and start the background thread.
+
+        Args:
+            backend: logger backend to write the records.
+            flush_steps: flush after {flush_steps} records are buffered.
+            flush_secs: flush if {flush_secs} seconds have passed since the last flush.
+        """
+        self.backend = backend
+        self.flush_steps = max(int(flush_steps), 1)
+        self.flush_secs = flush_secs
+        self.step = 0
+        self._closed = False
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log(self, metrics: Dict[str, Any]) -> None:
+        """Buffer scalar metrics. Never blocks. Ignored after close().
+
+        Args:
+            metrics: metric name and value. Tensor values are converted
+                on the background thread.
+        """
+        if self._closed:
+            return
+        self.step += 1
+        self._queue.put(("log", self.step, time.time(), metrics))
+
+    def log_confusion_matrix(
+        self, name: str, matrix: np.ndarray, class_names: List[str]
+    ) -> None:
+        """Buffer a confusion matrix. Ignored after close()."""
+        if self._closed:
+            return
+        self._queue.put(("matrix", self.step, name, matrix, list(class_names)))
+
+    def flush(self) -> None:
+        """Write every buffered record and wait until it is done.
+
+        Returns immediately after close() or if the background thread died.
+        """
+        self._request(self._FLUSH)
+
+    def close(self) -> None:
+        """Flush and stop the background thread. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        self._request(self._CLOSE)
+        self._thread.join()
+        self.backend.close()
+
+    def _request(self, command: str) -> None:
+        """Send {command} to the background thread and wait until it is done."""
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put((command, done))
+        # Wake up periodically so that a dead thread can not block forever.
+        while not done.wait(timeout=1.0):
+            if not self._thread.is_alive():
+                return
+
+    def _write(self, buffer: List[Any]) -> None:
+        """Write buffered items to the backend in order."""
+        records: List[Dict[str, Any]] = []
+        try:
+            for item in buffer:
+                if item[0] == "log":
+                    _, step, t, metrics = item
+                    record = {"step": step, "time": t}
+                    for key, value in metrics.items():
+                        record[key] = value.item() if hasattr(value, "item") else value
+                    records.append(record)
+                else:
+                    if records:
+                        self.backend.write(records)
+                        records = []
+                    _, step, name, matrix, class_names = item
+                    self.backend.write_confusion_matrix(name, matrix, class_names, step)
+            if records:
+                self.backend.write(records)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Failed to write metrics: {e}")
+
+    def _run(self) -> None:
+        """Background thread loop."""
+        buffer: List[Any] = []
+        last_flush = time.monotonic()
+        while True:
+            timeout = (
+                max(self.flush_secs - (time.monotonic() - last_flush), 0.0)
+                if buffer
+                else None
+            )
+            try:
+                item: Optional[Any] = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item[0] in (self._FLUSH, self._CLOSE):
+                self._write(buffer)
+                buffer = []
+                last_flush = time.monotonic()
+                item[1].set()
+                if item[0] == self._CLOSE:
+                    return
+                continue
+
+            if item is not None:
+                if not buffer:
+                    last_flush = time.monotonic()
+                buffer.append(item)
+            if buffer and (
+                len(buffer) >= self.flush_steps
+                or time.monotonic() - last_flush >= self.flush_secs
+            ):
+                self._write(buffer)
+                buffer = []
+                last_flush = time.monotonic()
+
+
+def create_logger(config: Dict[str, Any], log_dir: str) -> MetricsLogger:
+    """Create metrics logger from the data config.
+
+    Args:
+        config: data config. Reads LOGGER("wandb", "jsonl", "csv"),
+            LOG_FLUSH_STEPS and LOG_FLUSH_SECS.
+        log_dir: directory to write the local log files.
+
+    Returns:
+        MetricsLogger
+    """
+    logger_type = config.get("LOGGER", "wandb")
+    if logger_type == "wandb":
+        backend: LoggerBackend = WandbBackend()
+    elif logger_type == "jsonl":
+        backend = JSONLBackend(os.path.join(log_dir, "metrics.jsonl"))
+    elif logger_type == "csv":
+        backend = CSVBackend(os.path.join(log_dir, "metrics.csv"))
+    else:
+        raise NotImplementedError(f"Unknown LOGGER {logger_type}")
+
+    return MetricsLogger(
+        backend,
+        flush_steps=config.get("LOG_FLUSH_STEPS", 50),
+        flush_secs=config.get("LOG_FLUSH_SECS", 30.0),
+    )
@@ -4,13 +4,15 @@
 - Contact: lim.jeikei@gmail.com
 """
 
-from typing import Dict, List, Type, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Type, Union
 
 import torch
 import torch.nn as nn
 import yaml
 
-from src.modules import ModuleGenerator
+from src.modules import GeneratorAbstract, ModuleGenerator
+from src.utils.cost import Cost
+from src.utils.torch_utils import fuse_model
 
 
 class Model(nn.Module):
@@ -40,6 +42,14 @@ class Model(nn.Module):
 
         return self.model(x)
 
+    def fuse(self) -> "Model":
+        """Fold BatchNorm into the convolutions for inference.
+
+        The model is switched to eval mode and can not be trained afterward.
+        """
+        fuse_model(self.model)
+        return self
+
 
 class ModelParser:
     """Generate PyTorch model from the model yaml file."""
@@ -48,12 +58,15 @@ class ModelParser:
         self,
         cfg: Union[str, Dict[str, Type]] = "./model_configs/show_case.yaml",
         verbose: bool = False,
+        build: bool = True,
     ) -> None:
         """Generate PyTorch model from the model yaml file.
 
         Args:
             cfg: model config file or dict values read from the model config file.
             verbose: print the parsed model information.
+            build: build the PyTorch model. If False, only estimate() can be used
+                and {model} is None.
         """
 
         self.verbose = verbose
@@ -72,23 +85,15 @@ class ModelParser:
         # variable has type "List[Union[int, str, float]]")
         self.model_cfg: List[Union[int, str, float]] = self.cfg["backbone"]  # type: ignore
 
-        self.model = self._parse_model()
+        self.model = self._parse_model() if build else None
 
     def log(self, msg: str):
         """Log."""
         if self.verbose:
             print(msg)
 
-    def _parse_model(self) -> nn.Sequential:
-        """Parse model."""
-        layers: List[nn.Module] = []
-        log: str = (
-            f"{'idx':>3} | {'n':>3} | {'params':>10} "
-            f"| {'module':>15} | {'arguments':>20} | {'in_channel':>12} | {'out_channel':>13}"
-        )
-        self.log(log)
-        self.log(len(log) * "-")  # type: ignore
-
+    def generators(self) -> Iterator[Tuple[int, int, List, GeneratorAbstract]]:
+        """Module generator of each layer with the depth multiplied repeat."""
         in_channel = self.in_channel
         for i, (repeat, module, args) in enumerate(self.model_cfg):  # type: ignore
             repeat = (
@@ -99,10 +104,77 @@ class ModelParser:
                 *args,
                 width_multiply=self.width_multiply,
             )
+            yield i, repeat, args, module_generator
+            in_channel = module_generator.out_channel
+
+    def resolve_input_size(
+        self, input_size: Optional[List[int]] = None
+    ) -> Tuple[int, int]:
+        """Input (height, width) of the model.
+
+        Args:
+            input_size: input (height, width). INPUT_SIZE of the config if None
+                is given. Only the configs generated by AutoML_NAS have INPUT_SIZE.
+
+        Raises:
+            ValueError: if neither {input_size} nor INPUT_SIZE of the config is given.
+        """
+        if input_size is None:
+            input_size = self.cfg.get("INPUT_SIZE")
+        if input_size is None:
+            raise ValueError(
+                "Model config has no INPUT_SIZE. Pass input_size=[height, width]."
+            )
+        return tuple(input_size)  # type: ignore
+
+    def estimate(self, input_size: Optional[List[int]] = None) -> Cost:
+        """Analytic params, MACs and activations without instantiating any module.
+
+        Args:
+            input_size: input (height, width). INPUT_SIZE of the config if None is given.
+
+        Raises:
+            ValueError: if neither {input_size} nor INPUT_SIZE of the config is given.
+
+        Returns:
+            Cost of the model for batch size 1.
+        """
+        size = self.resolve_input_size(input_size)
+        total = Cost()
+        log: str = (
+            f"{'idx':>3} | {'n':>3} | {'params':>10} | {'MACs':>13} "
+            f"| {'module':>15} | {'out_channel':>11} | {'out_size':>10}"
+        )
+        self.log(log)
+        self.log(len(log) * "-")  # type: ignore
+        for i, repeat, _, module_generator in self.generators():
+            cost, size = module_generator.estimate(size, repeat=repeat)  # type: ignore
+            total += cost
+            self.log(
+                f"{i:3d} | {repeat:3d} | {cost.params:10,d} | {cost.total_macs:13,d} "
+                f"| {module_generator.name:>15} | {module_generator.out_channel:11d} "
+                f"| {str(size):>10}"
+            )
+        self.log(
+            f"Model Summary: {total.params:,d} parameters, {total.total_macs:,d} MACs, "
+            f"{total.activation_bytes / 2 ** 20:.2f} MiB activations"
+        )
+        return total
+
+    def _parse_model(self) -> nn.Sequential:
+        """Parse model."""
+        layers: List[nn.Module] = []
+        log: str = (
+            f"{'idx':>3} | {'n':>3} | {'params':>10} "
+            f"| {'module':>15} | {'arguments':>20} | {'in_channel':>12} | {'out_channel':>13}"
+        )
+        self.log(log)
+        self.log(len(log) * "-")  # type: ignore
+
+        for i, repeat, args, module_generator in self.generators():
             m = module_generator(repeat=repeat)
 
             layers.append(m)
-            in_channel = module_generator.out_channel
 
             log = (
                 f"{i:3d} | {repeat:3d} | "
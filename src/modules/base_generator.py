@@ -6,10 +6,11 @@ This module is responsible for GeneratorAbstract and ModuleGenerator.
 - Contact: lim.jeikei@gmail.com
 """
 from abc import ABC, abstractmethod
-from typing import List, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from torch import nn as nn
 
+from src.utils.cost import Cost, Size
 from src.utils.torch_utils import make_divisible
 
 
@@ -17,6 +18,11 @@ class GeneratorAbstract(ABC):
     """Abstract Module Generator."""
 
     CHANNEL_DIVISOR: int = 8
+    # Index of the out channel in args which is scaled by width_multiply.
+    # None if the module does not have one.
+    CHANNEL_ARG_INDEX: Optional[int] = None
+    # Default values of the optional args by their index.
+    ARG_DEFAULTS: Dict[int, Any] = {}
 
     def __init__(
         self,
@@ -58,6 +64,27 @@ class GeneratorAbstract(ABC):
 
         return module
 
+    @property
+    def resolved_args(self) -> List:
+        """Module arguments with the out channel after width_multiply.
+
+        Building with {resolved_args} and width_multiply 1.0 gives the same module.
+        """
+        args = list(self.args)
+        if self.CHANNEL_ARG_INDEX is not None:
+            args[self.CHANNEL_ARG_INDEX] = self.out_channel
+        return args
+
+    @property
+    def canonical_args(self) -> List:
+        """{resolved_args} with the omitted optional args filled by their defaults.
+
+        Configs which build the same module give the same {canonical_args}.
+        """
+        args = self.resolved_args
+        n_args = max(self.ARG_DEFAULTS, default=-1) + 1
+        return args + [self.ARG_DEFAULTS[i] for i in range(len(args), n_args)]
+
     @classmethod
     def _get_divisible_channel(cls, n_channel: int) -> int:
         """Get divisible channel by default divisor.
@@ -80,6 +107,18 @@ class GeneratorAbstract(ABC):
     def __call__(self, repeat: int = 1):
         """Returns nn.Module component"""
 
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it.
+
+        Args:
+            size: input (height, width).
+            repeat: number of repeat.
+
+        Returns:
+            cost and output (height, width)
+        """
+        raise NotImplementedError(f"{self.name} does not support analytic cost.")
+
 
 class ModuleGenerator:
     """Module generator class."""
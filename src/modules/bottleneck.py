@@ -4,13 +4,14 @@
 - Contact: lim.jeikei@gmail.com
 """
 # pylint: disable=useless-super-delegation
-from typing import Union
+from typing import Tuple, Union
 
 import torch
 from torch import nn as nn
 
 from src.modules.base_generator import GeneratorAbstract
 from src.modules.conv import Conv
+from src.utils.cost import Cost, Size, conv2d, elementwise
 
 
 class Bottleneck(nn.Module):
@@ -46,6 +47,8 @@ class Bottleneck(nn.Module):
 class BottleneckGenerator(GeneratorAbstract):
     """Bottleneck block generator."""
 
+    CHANNEL_ARG_INDEX = 0
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -68,3 +71,25 @@ class BottleneckGenerator(GeneratorAbstract):
                 module.append(self.base_module(*repeat_args))
         module.append(self.base_module(*args))
         return self._get_module(module)
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        shortcut = self.args[1] if len(self.args) > 1 else True
+        groups = self.args[2] if len(self.args) > 2 else 1
+        expansion = self.args[3] if len(self.args) > 3 else 0.5
+        activation = self.args[4] if len(self.args) > 4 else "ReLU"
+        for i in range(repeat):
+            in_channel = self.in_channel
+            out_channel = self.out_channel if i == repeat - 1 else self.in_channel
+            expansion_channel = int(out_channel * expansion)
+            conv2d(cost, in_channel, expansion_channel, 1, size)
+            if activation is not None:
+                elementwise(cost, expansion_channel, size)
+            conv2d(
+                cost, expansion_channel, out_channel, 3, size, padding=1, groups=groups
+            )
+            elementwise(cost, out_channel, size)
+            if shortcut and in_channel == out_channel:
+                elementwise(cost, out_channel, size)
+        return cost, size
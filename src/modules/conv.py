@@ -4,12 +4,13 @@
 - Contact: lim.jeikei@gmail.com
 """
 # pylint: disable=useless-super-delegation
-from typing import Union
+from typing import Tuple, Union
 
 import torch
 from torch import nn as nn
 
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size, conv2d, elementwise
 from src.utils.torch_utils import Activation, autopad
 
 
@@ -63,9 +64,19 @@ class Conv(nn.Module):
         return self.act(self.conv(x))
 
 
+def _padding(kernel_size: int, padding: Union[int, None]) -> int:
+    """Symmetric padding of Conv and DWConv."""
+    padding = autopad(kernel_size, padding)
+    return padding[0] if isinstance(padding, list) else padding
+
+
 class ConvGenerator(GeneratorAbstract):
     """Conv2d generator for parsing module."""
 
+    CHANNEL_ARG_INDEX = 0
+    # [out_channel, kernel_size, stride, padding, groups, activation]
+    ARG_DEFAULTS = {2: 1, 3: None, 4: 1, 5: "ReLU"}
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -100,6 +111,31 @@ class ConvGenerator(GeneratorAbstract):
 
         return self._get_module(module)
 
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        kernel_size = self.args[1]
+        stride = self.args[2] if len(self.args) > 2 else 1
+        padding = _padding(kernel_size, self.args[3] if len(self.args) > 3 else None)
+        groups = self.args[4] if len(self.args) > 4 else 1
+        activation = self.args[5] if len(self.args) > 5 else "ReLU"
+        in_channel = self.in_channel
+        for i in range(repeat):
+            size = conv2d(
+                cost,
+                in_channel,
+                self.out_channel,
+                kernel_size,
+                size,
+                stride=stride if i == repeat - 1 else 1,
+                padding=padding,
+                groups=groups,
+            )
+            if activation is not None:
+                elementwise(cost, self.out_channel, size)
+            in_channel = self.out_channel
+        return cost, size
+
 
 class FixedConvGenerator(GeneratorAbstract):
     """FixedConv2d generator for parsing module.
@@ -149,6 +185,9 @@ class FixedConvGenerator(GeneratorAbstract):
     Fixed Conv doesn't change out channel
     """
 
+    # [out_channel, kernel_size, stride, padding, groups, activation]
+    ARG_DEFAULTS = {2: 1, 3: None, 4: 1, 5: "ReLU"}
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -184,3 +223,7 @@ class FixedConvGenerator(GeneratorAbstract):
             module = self.base_module(*args)
 
         return self._get_module(module)
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        return ConvGenerator.estimate(self, size, repeat=repeat)
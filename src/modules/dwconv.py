@@ -5,12 +5,13 @@
 """
 import math
 # pylint: disable=useless-super-delegation
-from typing import Union
+from typing import Tuple, Union
 
 import torch
 from torch import nn as nn
 
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size, conv2d, elementwise
 from src.utils.torch_utils import Activation, autopad
 
 
@@ -65,6 +66,10 @@ class DWConv(nn.Module):
 class DWConvGenerator(GeneratorAbstract):
     """Depth-wise convolution generator for parsing module."""
 
+    CHANNEL_ARG_INDEX = 0
+    # [out_channel, kernel_size, stride, padding, activation]
+    ARG_DEFAULTS = {2: 1, 3: None, 4: "ReLU"}
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -98,3 +103,29 @@ class DWConvGenerator(GeneratorAbstract):
             module = self.base_module(*args)
 
         return self._get_module(module)
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        kernel_size = self.args[1]
+        stride = self.args[2] if len(self.args) > 2 else 1
+        padding = autopad(kernel_size, self.args[3] if len(self.args) > 3 else None)
+        if isinstance(padding, list):
+            padding = padding[0]
+        activation = self.args[4] if len(self.args) > 4 else "ReLU"
+        in_channel = self.in_channel
+        for i in range(repeat):
+            size = conv2d(
+                cost,
+                in_channel,
+                self.out_channel,
+                kernel_size,
+                size,
+                stride=stride if i == repeat - 1 else 1,
+                padding=padding,
+                groups=math.gcd(in_channel, self.out_channel),
+            )
+            if activation is not None:
+                elementwise(cost, self.out_channel, size)
+            in_channel = self.out_channel
+        return cost, size
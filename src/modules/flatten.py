@@ -3,9 +3,12 @@
 - Author: Jongkuk Lim
 - Contact: lim.jeikei@gmail.com
 """
+from typing import Tuple
+
 from torch import nn as nn
 
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size
 
 
 class FlattenGenerator(GeneratorAbstract):
@@ -20,3 +23,7 @@ class FlattenGenerator(GeneratorAbstract):
 
     def __call__(self, repeat: int = 1):
         return self._get_module(nn.Flatten())
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        return Cost(), size
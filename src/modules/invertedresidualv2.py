@@ -1,6 +1,9 @@
+from typing import Tuple
+
 import torch.nn as nn
 
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size, conv2d, elementwise
 
 
 class InvertedResidualv2(nn.Module):
@@ -77,6 +80,8 @@ class ConvBNReLU(nn.Sequential):
 class InvertedResidualv2Generator(GeneratorAbstract):
     """Bottleneck block generator."""
 
+    CHANNEL_ARG_INDEX = 0
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -105,3 +110,24 @@ class InvertedResidualv2Generator(GeneratorAbstract):
             )
             inp = oup
         return self._get_module(module)
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        _, t, s = self.args
+        inp, oup = self.in_channel, self.out_channel
+        for i in range(repeat):
+            stride = s if i == 0 else 1
+            hidden_dim = int(round(inp * t))
+            if t != 1:
+                conv2d(cost, inp, hidden_dim, 1, size)
+                elementwise(cost, hidden_dim, size)
+            size = conv2d(
+                cost, hidden_dim, hidden_dim, 3, size, stride, 1, groups=hidden_dim
+            )
+            elementwise(cost, hidden_dim, size)
+            conv2d(cost, hidden_dim, oup, 1, size)
+            if stride == 1 and inp == oup:
+                elementwise(cost, oup, size)
+            inp = oup
+        return cost, size
@@ -5,12 +5,15 @@ Reference:
 - Author: Junghoon Kim
 - Contact: placidus36@gmail.com
 """
+from typing import Tuple
+
 import torch
 import torch.nn as nn
 from torch.nn import functional as F
 
 from src.modules.activations import HardSigmoid, HardSwish
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size, conv2d, elementwise, squeeze_excitation
 from src.utils.torch_utils import make_divisible
 
 
@@ -103,6 +106,8 @@ class SqueezeExcitation(nn.Module):
 class InvertedResidualv3Generator(GeneratorAbstract):
     """Bottleneck block generator."""
 
+    CHANNEL_ARG_INDEX = 2
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -142,3 +147,26 @@ class InvertedResidualv3Generator(GeneratorAbstract):
             )
             inp = oup
         return self._get_module(module)
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        k, t, _, se, _, s = self.args
+        inp, oup = self.in_channel, self.out_channel
+        for i in range(repeat):
+            stride = s if i == 0 else 1
+            exp_size = self._get_divisible_channel(inp * t)
+            if inp != exp_size:
+                conv2d(cost, inp, exp_size, 1, size)
+                elementwise(cost, exp_size, size)
+            size = conv2d(
+                cost, exp_size, exp_size, k, size, stride, (k - 1) // 2, groups=exp_size
+            )
+            if se:
+                squeeze_excitation(cost, exp_size, make_divisible(exp_size // 4, 8), size)
+            elementwise(cost, exp_size, size)
+            conv2d(cost, exp_size, oup, 1, size)
+            if stride == 1 and inp == oup:
+                elementwise(cost, oup, size)
+            inp = oup
+        return cost, size
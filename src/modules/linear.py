@@ -3,12 +3,13 @@
 - Author: Jongkuk Lim
 - Contact: lim.jeikei@gmail.com
 """
-from typing import Union
+from typing import Tuple, Union
 
 import torch
 from torch import nn as nn
 
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size, elementwise, linear
 from src.utils.torch_utils import Activation
 
 
@@ -52,3 +53,11 @@ class LinearGenerator(GeneratorAbstract):
         return self._get_module(
             Linear(self.in_channel, self.out_channel, activation=act)
         )
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        linear(cost, self.in_channel, self.out_channel)
+        if len(self.args) > 1 and self.args[1] is not None:
+            elementwise(cost, self.out_channel, (1, 1))
+        return cost, (1, 1)
@@ -1,9 +1,11 @@
 import math
+from typing import Tuple
 
 import torch
 import torch.nn as nn
 
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size, conv2d, elementwise, squeeze_excitation
 
 
 class MBConv(nn.Module):
@@ -145,6 +147,8 @@ class SqueezeExcitation(nn.Module):
 class MBConvGenerator(GeneratorAbstract):
     """Bottleneck block generator."""
 
+    CHANNEL_ARG_INDEX = 1
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -180,3 +184,33 @@ class MBConvGenerator(GeneratorAbstract):
             )
             inp = oup
         return self._get_module(module)
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        t, _, s, k = self.args
+        inp, oup = self.in_channel, self.out_channel
+        for i in range(repeat):
+            stride = s if i == 0 else 1
+            hidden_dim = inp * t
+            in_size = size
+            if inp != hidden_dim:
+                conv2d(cost, inp, hidden_dim, 1, size)
+                elementwise(cost, hidden_dim, size)
+            size = conv2d(
+                cost,
+                hidden_dim,
+                hidden_dim,
+                k,
+                size,
+                stride,
+                groups=hidden_dim,
+                pad_total=max(k - stride, 0),
+            )
+            elementwise(cost, hidden_dim, size)
+            squeeze_excitation(cost, hidden_dim, max(1, inp // 4), size)
+            conv2d(cost, hidden_dim, oup, 1, size)
+            if stride == 1 and inp == oup:
+                elementwise(cost, oup, size)
+            inp = oup
+        return cost, size
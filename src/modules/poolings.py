@@ -4,14 +4,20 @@
 - Contact: lim.jeikei@gmail.com
 """
 # pylint: disable=useless-super-delegation
+from typing import Tuple
+
 from torch import nn
 
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size, global_pool, pool2d
 
 
 class MaxPoolGenerator(GeneratorAbstract):
     """Max pooling module generator."""
 
+    # [kernel_size, stride, padding]
+    ARG_DEFAULTS = {1: None, 2: 0}
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -34,6 +40,16 @@ class MaxPoolGenerator(GeneratorAbstract):
         )
         return self._get_module(module)
 
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        kernel_size = self.args[0]
+        stride = self.args[1] if len(self.args) > 1 else None
+        padding = self.args[2] if len(self.args) > 2 else 0
+        for _ in range(repeat):
+            size = pool2d(cost, self.in_channel, kernel_size, size, stride, padding)
+        return cost, size
+
 
 class AvgPoolGenerator(MaxPoolGenerator):
     """Average pooling module generator."""
@@ -66,3 +82,8 @@ class GlobalAvgPoolGenerator(GeneratorAbstract):
 
     def __call__(self, repeat: int = 1):
         return self._get_module(GlobalAvgPool(self.output_size))
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        return cost, global_pool(cost, self.in_channel, size, self.output_size)
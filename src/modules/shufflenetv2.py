@@ -1,9 +1,12 @@
+from typing import Tuple
+
 import torch
 from torch import Tensor
 import torch.nn as nn
 from torch.nn import functional as F
 
 from src.modules.base_generator import GeneratorAbstract
+from src.utils.cost import Cost, Size, conv2d, elementwise
 from src.utils.torch_utils import make_divisible
 
 class ShuffleNetV2(nn.Module):
@@ -110,4 +113,32 @@ class ShuffleNetV2Generator(GeneratorAbstract):
                 )
             )
             inp = inp*s
-        return self._get_module(module)
\ No newline at end of file
+        return self._get_module(module)
+
+    def estimate(self, size: Size, repeat: int = 1) -> Tuple[Cost, Size]:
+        """Analytic cost of the module without instantiating it."""
+        cost = Cost()
+        s = self.args[0]
+        inp = self.in_channel
+        for _ in range(repeat):
+            if s == 1:
+                c1 = inp // 2
+                conv2d(cost, c1, c1, 1, size)
+                elementwise(cost, c1, size)
+                conv2d(cost, c1, c1, 3, size, 1, 1, groups=c1)
+                conv2d(cost, c1, c1, 1, size)
+                elementwise(cost, c1, size)
+            else:
+                out_size = conv2d(cost, inp, inp, 3, size, 2, 1, groups=inp)
+                conv2d(cost, inp, inp, 1, out_size)
+                elementwise(cost, inp, out_size)
+                conv2d(cost, inp, inp, 1, size)
+                elementwise(cost, inp, size)
+                conv2d(cost, inp, inp, 3, size, 2, 1, groups=inp)
+                conv2d(cost, inp, inp, 1, out_size)
+                elementwise(cost, inp, out_size)
+                size = out_size
+            inp = inp * s
+            # channel concat and shuffle
+            elementwise(cost, inp, size)
+        return cost, size
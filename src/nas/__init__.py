@@ -0,0 +1,64 @@
+"""Neural architecture search utilities."""
+
+from src.nas.cache import ArchitectureCache, architecture_hash, context_hash
+from src.nas.data import StudyDataService
+from src.nas.latency import (
+    LatencyPrediction,
+    LatencyTable,
+    config_layers,
+    layer_key,
+    measure_layer,
+)
+from src.nas.parallel import (
+    NAS_STUDY,
+    SUPERNET_STUDY,
+    create_storage,
+    create_study,
+    partition_cpus,
+    split_trials,
+    study_name,
+)
+from src.nas.proxy import compute_proxy, gradnorm_score, synflow_score
+from src.nas.pruner import SuccessiveHalvingPruner, reject_by_proxy
+from src.nas.search_space import (
+    sample_model_configs,
+    search_model,
+    suggest_model_config,
+)
+from src.nas.supernet import (
+    ElasticInvertedResidual,
+    SuperNet,
+    recalibrate_bn,
+    train_supernet,
+)
+
+__all__ = [
+    "ArchitectureCache",
+    "architecture_hash",
+    "context_hash",
+    "StudyDataService",
+    "LatencyPrediction",
+    "LatencyTable",
+    "config_layers",
+    "layer_key",
+    "measure_layer",
+    "NAS_STUDY",
+    "SUPERNET_STUDY",
+    "create_storage",
+    "create_study",
+    "partition_cpus",
+    "split_trials",
+    "study_name",
+    "compute_proxy",
+    "gradnorm_score",
+    "synflow_score",
+    "SuccessiveHalvingPruner",
+    "reject_by_proxy",
+    "sample_model_configs",
+    "search_model",
+    "suggest_model_config",
+    "ElasticInvertedResidual",
+    "SuperNet",
+    "recalibrate_bn",
+    "train_supernet",
+]
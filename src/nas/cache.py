@@ -0,0 +1,143 @@
+"""Architecture-level evaluation cache.
+
+Different search_model configurations often resolve to the same network
+after "Pass" modules, depth_multiple rounding and make_divisible are
+applied. The architecture hash is computed from the parsed model so that
+such trials share one cache entry.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch.nn as nn
+
+_PRIMITIVES = (bool, int, float, str, type(None))
+
+
+def architecture_hash(model: nn.Module) -> str:
+    """Canonical hash of the parsed model structure.
+
+    Every submodule contributes its class, extra_repr and the primitive
+    attributes which can change forward(e.g. stride, residual flags).
+    Weights do not change the hash.
+
+    Args:
+        model: parsed model. e.g. Model(cfg).model
+
+    Returns:
+        sha1 hex digest.
+    """
+    layers: List[Any] = []
+    for name, module in model.named_modules():
+        attrs = {
+            k: v
+            for k, v in vars(module).items()
+            if not k.startswith("_")
+            and k != "training"
+            and (
+                isinstance(v, _PRIMITIVES)
+                or (isinstance(v, tuple) and all(isinstance(x, _PRIMITIVES) for x in v))
+            )
+        }
+        layers.append([name, type(module).__name__, module.extra_repr(), attrs])
+    return hashlib.sha1(
+        json.dumps(layers, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def context_hash(context: Dict[str, Any]) -> str:
+    """Hash of the evaluation settings(data config, input size, device, ...).
+
+    Args:
+        context: json serializable settings which change the evaluation result.
+
+    Returns:
+        sha1 hex digest.
+    """
+    return hashlib.sha1(
+        json.dumps(context, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class ArchitectureCache:
+    """Persistent sqlite cache of (architecture, context) -> evaluation result.
+
+    Safe to share between the processes of a parallel study.
+    """
+
+    COMPLETE = "complete"
+
+    def __init__(self, path: str) -> None:
+        """Open or create the cache.
+
+        Args:
+            path: sqlite database file path.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS architectures ("
+                "arch_hash TEXT, context TEXT, status TEXT, "
+                "f1 REAL, params INTEGER, mean_time REAL, "
+                "PRIMARY KEY (arch_hash, context))"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection committed and closed on exit. Waits for the other writers."""
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, arch_hash: str, context: str) -> Optional[Dict[str, Any]]:
+        """Get cached result.
+
+        Args:
+            arch_hash: architecture_hash of the model.
+            context: context_hash of the evaluation settings.
+
+        Returns:
+            dict of status, f1, params and mean_time. None if not cached.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, f1, params, mean_time FROM architectures "
+                "WHERE arch_hash = ? AND context = ?",
+                (arch_hash, context),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("status", "f1", "params", "mean_time"), row))
+
+    def put(
+        self,
+        arch_hash: str,
+        context: str,
+        status: str,
+        f1: Optional[float] = None,
+        params: Optional[int] = None,
+        mean_time: Optional[float] = None,
+    ) -> None:
+        """Save result.
+
+        Args:
+            arch_hash: architecture_hash of the model.
+            context: context_hash of the evaluation settings.
+            status: ArchitectureCache.COMPLETE or the reason of the rejection.
+            f1: validation f1.
+            params: number of parameters.
+            mean_time: mean runtime(ms).
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO architectures VALUES (?, ?, ?, ?, ?, ?)",
+                (arch_hash, context, status, f1, params, mean_time),
+            )
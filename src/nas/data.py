@@ -0,0 +1,71 @@
+"""Study-level data service shared by every NAS trial.
+
+Datasets are indexed and the images are decoded and resized only once per
+study into the memory-mapped cache of CachedImageFolder. The pages of the
+cache are shared by every worker process through the OS page cache, and the
+worker pools are kept alive between trials.
+
+Each trial worker process of AutoML_NAS --n_workers creates its own
+StudyDataService. The parent calls StudyDataService.build_cache() before
+spawning them, so the workers only map the existing cache files instead of
+decoding the images again in every process.
+"""
+import os
+import tempfile
+from typing import Any, Dict, Optional, Tuple
+
+from torch.utils.data import DataLoader
+
+from src.dataloader import create_dataloader, create_dataset, get_batch_transform
+
+
+def _with_cache_dir(config: Dict[str, Any], cache_dir: Optional[str]) -> Dict[str, Any]:
+    """Copy of {config} whose CACHE_DIR is set."""
+    config = dict(config)
+    if not config.get("CACHE_DIR"):
+        config["CACHE_DIR"] = cache_dir or os.path.join(
+            tempfile.gettempdir(), "nas_cache"
+        )
+    return config
+
+
+class StudyDataService:
+    """Dataloaders built once and reused by every trial of a study."""
+
+    def __init__(self, config: Dict[str, Any], cache_dir: Optional[str] = None) -> None:
+        """Build the cache and start the persistent worker pools.
+
+        Args:
+            config: data config.
+            cache_dir: cache directory used if CACHE_DIR is not set in {config}.
+                {tempdir}/nas_cache if None is given.
+        """
+        config = _with_cache_dir(config, cache_dir)
+        self.config = config
+        self.train_loader, self.val_loader, self.test_loader = create_dataloader(
+            config, persistent_workers=True
+        )
+        # device-side augmentation of the batch_* policies
+        self.batch_transform = get_batch_transform(config)
+
+    @staticmethod
+    def build_cache(config: Dict[str, Any], cache_dir: Optional[str] = None) -> str:
+        """Build the image cache of a study without starting the worker pools.
+
+        Args:
+            config: data config.
+            cache_dir: same as __init__.
+
+        Returns:
+            cache directory.
+        """
+        config = _with_cache_dir(config, cache_dir)
+        create_dataset(config)
+        return config["CACHE_DIR"]
+
+    def loaders(self) -> Tuple[DataLoader, DataLoader, DataLoader]:
+        """Get the shared train, validation and test dataloaders.
+
+        The loaders must not be modified by a trial.
+        """
+        return self.train_loader, self.val_loader, self.test_loader
@@ -0,0 +1,262 @@
+"""Per-layer latency lookup table.
+
+Latency of a parsed model is predicted as the sum of the measured latency of
+each layer(module generator, input channel, canonical args, repeat and input
+size). The table is built from the layers of model configs sampled from the
+search space, or from a layer grid. Layers which are not in the table are
+estimated with the analytic LatencyModel or measured on demand.
+"""
+import itertools
+import json
+import os
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import torch
+from tqdm import tqdm
+
+from src.model import ModelParser
+from src.modules import GeneratorAbstract, ModuleGenerator
+from src.utils.cost import LatencyModel, Size
+from src.utils.torch_utils import benchmark_runtime
+
+
+class LatencyPrediction(NamedTuple):
+    """Predicted latency of a model.
+
+    layers is a list of (module name, latency(ms), source) where source is
+    "table", "measured" or "estimated".
+    """
+
+    latency_ms: float
+    n_missing: int
+    layers: List[Tuple[str, float, str]]
+
+
+def layer_key(generator: GeneratorAbstract, repeat: int, size: Size) -> str:
+    """Table key of a layer.
+
+    Independent of width_multiply and of the optional args which are omitted
+    or given with their default values.
+    """
+    return json.dumps(
+        [
+            generator.name,
+            generator.in_channel,
+            generator.canonical_args,
+            repeat,
+            list(size),
+        ]
+    )
+
+
+def config_layers(
+    cfg: Union[str, Dict[str, Any]], input_size: Optional[List[int]] = None
+) -> Iterator[Tuple[GeneratorAbstract, int, Size]]:
+    """Layers of a model config.
+
+    Args:
+        cfg: model yaml file path or dict.
+        input_size: input (height, width). INPUT_SIZE of the config if None is given.
+
+    Raises:
+        ValueError: if neither {input_size} nor INPUT_SIZE of the config is given.
+
+    Yields:
+        module generator, depth multiplied repeat and input (height, width)
+    """
+    parser = ModelParser(cfg, build=False)
+    size = parser.resolve_input_size(input_size)
+    for _, repeat, _, generator in parser.generators():
+        yield generator, repeat, size
+        _, size = generator.estimate(size, repeat=repeat)
+
+
+def measure_layer(
+    generator: GeneratorAbstract,
+    repeat: int,
+    size: Size,
+    device: Union[str, torch.device] = "cpu",
+    num_threads: Optional[int] = None,
+    n_repeat: int = 50,
+    warmup: int = 5,
+) -> float:
+    """Measure the latency(ms) of a layer with batch size 1."""
+    module = generator(repeat=repeat)
+    if generator.name == "Linear":
+        input_size = [generator.in_channel]
+    else:
+        input_size = [generator.in_channel, *size]
+    return benchmark_runtime(
+        module,
+        input_size,
+        device,
+        repeat=n_repeat,
+        warmup=warmup,
+        num_threads=num_threads,
+    ).mean_ms
+
+
+class LatencyTable:
+    """Layer latency lookup table saved as a json file."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """Load the table if {path} exists.
+
+        Args:
+            path: json file path of the table.
+        """
+        self.path = path
+        self.table: Dict[str, float] = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.table = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Save the table."""
+        path = path or self.path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.table, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def build(
+        self,
+        grid: Dict[str, Any],
+        device: Union[str, torch.device] = "cpu",
+        num_threads: Optional[int] = None,
+        n_repeat: int = 50,
+        warmup: int = 5,
+        save_every: int = 100,
+    ) -> None:
+        """Measure every layer of the grid which is not in the table yet.
+
+        Args:
+            grid: layer grid.
+                input_size: list of the input resolutions.
+                layers: list of
+                    module: module name.
+                    in_channel: list of the input channels.
+                    repeat: list of the repeats.
+                    args: list of the value list of each module argument.
+            device: device to measure.
+            num_threads: number of CPU threads.
+            n_repeat: number of measurements of each layer.
+            warmup: number of warmup runs of each layer.
+            save_every: save the table every {save_every} measurements.
+        """
+        candidates = []
+        for layer in grid["layers"]:
+            for in_channel, repeat, resolution, *args in itertools.product(
+                layer["in_channel"],
+                layer.get("repeat", [1]),
+                grid["input_size"],
+                *layer.get("args", []),
+            ):
+                generator = ModuleGenerator(layer["module"], in_channel)(*args)
+                candidates.append((generator, repeat, (resolution, resolution)))
+        self._measure(candidates, device, num_threads, n_repeat, warmup, save_every)
+
+    def build_from_configs(
+        self,
+        configs: List[Dict[str, Any]],
+        device: Union[str, torch.device] = "cpu",
+        num_threads: Optional[int] = None,
+        n_repeat: int = 50,
+        warmup: int = 5,
+        save_every: int = 100,
+    ) -> None:
+        """Measure every layer of the model configs which is not in the table yet.
+
+        Args:
+            configs: model configs with INPUT_SIZE.
+                e.g. sample_model_configs() of the AutoML_NAS search space.
+            device: device to measure.
+            num_threads: number of CPU threads.
+            n_repeat: number of measurements of each layer.
+            warmup: number of warmup runs of each layer.
+            save_every: save the table every {save_every} measurements.
+        """
+        candidates = [layer for cfg in configs for layer in config_layers(cfg)]
+        self._measure(candidates, device, num_threads, n_repeat, warmup, save_every)
+
+    def _measure(
+        self,
+        candidates: List[Tuple[GeneratorAbstract, int, Size]],
+        device: Union[str, torch.device],
+        num_threads: Optional[int],
+        n_repeat: int,
+        warmup: int,
+        save_every: int,
+    ) -> None:
+        """Measure the candidate layers which are not in the table yet."""
+        n_measured = 0
+        for generator, repeat, size in tqdm(candidates, "Building latency table"):
+            key = layer_key(generator, repeat, size)
+            if key in self.table:
+                continue
+            try:
+                self.table[key] = measure_layer(
+                    generator, repeat, size, device, num_threads, n_repeat, warmup
+                )
+            except (AssertionError, RuntimeError, ValueError) as e:
+                print(f"Skip invalid layer {key}: {e}")
+                continue
+            n_measured += 1
+            if self.path is not None and n_measured % save_every == 0:
+                self.save()
+        if self.path is not None:
+            self.save()
+
+    def predict(
+        self,
+        cfg: Union[str, Dict[str, Any]],
+        input_size: Optional[List[int]] = None,
+        fallback: Optional[LatencyModel] = None,
+        measure_missing: bool = False,
+        device: Union[str, torch.device] = "cpu",
+        num_threads: Optional[int] = None,
+    ) -> LatencyPrediction:
+        """Predict the latency of a model config without building the model.
+
+        Args:
+            cfg: model yaml file path or dict.
+            input_size: input (height, width). INPUT_SIZE of the config if None is given.
+            fallback: latency model of the layers missing in the table.
+                LatencyModel() if None is given.
+            measure_missing: measure the missing layers and add them to the table
+                instead of estimating. Only the missing layers are built.
+            device: device to measure the missing layers.
+            num_threads: number of CPU threads to measure the missing layers.
+
+        Raises:
+            ValueError: if neither {input_size} nor INPUT_SIZE of the config is given.
+
+        Returns:
+            LatencyPrediction
+        """
+        fallback = fallback or LatencyModel()
+        layers = []
+        n_missing = 0
+        for generator, repeat, size in config_layers(cfg, input_size):
+            key = layer_key(generator, repeat, size)
+            if key in self.table:
+                layers.append((generator.name, self.table[key], "table"))
+            elif measure_missing:
+                self.table[key] = measure_layer(
+                    generator, repeat, size, device, num_threads
+                )
+                layers.append((generator.name, self.table[key], "measured"))
+            else:
+                n_missing += 1
+                cost, _ = generator.estimate(size, repeat=repeat)
+                layers.append((generator.name, fallback(cost), "estimated"))
+        return LatencyPrediction(
+            latency_ms=sum(layer[1] for layer in layers),
+            n_missing=n_missing,
+            layers=layers,
+        )
@@ -0,0 +1,100 @@
+"""Parallel NAS trial workers.
+
+Trials of a study run in worker processes which share an RDB storage.
+Each worker is pinned to a disjoint set of CPU cores.
+"""
+from typing import List, Optional
+
+import optuna
+
+# Supernet trials suggest the same parameter names as the regular search with
+# other distributions, and their scores come from inherited weights, so they
+# are kept in a study of their own.
+NAS_STUDY = "NAS"
+SUPERNET_STUDY = "NAS_supernet"
+
+
+def create_storage(storage: Optional[str]) -> Optional[optuna.storages.RDBStorage]:
+    """Create RDB storage shared by the trial workers.
+
+    Trials whose worker stopped sending heartbeats are failed and re-queued.
+
+    Args:
+        storage: RDB storage url. In-memory storage if None is given.
+
+    Returns:
+        RDB storage or None.
+    """
+    if storage is None:
+        return None
+    engine_kwargs = None
+    if storage.startswith("sqlite"):
+        # wait for the lock of the other workers instead of failing
+        engine_kwargs = {"connect_args": {"timeout": 60}}
+    return optuna.storages.RDBStorage(
+        url=storage,
+        engine_kwargs=engine_kwargs,
+        heartbeat_interval=60,
+        grace_period=180,
+        failed_trial_callback=optuna.storages.RetryFailedTrialCallback(max_retry=2),
+    )
+
+
+def partition_cpus(cpus: List[int], n_workers: int) -> List[Optional[List[int]]]:
+    """Split CPU cores into disjoint sets, one for each worker.
+
+    Cores are dealt round-robin so that every worker gets cores of every
+    socket when the ids are numbered socket by socket.
+
+    Args:
+        cpus: available CPU core ids. e.g) os.sched_getaffinity(0)
+        n_workers: number of workers.
+
+    Returns:
+        CPU cores of each worker. None(not pinned) for every worker if there
+        are fewer cores than workers.
+    """
+    cpus = sorted(cpus)
+    if len(cpus) < n_workers:
+        return [None] * n_workers
+    return [cpus[i::n_workers] for i in range(n_workers)]
+
+
+def split_trials(n_trials: int, n_workers: int) -> List[int]:
+    """Number of trials of each worker. The first workers run one more."""
+    return [
+        n_trials // n_workers + int(i < n_trials % n_workers) for i in range(n_workers)
+    ]
+
+
+def study_name(supernet: bool) -> str:
+    """Name of the study of the regular or the supernet search."""
+    return SUPERNET_STUDY if supernet else NAS_STUDY
+
+
+def create_study(
+    seed: int,
+    storage: Optional[str],
+    name: str = NAS_STUDY,
+    sampler: Optional[optuna.samplers.BaseSampler] = None,
+) -> optuna.study.Study:
+    """Create or load the NAS study.
+
+    Args:
+        seed: sampler seed.
+        storage: RDB storage url. In-memory storage if None is given.
+        name: study name. See study_name().
+        sampler: MOTPESampler(seed) if None is given.
+
+    Returns:
+        study maximizing f1 and minimizing the parameters and the runtime.
+    """
+    if sampler is None:
+        sampler = optuna.samplers.MOTPESampler(seed=seed)
+    return optuna.create_study(
+        directions=["maximize", "minimize", "minimize"],
+        study_name=name,
+        sampler=sampler,
+        storage=create_storage(storage),
+        load_if_exists=True,
+    )
@@ -0,0 +1,95 @@
+"""Zero-cost proxy scores.
+
+Proxies rank untrained architectures from a single forward/backward pass so
+that unpromising ones can be rejected before any training starts.
+
+- gradnorm: sum of the gradient norms of a batch loss.
+- synflow: sum of |theta * dR/dtheta| of the linearized network on an all-ones
+  input (data independent).
+"""
+import copy
+from typing import List
+
+import torch
+import torch.nn as nn
+
+
+def gradnorm_score(
+    model: nn.Module,
+    data: torch.Tensor,
+    labels: torch.Tensor,
+    criterion: nn.Module,
+) -> float:
+    """Gradient norm score of a batch.
+
+    Args:
+        model: model to score. Computed on a copy so that the weights and
+            the batch norm statistics are not changed.
+        data: input batch.
+        labels: target batch.
+        criterion: loss function.
+
+    Returns:
+        Sum of the L2 norm of each parameter gradient.
+    """
+    model = copy.deepcopy(model).train()
+    outputs = torch.squeeze(model(data))
+    criterion(outputs, labels).backward()
+    score = sum(
+        float(p.grad.norm()) for p in model.parameters() if p.grad is not None
+    )
+    return score
+
+
+def synflow_score(model: nn.Module, input_size: List[int]) -> float:
+    """SynFlow score.
+
+    Computed on a float64 copy of the model with absolute weights and the
+    batch norm in eval mode so that the score does not overflow.
+
+    Args:
+        model: model to score. Weights are not changed.
+        input_size: input size without the batch dimension. e.g. [3, 112, 112].
+
+    Returns:
+        SynFlow score.
+    """
+    device = next(model.parameters()).device
+    model = copy.deepcopy(model).double().eval()
+    with torch.no_grad():
+        for param in model.state_dict().values():
+            param.abs_()
+    model.zero_grad()
+    x = torch.ones([1] + list(input_size), dtype=torch.float64, device=device)
+    torch.sum(model(x)).backward()
+    return sum(
+        float((p.detach() * p.grad).abs().sum())
+        for p in model.parameters()
+        if p.grad is not None
+    )
+
+
+def compute_proxy(
+    name: str,
+    model: nn.Module,
+    data: torch.Tensor,
+    labels: torch.Tensor,
+    criterion: nn.Module,
+) -> float:
+    """Compute zero-cost proxy score by name.
+
+    Args:
+        name: proxy name. "gradnorm" or "synflow".
+        model: model to score.
+        data: input batch on the model device.
+        labels: target batch on the model device.
+        criterion: loss function.
+
+    Returns:
+        Proxy score. Higher is better.
+    """
+    if name == "gradnorm":
+        return gradnorm_score(model, data, labels, criterion)
+    elif name == "synflow":
+        return synflow_score(model, list(data.shape[1:]))
+    raise NotImplementedError(f"Unknown proxy {name}")
@@ -0,0 +1,116 @@
+"""Trial pruners for the multi-objective NAS study.
+
+Optuna pruners and trial.report do not support multi-objective studies, so
+intermediate values are stored in the trial user attributes and compared
+across the trials of the study.
+"""
+from typing import List, Optional
+
+import numpy as np
+import optuna
+
+
+class SuccessiveHalvingPruner:
+    """Asynchronous successive halving on the per-epoch validation score.
+
+    Rungs are placed at epochs min_resource * reduction_factor ** k.
+    A trial reaching a rung continues only if its score is in the top
+    1 / reduction_factor of the scores the other trials reached at that rung.
+    """
+
+    def __init__(
+        self,
+        min_resource: int = 1,
+        reduction_factor: int = 3,
+        min_trials: Optional[int] = None,
+    ) -> None:
+        """Initialize.
+
+        Args:
+            min_resource: epochs before the first rung.
+            reduction_factor: only top 1 / {reduction_factor} trials are promoted.
+            min_trials: minimum number of the scores at a rung to start
+                pruning. {reduction_factor} if None is given.
+        """
+        self.min_resource = max(int(min_resource), 1)
+        self.reduction_factor = max(int(reduction_factor), 2)
+        self.min_trials = (
+            self.reduction_factor if min_trials is None else int(min_trials)
+        )
+
+    def rung(self, epoch: int) -> Optional[int]:
+        """Rung index of the epoch(1-based). None if the epoch is not a rung."""
+        resource = self.min_resource
+        k = 0
+        while resource < epoch:
+            resource *= self.reduction_factor
+            k += 1
+        return k if resource == epoch else None
+
+    @staticmethod
+    def _key(rung: int) -> str:
+        return f"rung_{rung}"
+
+    def _rung_scores(self, trial: optuna.trial.Trial, rung: int) -> List[float]:
+        """Scores other trials reached at the rung."""
+        key = self._key(rung)
+        return [
+            t.user_attrs[key]
+            for t in trial.study.get_trials(deepcopy=False)
+            if t.number != trial.number and key in t.user_attrs
+        ]
+
+    def report(self, trial: optuna.trial.Trial, epoch: int, score: float) -> None:
+        """Report the validation score of an epoch.
+
+        Args:
+            trial: current trial.
+            epoch: finished epoch(1-based).
+            score: validation score. Higher is better.
+
+        Raises:
+            optuna.TrialPruned: the trial is not promoted at this rung.
+        """
+        trial.set_user_attr("last_epoch", epoch)
+        rung = self.rung(epoch)
+        if rung is None:
+            return
+        scores = self._rung_scores(trial, rung)
+        trial.set_user_attr(self._key(rung), score)
+        if len(scores) < self.min_trials:
+            return
+        cutoff = np.quantile(scores, 1.0 - 1.0 / self.reduction_factor)
+        if score < cutoff:
+            raise optuna.TrialPruned(
+                f"Epoch {epoch}: score {score:.4f} < rung {rung} cutoff {cutoff:.4f}"
+            )
+
+
+def reject_by_proxy(
+    trial: optuna.trial.Trial,
+    score: float,
+    quantile: float = 0.25,
+    n_warmup: int = 10,
+) -> None:
+    """Reject the architecture before training if its proxy score is low.
+
+    Args:
+        trial: current trial. The score is saved as the 'proxy' user attribute.
+        score: zero-cost proxy score. Higher is better.
+        quantile: reject below this quantile of the previous scores.
+        n_warmup: never reject until {n_warmup} trials have been scored.
+
+    Raises:
+        optuna.TrialPruned: the score is below the quantile.
+    """
+    scores = [
+        t.user_attrs["proxy"]
+        for t in trial.study.get_trials(deepcopy=False)
+        if t.number != trial.number and "proxy" in t.user_attrs
+    ]
+    trial.set_user_attr("proxy", score)
+    if len(scores) < n_warmup:
+        return
+    cutoff = np.quantile(scores, quantile)
+    if score < cutoff:
+        raise optuna.TrialPruned(f"Proxy score {score:.4g} < cutoff {cutoff:.4g}")
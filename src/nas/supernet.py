@@ -0,0 +1,437 @@
+"""Weight-sharing supernet of the NAS search space.
+
+Each of the seven search slots is a stack of elastic InvertedResidualv3 blocks
+holding the largest channels, kernel size and expand ratio of the slot. A
+sub-architecture slices the shared weights, so it is evaluated without
+training and exported to a normal model config which ModelParser builds.
+"""
+import random
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import optuna
+import torch
+import torch.nn as nn
+from torch.nn import functional as F
+from torch.utils.data import DataLoader
+
+from src.model import Model
+from src.modules import Conv, GlobalAvgPool, InvertedResidualv3
+from src.modules.activations import hard_sigmoid, hard_swish
+from src.utils.common import read_yaml
+from src.utils.torch_utils import make_divisible
+
+# {"slots": [{"depth", "kernel_size", "expand_ratio", "out_channel", "se", "hs"}],
+#  "last_dim": int}
+Arch = Dict[str, Any]
+
+SLOT_CHOICES = ("kernel_size", "expand_ratio", "out_channel", "se", "hs")
+
+
+def _batch_norm(x: torch.Tensor, bn: nn.BatchNorm2d, channel: int) -> torch.Tensor:
+    """Batch normalization with the first {channel} channels of {bn}.
+
+    Running statistics of the slice are updated in place in training mode.
+    """
+    return F.batch_norm(
+        x,
+        bn.running_mean[:channel],
+        bn.running_var[:channel],
+        bn.weight[:channel],
+        bn.bias[:channel],
+        bn.training,
+        bn.momentum,
+        bn.eps,
+    )
+
+
+def _copy_bn(dst: nn.BatchNorm2d, src: nn.BatchNorm2d, channel: int) -> None:
+    """Copy the first {channel} channels of {src} to {dst}."""
+    dst.weight.copy_(src.weight[:channel])
+    dst.bias.copy_(src.bias[:channel])
+    dst.running_mean.copy_(src.running_mean[:channel])
+    dst.running_var.copy_(src.running_var[:channel])
+    dst.num_batches_tracked.copy_(src.num_batches_tracked)
+
+
+def _copy_conv(dst: nn.Conv2d, src: nn.Conv2d, weight: torch.Tensor) -> None:
+    """Copy the sliced {weight} of {src} and the matching bias to {dst}."""
+    dst.weight.copy_(weight)
+    if dst.bias is not None:
+        dst.bias.copy_(src.bias[: weight.size(0)])
+
+
+class ElasticInvertedResidual(nn.Module):
+    """InvertedResidualv3 with sliceable channels, kernel size and expand ratio.
+
+    A sub-block uses the first channels of every weight and the center of the
+    depthwise kernel, in the same layer order as InvertedResidualv3.
+    """
+
+    def __init__(
+        self,
+        max_in_channel: int,
+        max_out_channel: int,
+        max_kernel_size: int,
+        max_expand_ratio: float,
+        stride: int,
+    ) -> None:
+        """Initialize the superset block.
+
+        Args:
+            max_in_channel: largest input channels.
+            max_out_channel: largest output channels.
+            max_kernel_size: largest depthwise kernel size.
+            max_expand_ratio: largest expand ratio.
+            stride: depthwise stride.
+        """
+        super().__init__()
+        self.stride = stride
+        self.max_kernel_size = max_kernel_size
+        max_hidden = max(make_divisible(max_in_channel * max_expand_ratio), max_in_channel)
+        max_squeeze = make_divisible(max_hidden // 4, 8)
+
+        self.expand = nn.Conv2d(max_in_channel, max_hidden, 1, bias=False)
+        self.expand_bn = nn.BatchNorm2d(max_hidden)
+        self.depthwise = nn.Conv2d(
+            max_hidden, max_hidden, max_kernel_size, groups=max_hidden, bias=False
+        )
+        self.depthwise_bn = nn.BatchNorm2d(max_hidden)
+        self.se_reduce = nn.Conv2d(max_hidden, max_squeeze, 1)
+        self.se_expand = nn.Conv2d(max_squeeze, max_hidden, 1)
+        self.project = nn.Conv2d(max_hidden, max_out_channel, 1, bias=False)
+        self.project_bn = nn.BatchNorm2d(max_out_channel)
+
+    def _depthwise_weight(self, channel: int, kernel_size: int) -> torch.Tensor:
+        """Center {kernel_size} crop of the depthwise kernel."""
+        start = (self.max_kernel_size - kernel_size) // 2
+        end = start + kernel_size
+        return self.depthwise.weight[:channel, :, start:end, start:end]
+
+    def _squeeze_weights(self, channel: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Weights of the squeeze-and-excitation reduce and expand convolutions."""
+        squeeze = make_divisible(channel // 4, 8)
+        return (
+            self.se_reduce.weight[:squeeze, :channel],
+            self.se_expand.weight[:channel, :squeeze],
+        )
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        kernel_size: int,
+        expand_ratio: float,
+        out_channel: int,
+        se: int,
+        hs: int,
+    ) -> torch.Tensor:
+        """Forward the sub-block of the given choices."""
+        in_channel = x.size(1)
+        hidden = make_divisible(in_channel * expand_ratio)
+        act = hard_swish if hs else F.relu
+
+        out = x
+        if in_channel != hidden:
+            out = F.conv2d(out, self.expand.weight[:hidden, :in_channel])
+            out = act(_batch_norm(out, self.expand_bn, hidden))
+        out = F.conv2d(
+            out,
+            self._depthwise_weight(hidden, kernel_size),
+            None,
+            self.stride,
+            (kernel_size - 1) // 2,
+            groups=hidden,
+        )
+        out = _batch_norm(out, self.depthwise_bn, hidden)
+        if in_channel == hidden:
+            out = act(out)
+        if se:
+            reduce_weight, expand_weight = self._squeeze_weights(hidden)
+            scale = F.adaptive_avg_pool2d(out, 1)
+            scale = F.relu(
+                F.conv2d(scale, reduce_weight, self.se_reduce.bias[: reduce_weight.size(0)])
+            )
+            scale = F.conv2d(scale, expand_weight, self.se_expand.bias[:hidden])
+            out = hard_sigmoid(scale) * out
+        if in_channel != hidden:
+            out = act(out)
+        out = F.conv2d(out, self.project.weight[:out_channel, :hidden])
+        out = _batch_norm(out, self.project_bn, out_channel)
+
+        if self.stride == 1 and in_channel == out_channel:
+            out = x + out
+        return out
+
+    @torch.no_grad()
+    def export_to(
+        self,
+        module: InvertedResidualv3,
+        in_channel: int,
+        kernel_size: int,
+        expand_ratio: float,
+        out_channel: int,
+        se: int,
+    ) -> None:
+        """Copy the weights of the sub-block to an InvertedResidualv3 module."""
+        hidden = make_divisible(in_channel * expand_ratio)
+        layers = list(module.conv)
+        if in_channel != hidden:
+            _copy_conv(layers[0], self.expand, self.expand.weight[:hidden, :in_channel])
+            _copy_bn(layers[1], self.expand_bn, hidden)
+            # dw, bn, SE, act, pw, bn
+            layers = layers[3:]
+            se_module = layers[2]
+        else:
+            # dw, bn, act, SE, pw, bn
+            se_module = layers[3]
+        _copy_conv(layers[0], self.depthwise, self._depthwise_weight(hidden, kernel_size))
+        _copy_bn(layers[1], self.depthwise_bn, hidden)
+        if se:
+            reduce_weight, expand_weight = self._squeeze_weights(hidden)
+            _copy_conv(se_module.fc1, self.se_reduce, reduce_weight)
+            _copy_conv(se_module.fc2, self.se_expand, expand_weight)
+        _copy_conv(layers[-2], self.project, self.project.weight[:out_channel, :hidden])
+        _copy_bn(layers[-1], self.project_bn, out_channel)
+
+
+class SuperNet(nn.Module):
+    """One-shot supernet of fixed stem, seven elastic slots and elastic head."""
+
+    def __init__(self, cfg: Union[str, Dict[str, Any]] = "configs/nas/supernet.yaml") -> None:
+        """Build the superset blocks from the search space config.
+
+        Args:
+            cfg: search space yaml file path or dict.
+                input_channel: input channels.
+                stem: Conv args of the fixed first layer.
+                slots: list of the slot search spaces.
+                    stride: stride of the first block.
+                    depth: choices of the number of blocks. 0 skips the slot.
+                    kernel_size, expand_ratio, out_channel, se, hs: choices of
+                        the InvertedResidualv3 args.
+                last_dim: choices of the head Conv out channels.
+                num_classes: number of classes.
+        """
+        super().__init__()
+        self.cfg = read_yaml(cfg=cfg)
+        self.stem = Conv(self.cfg["input_channel"], *self.cfg["stem"])
+
+        max_in_channel = self.cfg["stem"][0]
+        self.slots = nn.ModuleList()
+        for slot in self.cfg["slots"]:
+            assert all(c % 8 == 0 for c in slot["out_channel"]), (
+                "Slot out_channel choices must be divisible by 8 to be exported."
+            )
+            max_out_channel = max(slot["out_channel"])
+            blocks = nn.ModuleList()
+            for i in range(max(slot["depth"])):
+                blocks.append(
+                    ElasticInvertedResidual(
+                        max_in_channel if i == 0 else max_out_channel,
+                        max_out_channel,
+                        max(slot["kernel_size"]),
+                        max(slot["expand_ratio"]),
+                        slot["stride"] if i == 0 else 1,
+                    )
+                )
+            self.slots.append(blocks)
+            # a skipped slot passes the previous channels to the next slot
+            if 0 in slot["depth"]:
+                max_in_channel = max(max_in_channel, max_out_channel)
+            else:
+                max_in_channel = max_out_channel
+
+        max_last_dim = max(self.cfg["last_dim"])
+        self.head = Conv(max_in_channel, max_last_dim, 1, 1)
+        self.pool = GlobalAvgPool()
+        self.classifier = Conv(max_last_dim, self.cfg["num_classes"], 1, 1, None, 1, None)
+        self.arch = self.max_arch()
+
+    def _arch(self, pick) -> Arch:
+        """Architecture with {pick}(choices) for every choice."""
+        return {
+            "slots": [
+                {key: pick(slot[key]) for key in ("depth",) + SLOT_CHOICES}
+                for slot in self.cfg["slots"]
+            ],
+            "last_dim": pick(self.cfg["last_dim"]),
+        }
+
+    def max_arch(self) -> Arch:
+        """Largest sub-architecture."""
+        return self._arch(max)
+
+    def min_arch(self) -> Arch:
+        """Smallest sub-architecture."""
+        return self._arch(min)
+
+    def sample_arch(self, rng: Optional[random.Random] = None) -> Arch:
+        """Uniformly sampled sub-architecture."""
+        return self._arch((rng or random).choice)
+
+    def suggest_arch(self, trial: optuna.trial.Trial) -> Arch:
+        """Sub-architecture suggested by an optuna trial."""
+        return {
+            "slots": [
+                {
+                    key: trial.suggest_categorical(f"m{i + 1}/{key}", slot[key])
+                    for key in ("depth",) + SLOT_CHOICES
+                }
+                for i, slot in enumerate(self.cfg["slots"])
+            ],
+            "last_dim": trial.suggest_categorical("last_dim", self.cfg["last_dim"]),
+        }
+
+    def set_arch(self, arch: Arch) -> "SuperNet":
+        """Activate the sub-architecture used by forward()."""
+        self.arch = arch
+        return self
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """Forward the active sub-architecture."""
+        x = self.stem(x)
+        for blocks, choice in zip(self.slots, self.arch["slots"]):
+            for block in blocks[: choice["depth"]]:
+                x = block(x, *(choice[key] for key in SLOT_CHOICES))
+        last_dim = self.arch["last_dim"]
+        x = F.conv2d(x, self.head.conv.weight[:last_dim, : x.size(1)])
+        x = self.head.act(_batch_norm(x, self.head.bn, last_dim))
+        x = self.pool(x)
+        x = F.conv2d(x, self.classifier.conv.weight[:, :last_dim])
+        return self.classifier.act(self.classifier.bn(x))
+
+    def to_model_config(self, arch: Arch) -> Dict[str, Any]:
+        """Model config of the sub-architecture readable by ModelParser."""
+        backbone: List[List[Any]] = [[1, "Conv", list(self.cfg["stem"])]]
+        for slot, choice in zip(self.cfg["slots"], arch["slots"]):
+            if choice["depth"] == 0:
+                continue
+            backbone.append(
+                [
+                    choice["depth"],
+                    "InvertedResidualv3",
+                    [
+                        choice["kernel_size"],
+                        choice["expand_ratio"],
+                        choice["out_channel"],
+                        choice["se"],
+                        choice["hs"],
+                        slot["stride"],
+                    ],
+                ]
+            )
+        backbone.append([1, "Conv", [arch["last_dim"], 1, 1]])
+        backbone.append([1, "GlobalAvgPool", []])
+        backbone.append([1, "FixedConv", [self.cfg["num_classes"], 1, 1, None, 1, None]])
+        return {
+            "input_channel": self.cfg["input_channel"],
+            "depth_multiple": 1.0,
+            "width_multiple": 1.0,
+            "backbone": backbone,
+        }
+
+    @torch.no_grad()
+    def export(self, arch: Arch) -> Model:
+        """Build the sub-architecture with ModelParser and inherit the weights.
+
+        The exported model gives the same output as the supernet with the
+        active {arch}. Model.model.state_dict() can be saved with the config
+        of to_model_config().
+        """
+        model = Model(self.to_model_config(arch))
+        layers = iter(model.model)
+        next(layers).load_state_dict(self.stem.state_dict())
+
+        in_channel = self.cfg["stem"][0]
+        for blocks, choice in zip(self.slots, arch["slots"]):
+            if choice["depth"] == 0:
+                continue
+            modules = next(layers)
+            for block, module in zip(blocks, modules):
+                block.export_to(
+                    module,
+                    in_channel,
+                    choice["kernel_size"],
+                    choice["expand_ratio"],
+                    choice["out_channel"],
+                    choice["se"],
+                )
+                in_channel = choice["out_channel"]
+
+        last_dim = arch["last_dim"]
+        head = next(layers)
+        head.conv.weight.copy_(self.head.conv.weight[:last_dim, :in_channel])
+        _copy_bn(head.bn, self.head.bn, last_dim)
+        next(layers)
+        classifier = next(layers)
+        classifier.conv.weight.copy_(self.classifier.conv.weight[:, :last_dim])
+        classifier.bn.load_state_dict(self.classifier.bn.state_dict())
+        return model.to(self.stem.conv.weight.device)
+
+
+def train_supernet(
+    supernet: SuperNet,
+    dataloader: DataLoader,
+    optimizer: torch.optim.Optimizer,
+    criterion: nn.Module,
+    scheduler=None,
+    device: torch.device = "cpu",
+    n_random: int = 2,
+) -> float:
+    """Train the supernet one epoch with the sandwich rule.
+
+    The gradients of the largest, the smallest and {n_random} sampled
+    sub-architectures are accumulated at every step.
+
+    Returns:
+        mean loss of the largest sub-architecture.
+    """
+    supernet.to(device)
+    supernet.train()
+    running_loss = torch.zeros((), device=device)
+    for data, labels in dataloader:
+        data = data.to(device, non_blocking=True)
+        labels = labels.to(device, non_blocking=True)
+        optimizer.zero_grad()
+        archs = [supernet.max_arch(), supernet.min_arch()]
+        archs += [supernet.sample_arch() for _ in range(n_random)]
+        for i, arch in enumerate(archs):
+            outputs = torch.squeeze(supernet.set_arch(arch)(data))
+            loss = criterion(outputs, labels)
+            loss.backward()
+            if i == 0:
+                running_loss += loss.detach()
+        optimizer.step()
+        if scheduler is not None:
+            scheduler.step()
+    supernet.set_arch(supernet.max_arch())
+    return running_loss.item() / max(len(dataloader), 1)
+
+
+@torch.no_grad()
+def recalibrate_bn(
+    model: nn.Module,
+    dataloader: DataLoader,
+    n_batches: int = 20,
+    device: torch.device = "cpu",
+) -> nn.Module:
+    """Re-estimate the BatchNorm running statistics of a model.
+
+    The running statistics of the shared weights are mixed over every sampled
+    sub-architecture, so an inherited model is recalibrated before evaluation.
+    """
+    bns = [m for m in model.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+    momenta = [bn.momentum for bn in bns]
+    for bn in bns:
+        bn.reset_running_stats()
+        # cumulative moving average
+        bn.momentum = None
+    model.to(device)
+    model.train()
+    for i, (data, _) in enumerate(dataloader):
+        if i >= n_batches:
+            break
+        model(data.to(device, non_blocking=True))
+    for bn, momentum in zip(bns, momenta):
+        bn.momentum = momentum
+    model.eval()
+    return model
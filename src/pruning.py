@@ -0,0 +1,482 @@
+"""Structured channel pruning of the parsed models.
+
+Channels are removed physically and the pruned model is rebuilt by ModelParser
+from a new model config, so the config and the pruned weights always agree.
+    1. The channel graph of the model is traced. Channels joined by a residual
+       add or a depthwise convolution are pruned together.
+    2. The out channels of the layers are shrunk by {ratio} to the multiples of
+       8 as the generators round them. The expand ratios of the inverted
+       residual blocks are set so that their expansion layers shrink by
+       {ratio} as well.
+    3. The model is rebuilt from the new config and the most important
+       channels are copied. The importance is the L1 norm of the convolution
+       filters or |gamma| of BatchNorm.
+
+Conv, DWConv, InvertedResidualv2/v3 and the input of Linear are pruned through
+poolings and Flatten. The other blocks keep their channels.
+
+- Reference:
+    https://arxiv.org/abs/1608.08710 (L1 norm)
+    https://arxiv.org/abs/1708.06519 (BatchNorm gamma)
+"""
+import math
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+from src.model import Model, ModelParser
+from src.modules import (
+    Conv,
+    DWConv,
+    GeneratorAbstract,
+    InvertedResidualv2,
+    InvertedResidualv3,
+    Linear,
+)
+from src.modules.invertedresidualv3 import SqueezeExcitation
+from src.modules.poolings import GlobalAvgPool
+from src.utils.torch_utils import make_divisible
+
+CRITERIA = ("l1", "bn")
+# layers which keep the channels of the input
+TRANSPARENT_LAYERS = (nn.Flatten, nn.MaxPool2d, nn.AvgPool2d, nn.Identity)
+
+
+class _Record(NamedTuple):
+    """Channel spaces of the input and output dimension of a module."""
+
+    kind: str  # "conv", "dwconv", "bn" or "linear"
+    in_space: Optional[int]
+    out_space: Optional[int]
+
+
+class _InvertedResidual(NamedTuple):
+    """Block of an InvertedResidualv2/v3 layer for the expand ratio search."""
+
+    in_space: int
+    in_channels: int
+    hidden_channels: int
+
+
+class _Constraint(NamedTuple):
+    """Condition on the widths of two spaces which the pruned model must keep."""
+
+    in_space: int
+    out_space: int
+    check: Callable[[int, int], bool]
+
+
+class _ChannelGraph:
+    """Channel spaces of a traced model.
+
+    A space is a set of channels pruned together, e.g. the channels of a
+    residual add. Spaces with the same width but independent channels, e.g.
+    the repeats of a Conv layer, are tied.
+    """
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.tie_parent: List[int] = []
+        self.size: List[int] = []
+        self.fixed: List[bool] = []
+        self.records: Dict[str, _Record] = {}
+        self.scores: List[Tuple[int, str, torch.Tensor]] = []
+        self.constraints: List[_Constraint] = []
+
+    def new(self, size: int, fixed: bool = False) -> int:
+        """New space of {size} channels. Fixed spaces are not pruned."""
+        self.tie_parent.append(len(self.size))
+        self.size.append(size)
+        self.fixed.append(fixed)
+        return len(self.size) - 1
+
+    def tie_root(self, space: int) -> int:
+        """Root of the spaces which have the same width as the space."""
+        while self.tie_parent[space] != space:
+            self.tie_parent[space] = self.tie_parent[self.tie_parent[space]]
+            space = self.tie_parent[space]
+        return space
+
+    def tie(self, a: int, b: int) -> None:
+        """Keep the same width on the spaces."""
+        self.tie_parent[self.tie_root(b)] = self.tie_root(a)
+
+    def is_fixed(self, space: int) -> bool:
+        """Whether any space with the same width is fixed."""
+        root = self.tie_root(space)
+        return any(
+            fixed
+            for s, fixed in enumerate(self.fixed)
+            if fixed and self.tie_root(s) == root
+        )
+
+    def record(
+        self,
+        name: str,
+        module: nn.Module,
+        kind: str,
+        in_space: Optional[int],
+        out_space: Optional[int],
+    ) -> None:
+        """Record the spaces of a module and the importance of its outputs."""
+        self.records[name] = _Record(kind, in_space, out_space)
+        if kind in ("conv", "dwconv"):
+            l1 = module.weight.detach().abs().flatten(1).sum(1)
+            self.scores.append((out_space, "l1", l1))
+        elif kind == "bn":
+            self.scores.append((out_space, "bn", module.weight.detach().abs()))
+
+    def importance(self, space: int, criterion: str) -> torch.Tensor:
+        """Importance of the channels of a space.
+
+        Scores of each module are normalized by their mean and summed.
+        L1 norm is used if no BatchNorm follows the channels.
+        """
+        scores = [(c, s) for i, c, s in self.scores if i == space]
+        selected = [s for c, s in scores if c == criterion] or [
+            s for c, s in scores if c == "l1"
+        ]
+        return sum(s.float().cpu() / (s.float().mean().cpu() + 1e-12) for s in selected)
+
+
+def _trace_sequence(
+    graph: _ChannelGraph,
+    name: str,
+    module: nn.Module,
+    space: int,
+    out_space: Optional[int] = None,
+) -> int:
+    """Trace the convolutions of an inverted residual block in forward order.
+
+    Args:
+        graph: channel graph.
+        name: module name.
+        module: nn.Sequential of the block.
+        space: input space.
+        out_space: output space of the last pointwise convolution.
+            A new space if None is given.
+
+    Returns:
+        output space
+    """
+    leaves = []
+    for child_name, child in module.named_modules(prefix=name):
+        if any(child_name.startswith(f"{n}.") for n, _ in leaves):
+            continue
+        if isinstance(child, SqueezeExcitation) or not list(child.children()):
+            leaves.append((child_name, child))
+    pointwise = [n for n, m in leaves if isinstance(m, nn.Conv2d) and m.groups == 1]
+    for child_name, child in leaves:
+        if isinstance(child, nn.Conv2d) and child.groups == 1:
+            if child_name == pointwise[-1] and out_space is not None:
+                out = out_space
+            else:
+                out = graph.new(child.out_channels)
+            graph.record(child_name, child, "conv", space, out)
+            space = out
+        elif isinstance(child, nn.Conv2d):
+            graph.record(child_name, child, "dwconv", space, space)
+        elif isinstance(child, nn.BatchNorm2d):
+            graph.record(child_name, child, "bn", space, space)
+        elif isinstance(child, SqueezeExcitation):
+            squeeze = graph.new(child.fc1.out_channels)
+            graph.record(f"{child_name}.fc1", child.fc1, "conv", space, squeeze)
+            graph.record(f"{child_name}.fc2", child.fc2, "conv", squeeze, space)
+    return space
+
+
+def _coprime(a: int, b: int) -> bool:
+    return math.gcd(a, b) == 1
+
+
+def _different(a: int, b: int) -> bool:
+    return a != b
+
+
+def _trace_inverted_residual(
+    graph: _ChannelGraph, name: str, block: nn.Module, space: int
+) -> Tuple[int, _InvertedResidual]:
+    """Trace an InvertedResidualv2/v3 block.
+
+    Returns:
+        output space and the block for the expand ratio search.
+    """
+    if isinstance(block, InvertedResidualv2):
+        residual = block.use_res_connect
+    else:
+        residual = block.identity
+    convs = [m for m in block.conv.modules() if isinstance(m, nn.Conv2d)]
+    info = _InvertedResidual(space, convs[0].in_channels, convs[0].out_channels)
+    out = _trace_sequence(
+        graph, f"{name}.conv", block.conv, space, space if residual else None
+    )
+    if max(m.stride[0] for m in convs) == 1 and not residual:
+        # the pruned block must not get the residual add
+        graph.constraints.append(_Constraint(space, out, _different))
+    return out, info
+
+
+def _trace(
+    model: nn.Sequential, parser: ModelParser
+) -> Tuple[_ChannelGraph, Dict[int, int], Dict[int, List[_InvertedResidual]]]:
+    """Trace the channel spaces of a parsed model.
+
+    Returns:
+        channel graph,
+        space of the out channel argument of each layer,
+        blocks of each InvertedResidualv2/v3 layer.
+    """
+    graph = _ChannelGraph()
+    space = graph.new(parser.in_channel, fixed=True)
+    out_args: Dict[int, int] = {}
+    inverted_residuals: Dict[int, List[_InvertedResidual]] = {}
+    for (i, _, _, generator), layer in zip(parser.generators(), model):
+        # pylint: disable=unidiomatic-typecheck
+        is_repeat = type(layer) is nn.Sequential
+        blocks = list(layer) if is_repeat else [layer]
+        prunable = generator.CHANNEL_ARG_INDEX is not None
+        layer_out: Optional[int] = None
+        for j, block in enumerate(blocks):
+            name = f"{i}.{j}" if is_repeat else f"{i}"
+            if isinstance(block, (Conv, DWConv)) and block.conv.groups == 1:
+                out = graph.new(block.conv.out_channels, fixed=not prunable)
+                graph.record(f"{name}.conv", block.conv, "conv", space, out)
+                graph.record(f"{name}.bn", block.bn, "bn", out, out)
+                if isinstance(block, DWConv):
+                    # groups of DWConv is gcd(in, out)
+                    graph.constraints.append(
+                        _Constraint(space, out, _coprime)
+                    )
+                if layer_out is not None:
+                    graph.tie(layer_out, out)
+                space = layer_out = out
+            elif (
+                isinstance(block, DWConv)
+                and block.conv.groups == block.conv.in_channels
+                and block.conv.in_channels == block.conv.out_channels
+            ):
+                graph.record(f"{name}.conv", block.conv, "dwconv", space, space)
+                graph.record(f"{name}.bn", block.bn, "bn", space, space)
+                layer_out = space
+            elif isinstance(block, (InvertedResidualv2, InvertedResidualv3)):
+                out, info = _trace_inverted_residual(graph, name, block, space)
+                inverted_residuals.setdefault(i, []).append(info)
+                space = layer_out = out
+            elif isinstance(block, Linear):
+                out = graph.new(block.linear.out_features, fixed=True)
+                graph.record(f"{name}.linear", block.linear, "linear", space, None)
+                space = layer_out = out
+            elif isinstance(block, TRANSPARENT_LAYERS) or (
+                isinstance(block, GlobalAvgPool) and block.output_size in (1, (1, 1))
+            ):
+                layer_out = space
+            else:
+                # channels of the other blocks are kept
+                graph.fixed[space] = True
+                space = layer_out = graph.new(generator.out_channel, fixed=True)
+        if prunable:
+            out_args[i] = space
+    return graph, out_args, inverted_residuals
+
+
+def _decide_widths(
+    graph: _ChannelGraph, out_args: Dict[int, int], ratio: float, divisor: int
+) -> Callable[[int], int]:
+    """New width of each space with the constraints of the pruned model."""
+    widths: Dict[int, int] = {}
+    for space in out_args.values():
+        root = graph.tie_root(space)
+        if root not in widths and not graph.is_fixed(space):
+            size = graph.size[space]
+            widths[root] = min(size, make_divisible(size * (1 - ratio), divisor))
+
+    def width(space: int) -> int:
+        return widths.get(graph.tie_root(space), graph.size[space])
+
+    for _ in range(len(graph.size) * 16):
+        violated = next(
+            (
+                c
+                for c in graph.constraints
+                if not c.check(width(c.in_space), width(c.out_space))
+            ),
+            None,
+        )
+        if violated is None:
+            return width
+        # widen the output first, then the input back to the original width
+        for space in (violated.out_space, violated.in_space):
+            root = graph.tie_root(space)
+            if root in widths and widths[root] < graph.size[space]:
+                widths[root] = min(widths[root] + divisor, graph.size[space])
+                break
+        else:
+            raise RuntimeError("Pruned widths do not satisfy the model constraints.")
+    raise RuntimeError("Pruned widths do not satisfy the model constraints.")
+
+
+def _expand_ratio(
+    blocks: List[_InvertedResidual],
+    width: Callable[[int], int],
+    expand_ratio: float,
+    ratio: float,
+    v3: bool,
+    divisor: int,
+) -> float:
+    """Expand ratio which shrinks the expansion layers by {ratio}.
+
+    One expand ratio is shared by the repeats of a layer, so the hidden
+    channels of the last block are fitted. None of the blocks can be wider
+    than before or change whether it has the expansion layer.
+    """
+    if expand_ratio == 1:
+        return expand_ratio
+
+    def hidden(in_channels: int, t: float) -> int:
+        if v3:
+            return make_divisible(in_channels * t, divisor)
+        return int(round(in_channels * t))
+
+    def valid(block: _InvertedResidual, t: float) -> bool:
+        in_channels = width(block.in_space)
+        hidden_channels = hidden(in_channels, t)
+        if not 0 < hidden_channels <= block.hidden_channels:
+            return False
+        if v3:
+            # InvertedResidualv3 has no expansion layer if hidden == inp
+            expansion = block.hidden_channels != block.in_channels
+            return (hidden_channels != in_channels) == expansion
+        # InvertedResidualv2 has no expansion layer if expand_ratio == 1
+        return t != 1
+
+    last = blocks[-1]
+    target = last.hidden_channels * (1 - ratio)
+    step = divisor if v3 else 1
+    candidates = sorted(
+        range(step, last.hidden_channels + 1, step), key=lambda c: abs(c - target)
+    )
+    for candidate in candidates:
+        t = round(candidate / width(last.in_space), 4)
+        if all(valid(block, t) for block in blocks):
+            return t
+    return expand_ratio
+
+
+def _signature(model: nn.Module) -> List[Tuple]:
+    """Structure of a model which the pruning must not change."""
+    return [
+        (
+            type(m).__name__,
+            getattr(m, "use_res_connect", None),
+            getattr(m, "identity", None),
+            getattr(m, "groups", 1) == 1,
+        )
+        for m in model.modules()
+    ]
+
+
+def _select(
+    tensor: torch.Tensor, dim: int, index: Optional[torch.Tensor]
+) -> torch.Tensor:
+    if index is None:
+        return tensor
+    return tensor.index_select(dim, index.to(tensor.device))
+
+
+def prune_channels(
+    model_config: Dict[str, Any],
+    model: nn.Module,
+    ratio: float,
+    criterion: str = "l1",
+) -> Tuple[Dict[str, Any], Model]:
+    """Remove the least important channels of a parsed model.
+
+    Args:
+        model_config: model config of {model}.
+        model: Model or its nn.Sequential of the parsed layers(Model.model)
+            with the trained weights. The model itself is not modified.
+        ratio: fraction of the channels to be removed from each layer.
+        criterion: channel importance. "l1" for the L1 norm of the filters,
+            "bn" for |gamma| of the following BatchNorm.
+
+    Returns:
+        model config of the pruned model with width_multiple and depth_multiple
+        of 1.0 and the pruned Model built from it with the kept weights.
+    """
+    if not 0 <= ratio < 1:
+        raise ValueError(f"ratio must be in [0, 1), got {ratio}")
+    if criterion not in CRITERIA:
+        raise ValueError(f"criterion must be one of {CRITERIA}, got {criterion}")
+    model = getattr(model, "model", model)
+    parser = ModelParser(model_config, build=False)
+    divisor = GeneratorAbstract.CHANNEL_DIVISOR
+    graph, out_args, inverted_residuals = _trace(model, parser)
+    width = _decide_widths(graph, out_args, ratio, divisor)
+
+    backbone = []
+    for i, repeat, _, generator in parser.generators():
+        args = generator.resolved_args
+        if i in out_args:
+            args[generator.CHANNEL_ARG_INDEX] = width(out_args[i])
+        if i in inverted_residuals:
+            v3 = generator.name == "InvertedResidualv3"
+            args[1] = _expand_ratio(
+                inverted_residuals[i], width, args[1], ratio, v3, divisor
+            )
+        backbone.append([repeat, model_config["backbone"][i][1], args])
+    pruned_config = {
+        **model_config,
+        "depth_multiple": 1.0,
+        "width_multiple": 1.0,
+        "backbone": backbone,
+    }
+    pruned = Model(pruned_config)
+    if _signature(pruned.model) != _signature(model):
+        raise RuntimeError("Pruning changed the structure of the model.")
+
+    # kept channels of each space
+    new_sizes: Dict[int, int] = {}
+    new_modules = dict(pruned.model.named_modules())
+    for name, record in graph.records.items():
+        module = new_modules[name]
+        if record.kind == "bn":
+            sizes = (module.num_features, module.num_features)
+        elif record.kind == "linear":
+            sizes = (module.in_features, module.out_features)
+        else:
+            sizes = (module.in_channels, module.out_channels)
+        for space, size in zip((record.in_space, record.out_space), sizes):
+            if space is None:
+                continue
+            if new_sizes.setdefault(space, size) != size:
+                raise RuntimeError(f"Inconsistent pruned channels at {name}.")
+    keep: Dict[int, Optional[torch.Tensor]] = {}
+    for space, size in new_sizes.items():
+        if size > graph.size[space]:
+            raise RuntimeError("Pruned model is wider than the model.")
+        if size == graph.size[space]:
+            keep[space] = None
+        else:
+            index = graph.importance(space, criterion).topk(size).indices
+            keep[space] = index.sort().values
+
+    state_dict = model.state_dict()
+    pruned_state_dict = {}
+    for key in pruned.model.state_dict():
+        module_name, param = key.rsplit(".", 1)
+        tensor = state_dict[key]
+        record = graph.records.get(module_name)
+        if record is not None and param != "num_batches_tracked":
+            out_index = keep.get(record.out_space)
+            in_index = keep[record.in_space]
+            if record.kind == "linear":
+                if param == "weight":
+                    tensor = _select(tensor, 1, in_index)
+            else:
+                tensor = _select(tensor, 0, out_index)
+                if record.kind == "conv" and param == "weight":
+                    tensor = _select(tensor, 1, in_index)
+        pruned_state_dict[key] = tensor.clone()
+    pruned.model.load_state_dict(pruned_state_dict)
+    return pruned_config, pruned
@@ -0,0 +1,439 @@
+"""Static int8 quantization of the parsed models.
+
+The eager mode flow of torch.quantization is used.
+    1. quantizable(): the float ops are rewritten to quantizable modules.
+        - residual add and SE scale mul -> FloatFunctional
+        - HardSwish, HardSigmoid -> nn.Hardswish, nn.Hardsigmoid
+        - Swish(SwishImplementation) -> sigmoid and FloatFunctional mul
+        - modules without int8 kernels run in float between DeQuant/Quant stubs
+       BatchNorm is folded with fuse_model() and Conv + ReLU are fused.
+    2. The observers are calibrated on a few batches.
+    3. The model is converted to int8.
+Quantization-aware training keeps BatchNorm in the fused Conv + BatchNorm
+modules and trains with fake quantization instead of the calibration.
+
+- Reference:
+    https://pytorch.org/docs/stable/quantization.html
+"""
+import copy
+import platform
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from torch.nn.quantized import FloatFunctional
+from torch.quantization import DeQuantStub, QuantStub
+
+try:
+    from torch.ao.quantization import fuse_modules_qat
+except ImportError:  # torch<1.11 fuses the training modules in train mode
+    from torch.quantization import fuse_modules as fuse_modules_qat
+
+from src.metrics import ConfusionMatrix
+from src.modules import (
+    Bottleneck,
+    Conv,
+    DWConv,
+    InvertedResidualv2,
+    InvertedResidualv3,
+    Linear,
+    MBConv,
+    ResBottleneck,
+)
+from src.modules import activations
+from src.modules import invertedresidualv3, mbconv
+from src.modules.poolings import GlobalAvgPool
+from src.utils.torch_utils import benchmark_runtime, fuse_model
+
+# TorchScript extra file which marks an int8 model and its quantized engine
+INT8_BACKEND_FILE = "int8_backend"
+
+# layers which have int8 kernels after quantizable()
+QUANTIZABLE_LAYERS = (
+    Conv,
+    DWConv,
+    Linear,
+    InvertedResidualv2,
+    InvertedResidualv3,
+    MBConv,
+    Bottleneck,
+    ResBottleneck,
+    GlobalAvgPool,
+    nn.MaxPool2d,
+    nn.AvgPool2d,
+    nn.Flatten,
+)
+
+
+def default_backend() -> str:
+    """qnnpack on ARM CPUs, fbgemm on x86 CPUs."""
+    machine = platform.machine().lower()
+    return "qnnpack" if machine.startswith(("arm", "aarch64")) else "fbgemm"
+
+
+class QuantizableSwish(nn.Module):
+    """Swish with the quantized mul."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.sigmoid = nn.Sigmoid()
+        self.mul = FloatFunctional()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """Forward."""
+        return self.mul.mul(x, self.sigmoid(x))
+
+
+class QuantizableSqueezeExcitation(nn.Module):
+    """Squeeze-Excitation with the quantized scale mul."""
+
+    def __init__(self, squeeze: nn.Module) -> None:
+        """Initialize.
+
+        Args:
+            squeeze: module which computes the channel scale of the input.
+        """
+        super().__init__()
+        self.squeeze = squeeze
+        self.mul = FloatFunctional()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """Forward."""
+        return self.mul.mul(self.squeeze(x), x)
+
+
+class QuantizableResidual(nn.Module):
+    """Residual block with the quantized add."""
+
+    def __init__(self, body: nn.Module, shortcut: bool) -> None:
+        """Initialize.
+
+        Args:
+            body: residual branch.
+            shortcut: add the input to the output of {body}.
+        """
+        super().__init__()
+        self.body = body
+        self.shortcut = shortcut
+        # an unused FloatFunctional would be converted without calibration
+        self.add = FloatFunctional() if shortcut else None
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """Forward."""
+        if self.shortcut:
+            return self.add.add(x, self.body(x))
+        return self.body(x)
+
+
+class FloatFallback(nn.Module):
+    """Run a module without int8 kernels in float inside the quantized model."""
+
+    def __init__(self, module: nn.Module) -> None:
+        """Initialize."""
+        super().__init__()
+        self.dequant = DeQuantStub()
+        self.module = module
+        self.module.qconfig = None
+        self.quant = QuantStub()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """Forward."""
+        return self.quant(self.module(self.dequant(x)))
+
+
+def _rewrite(module: nn.Module) -> nn.Module:
+    """Quantizable module of {module}. Children are rewritten in place."""
+    for name, child in module.named_children():
+        setattr(module, name, _rewrite(child))
+
+    if isinstance(module, (activations.HardSwish, nn.Hardswish)):
+        return nn.Hardswish()
+    if isinstance(module, (activations.HardSigmoid, nn.Hardsigmoid)):
+        return nn.Hardsigmoid()
+    if isinstance(module, (activations.Swish, mbconv.Swish, nn.SiLU)):
+        return QuantizableSwish()
+    if isinstance(module, invertedresidualv3.SqueezeExcitation):
+        return QuantizableSqueezeExcitation(
+            nn.Sequential(
+                nn.AdaptiveAvgPool2d(1),
+                module.fc1,
+                module.relu,
+                module.fc2,
+                module.hardsigmoid,
+            )
+        )
+    if isinstance(module, mbconv.SqueezeExcitation):
+        return QuantizableSqueezeExcitation(module.se)
+    if isinstance(module, InvertedResidualv3):
+        return QuantizableResidual(module.conv, module.identity)
+    if isinstance(module, InvertedResidualv2):
+        return QuantizableResidual(module.conv, module.use_res_connect)
+    if isinstance(module, MBConv):
+        # drop connect is identity in eval mode
+        return QuantizableResidual(module.conv, module.use_residual)
+    if isinstance(module, Bottleneck):
+        return QuantizableResidual(
+            nn.Sequential(module.conv1, module.conv2), module.shortcut
+        )
+    if isinstance(module, ResBottleneck):
+        return QuantizableResidual(
+            nn.Sequential(module.conv1, module.conv2, module.conv3), module.shortcut
+        )
+    return module
+
+
+def _is_quantizable(layer: nn.Module) -> bool:
+    if isinstance(layer, nn.Sequential):
+        return all(_is_quantizable(m) for m in layer)
+    return isinstance(layer, QUANTIZABLE_LAYERS)
+
+
+def _fusion_groups(model: nn.Module) -> List[List[str]]:
+    """Names of the Conv2d(+ BatchNorm2d)(+ ReLU) chains to be fused."""
+    groups = []
+    for name, module in model.named_modules():
+        prefix = f"{name}." if name else ""
+        if isinstance(getattr(module, "conv", None), nn.Conv2d):
+            # Conv, DWConv forward act(bn(conv(x)))
+            group = ["conv"]
+            if isinstance(getattr(module, "bn", None), nn.BatchNorm2d):
+                group.append("bn")
+            if type(getattr(module, "act", None)) is nn.ReLU:
+                group.append("act")
+            if len(group) > 1:
+                groups.append([prefix + n for n in group])
+        if isinstance(module, nn.Sequential):
+            layers = [
+                (str(i), m)
+                for i, m in enumerate(module)
+                if not isinstance(m, nn.Identity)
+            ]
+            for i, (layer_name, layer) in enumerate(layers):
+                if not isinstance(layer, nn.Conv2d):
+                    continue
+                group = [layer_name]
+                for kind in (nn.BatchNorm2d, nn.ReLU):
+                    j = i + len(group)
+                    if j < len(layers) and type(layers[j][1]) is kind:
+                        group.append(layers[j][0])
+                if len(group) > 1:
+                    groups.append([prefix + n for n in group])
+    return groups
+
+
+def quantizable(model: nn.Module, fold_bn: bool = True) -> nn.Sequential:
+    """Quantizable float copy of a parsed model.
+
+    Args:
+        model: nn.Sequential of the parsed layers(Model.model) or Model.
+        fold_bn: fold BatchNorm into the convolutions for the post-training
+            quantization. If False, Conv + BatchNorm are fused into the modules
+            which prepare_qat() trains with BatchNorm.
+
+    Returns:
+        nn.Sequential(QuantStub, layers, DeQuantStub) in eval mode, or in train
+        mode if {fold_bn} is False.
+        The layers without int8 kernels are wrapped with FloatFallback.
+    """
+    model = copy.deepcopy(getattr(model, "model", model)).cpu().eval()
+    layers = [
+        _rewrite(layer) if _is_quantizable(layer) else FloatFallback(layer)
+        for layer in model
+    ]
+    quant_model = nn.Sequential(QuantStub(), *layers, DeQuantStub())
+    if fold_bn:
+        fuse_model(quant_model)
+    for module in quant_model.modules():
+        # autopad gives [p], the quantized conv needs (p, p)
+        if isinstance(module, nn.Conv2d) and len(module.padding) == 1:
+            module.padding = tuple(module.padding) * 2
+    groups = _fusion_groups(quant_model)
+    fuse = torch.quantization.fuse_modules
+    if not fold_bn:
+        quant_model.train()
+        fuse = fuse_modules_qat
+    if groups:
+        fuse(quant_model, groups, inplace=True)
+    return quant_model
+
+
+@torch.no_grad()
+def calibrate(model: nn.Module, dataloader: Iterable, n_batches: int = 32) -> None:
+    """Run {n_batches} batches of the dataloader through the observers."""
+    model.eval()
+    for i, (data, *_) in enumerate(dataloader):
+        if i >= n_batches:
+            break
+        model(data)
+
+
+def quantize_static(
+    model: nn.Module,
+    dataloader: Iterable,
+    n_batches: int = 32,
+    backend: Optional[str] = None,
+) -> nn.Module:
+    """Post-training static int8 quantization.
+
+    Args:
+        model: nn.Sequential of the parsed layers(Model.model) or Model.
+            The model itself is not modified.
+        dataloader: calibration data. e.g) TACO train dataloader.
+        n_batches: number of calibration batches.
+        backend: quantized engine. "fbgemm"(x86) or "qnnpack"(ARM).
+            default_backend() if None is given.
+
+    Returns:
+        int8 model which runs on CPU. Input and output are float.
+    """
+    backend = backend or default_backend()
+    torch.backends.quantized.engine = backend
+    quant_model = quantizable(model)
+    quant_model.qconfig = torch.quantization.get_default_qconfig(backend)
+    torch.quantization.prepare(quant_model, inplace=True)
+    calibrate(quant_model, dataloader, n_batches)
+    torch.quantization.convert(quant_model, inplace=True)
+    return quant_model
+
+
+def prepare_qat(model: nn.Module, backend: Optional[str] = None) -> nn.Sequential:
+    """Quantizable copy of a float model with fake quantization for training.
+
+    Conv + BatchNorm(+ ReLU) are fused into the QAT modules which keep
+    BatchNorm, so the statistics can be frozen with QATSchedule.
+
+    Args:
+        model: nn.Sequential of the parsed layers(Model.model) or Model.
+            The model itself is not modified.
+        backend: quantized engine. default_backend() if None is given.
+
+    Returns:
+        QAT model in train mode on CPU. convert_qat() gives its int8 model.
+    """
+    backend = backend or default_backend()
+    torch.backends.quantized.engine = backend
+    qat_model = quantizable(model, fold_bn=False)
+    qat_model.qconfig = torch.quantization.get_default_qat_qconfig(backend)
+    torch.quantization.prepare_qat(qat_model, inplace=True)
+    return qat_model
+
+
+class QATSchedule(NamedTuple):
+    """Quantization-aware training settings.
+
+    Attributes:
+        backend: quantized engine of prepare_qat().
+        freeze_bn_epoch: BatchNorm statistics are frozen from this 0-based
+            epoch. Never if None.
+        freeze_observer_epoch: scale and zero point are frozen from this
+            0-based epoch. Never if None.
+    """
+
+    backend: str
+    freeze_bn_epoch: Optional[int] = None
+    freeze_observer_epoch: Optional[int] = None
+
+    def step(self, model: nn.Module, epoch: int) -> None:
+        """Freeze the QAT model before training the 0-based {epoch}."""
+        if _reached(epoch, self.freeze_bn_epoch):
+            model.apply(torch.nn.intrinsic.qat.freeze_bn_stats)
+        if _reached(epoch, self.freeze_observer_epoch):
+            model.apply(torch.quantization.disable_observer)
+
+
+def _reached(epoch: int, start: Optional[int]) -> bool:
+    return start is not None and epoch >= start
+
+
+def convert_qat(model: nn.Module) -> nn.Module:
+    """int8 model of a prepare_qat() model. The model itself is not modified."""
+    int8_model = copy.deepcopy(model).cpu().eval()
+    torch.quantization.convert(int8_model, inplace=True)
+    return int8_model
+
+
+def save_int8_torchscript(
+    model: nn.Module, path: str, example: torch.Tensor, backend: str
+) -> None:
+    """Trace an int8 model and save it with its quantized engine.
+
+    inference.py reads the engine from the INT8_BACKEND_FILE extra file.
+
+    Args:
+        model: int8 model. e.g) quantize_static(), convert_qat()
+        path: save path of TorchScript module.
+        example: example input of the trace.
+        backend: quantized engine of {model}.
+    """
+    with torch.no_grad():
+        scripted = torch.jit.trace(model.cpu().eval(), example.cpu())
+    torch.jit.save(scripted, path, _extra_files={INT8_BACKEND_FILE: backend})
+
+
+class QuantizationReport(NamedTuple):
+    """Accuracy and CPU latency of the float and int8 models."""
+
+    float_acc: float
+    float_f1: float
+    float_ms: float
+    int8_acc: float
+    int8_f1: float
+    int8_ms: float
+
+    @property
+    def speedup(self) -> float:
+        """Latency gain of the int8 model."""
+        return self.float_ms / self.int8_ms
+
+    def __str__(self) -> str:
+        return (
+            f"float acc: {self.float_acc * 100:.2f}%, f1: {self.float_f1:.4f}, "
+            f"{self.float_ms:.2f}ms\n"
+            f"int8  acc: {self.int8_acc * 100:.2f}%, f1: {self.int8_f1:.4f}, "
+            f"{self.int8_ms:.2f}ms\n"
+            f"delta acc: {(self.int8_acc - self.float_acc) * 100:+.2f}%p, "
+            f"f1: {self.int8_f1 - self.float_f1:+.4f}, speedup: {self.speedup:.2f}x"
+        )
+
+
+@torch.no_grad()
+def evaluate(model: nn.Module, dataloader: Iterable) -> Tuple[float, float]:
+    """Accuracy and macro F1 of the model on CPU."""
+    model.eval()
+    metric = None
+    for data, labels, *_ in dataloader:
+        outputs = model(data).flatten(1)
+        if metric is None:
+            metric = ConfusionMatrix(outputs.size(1))
+        metric.update(outputs.argmax(1), labels)
+    return metric.scores()
+
+
+def compare_quantized(
+    float_model: nn.Module,
+    int8_model: nn.Module,
+    dataloader: Iterable,
+    img_size: List[int],
+    repeat: int = 100,
+) -> QuantizationReport:
+    """Compare the float and int8 models on CPU.
+
+    Args:
+        float_model: float model.
+        int8_model: quantize_static() of {float_model}.
+        dataloader: evaluation data.
+        img_size: input size without the batch dimension for the latency.
+            e.g) [3, 224, 224]
+        repeat: number of timed forwards of batch size 1.
+
+    Returns:
+        QuantizationReport
+    """
+    float_model = float_model.cpu().eval()
+    float_acc, float_f1 = evaluate(float_model, dataloader)
+    int8_acc, int8_f1 = evaluate(int8_model, dataloader)
+    with torch.no_grad():
+        float_ms = benchmark_runtime(float_model, img_size, repeat=repeat).mean_ms
+        int8_ms = benchmark_runtime(int8_model, img_size, repeat=repeat).mean_ms
+    return QuantizationReport(float_acc, float_f1, float_ms, int8_acc, int8_f1, int8_ms)
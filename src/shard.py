@@ -0,0 +1,203 @@
+"""Packed shard dataset.
+
+The encoded images of a split are concatenated into a few large shard files
+with an offset index. An epoch reads a few files sequentially through mmap
+instead of walking the directory and opening every image.
+
+Layout of a split directory:
+    shard_00000.bin, ...  concatenated encoded image files
+    index.npy             int64 (n_samples, 4) of (shard, offset, length, target)
+    meta.json             {"classes": [...], "shards": [...]}
+"""
+import io
+import json
+import os
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+from torchvision.datasets import ImageFolder, VisionDataset
+from tqdm import tqdm
+
+from src.augmentation.seed import seed_albumentations
+from src.dataset import decode_image
+
+INDEX_FILE = "index.npy"
+META_FILE = "meta.json"
+
+
+def pack_image_folder(
+    root: str, out_dir: str, shard_size: int = 256 * 2 ** 20, seed: int = 0
+) -> int:
+    """Pack an image folder into shard files without re-encoding.
+
+    The samples are written in a random order, so each shard has every class.
+
+    Args:
+        root: image folder root. e.g) '/opt/ml/data/train'
+        out_dir: output split directory.
+        shard_size: a new shard is started after {shard_size} bytes.
+        seed: seed of the sample order.
+
+    Returns:
+        number of shards
+    """
+    folder = ImageFolder(root=root)
+    os.makedirs(out_dir, exist_ok=True)
+    order = np.random.RandomState(seed).permutation(len(folder.samples))
+    index = np.zeros((len(order), 4), dtype=np.int64)
+    shards: List[str] = []
+    f = None
+    offset = 0
+    for i, sample_index in enumerate(tqdm(order, f"Packing {root}")):
+        if f is None or offset >= shard_size:
+            if f is not None:
+                f.close()
+            shards.append(f"shard_{len(shards):05d}.bin")
+            f = open(os.path.join(out_dir, shards[-1]), "wb")
+            offset = 0
+        path, target = folder.samples[sample_index]
+        with open(path, "rb") as img:
+            data = img.read()
+        f.write(data)
+        index[i] = (len(shards) - 1, offset, len(data), target)
+        offset += len(data)
+    if f is not None:
+        f.close()
+
+    np.save(os.path.join(out_dir, INDEX_FILE), index)
+    with open(os.path.join(out_dir, META_FILE), "w") as meta:
+        json.dump({"classes": folder.classes, "shards": shards}, meta)
+    return len(shards)
+
+
+class ShardDataset(VisionDataset):
+    """Dataset of a split packed by pack_image_folder().
+
+    The shards are memory-mapped and a sample is decoded from the mapped
+    bytes. Only the encoded bytes of the sample are copied into the decoder.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        transform: Optional[Callable] = None,
+        target_transform: Optional[Callable] = None,
+        albu: bool = False,
+        decode_size: Optional[int] = None,
+    ) -> None:
+        """Initialize.
+
+        Args:
+            root: split directory. e.g) '/opt/ml/data_shard/train'
+            transform: torchvision or albumentations transform.
+            target_transform: transform for the target.
+            albu: whether {transform} is an albumentations transform.
+            decode_size: JPEG is decoded at the reduced size. See decode_image().
+        """
+        super().__init__(root, transform=transform, target_transform=target_transform)
+        with open(os.path.join(root, META_FILE)) as f:
+            meta = json.load(f)
+        self.classes: List[str] = meta["classes"]
+        self.class_to_idx = {c: i for i, c in enumerate(self.classes)}
+        self.shard_files = [os.path.join(root, s) for s in meta["shards"]]
+        self.index = np.load(os.path.join(root, INDEX_FILE))
+        self.targets = self.index[:, 3].tolist()
+        self.albu = albu
+        self.decode_size = decode_size
+        self._shards: Optional[List[np.memmap]] = None
+
+    @property
+    def shards(self) -> List[np.memmap]:
+        """Memory-mapped shards. Opened lazily so that each worker maps them."""
+        if self._shards is None:
+            self._shards = [
+                np.memmap(path, dtype=np.uint8, mode="r") for path in self.shard_files
+            ]
+        return self._shards
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, index: int) -> Tuple[Any, Any]:
+        shard, offset, length, target = self.index[index].tolist()
+        data = self.shards[shard][offset : offset + length]
+        sample = decode_image(io.BytesIO(data), self.decode_size, self.albu)
+        if self.albu:
+            seed_albumentations(self.transform)
+            sample = self.transform(image=np.asarray(sample))["image"].float()
+        elif self.transform is not None:
+            sample = self.transform(sample)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return sample, target
+
+
+class ShardShuffleSampler(Sampler):
+    """Shard-level shuffle with a random buffer.
+
+    The shards are visited in a random order and their samples are read in
+    the stored order through a shuffle buffer of {buffer_size} samples.
+    Reads stay sequential within a few shards while the order is random
+    enough for SGD. The order changes on every iteration. set_epoch() sets
+    the epoch of the next iteration explicitly.
+    """
+
+    def __init__(
+        self,
+        dataset: ShardDataset,
+        buffer_size: int = 1024,
+        shuffle: bool = True,
+        seed: int = 0,
+    ) -> None:
+        """Initialize.
+
+        Args:
+            dataset: shard dataset.
+            buffer_size: number of samples in the shuffle buffer.
+            shuffle: shuffle the shards and the samples. Sequential if False.
+            seed: seed of the order.
+        """
+        self.n_samples = len(dataset)
+        order = np.lexsort((dataset.index[:, 1], dataset.index[:, 0]))
+        shard_ids = dataset.index[order, 0]
+        self.shard_samples = [
+            order[shard_ids == shard].tolist()
+            for shard in range(len(dataset.shard_files))
+        ]
+        self.buffer_size = max(int(buffer_size), 1)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch of the next iteration."""
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return self.n_samples
+
+    def __iter__(self) -> Iterator[int]:
+        epoch = self.epoch
+        self.epoch += 1
+        if not self.shuffle:
+            for samples in self.shard_samples:
+                yield from samples
+            return
+
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + epoch)
+        buffer: List[int] = []
+        for shard in torch.randperm(len(self.shard_samples), generator=generator):
+            for index in self.shard_samples[shard]:
+                buffer.append(index)
+                if len(buffer) < self.buffer_size:
+                    continue
+                # pop a random sample by swapping it with the last one
+                i = int(torch.randint(len(buffer), (1,), generator=generator))
+                buffer[i], buffer[-1] = buffer[-1], buffer[i]
+                yield buffer.pop()
+        for i in torch.randperm(len(buffer), generator=generator).tolist():
+            yield buffer[i]
@@ -6,20 +6,23 @@
 
 import os
 import shutil
-from typing import Optional, Tuple, Union
+from typing import Callable, Optional, Tuple, Union
 
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import torchvision
-from sklearn.metrics import f1_score
 from torch.utils.data.dataloader import DataLoader
 from torch.utils.data.dataset import Dataset
 from torch.utils.data.sampler import SequentialSampler, SubsetRandomSampler
 from tqdm import tqdm
-import wandb
 
+from src.dataset import SeededDataset
+from src.distillation import TeacherLogitStore, teacher_forward
+from src.logger import MetricsLogger, WandbBackend
+from src.metrics import ConfusionMatrix
+from src.quantization import QATSchedule
 from src.utils.torch_utils import save_model
 from src.utils.common import get_learning_rate
 from src.utils.data import *
@@ -71,7 +74,7 @@ def _get_len_label_from_dataset(dataset: Dataset) -> int:
         dataset, torchvision.datasets.vision.VisionDataset
     ):
         return len(dataset.classes)
-    elif isinstance(dataset, torch.utils.data.Subset):
+    elif isinstance(dataset, (torch.utils.data.Subset, SeededDataset)):
         return _get_len_label_from_dataset(dataset.dataset)
     else:
         raise NotImplementedError
@@ -87,7 +90,7 @@ def _get_label_from_dataset(dataset: Dataset) -> int:
     """
     if isinstance(dataset, torchvision.datasets.ImageFolder) or isinstance(dataset, torchvision.datasets.vision.VisionDataset):
         return dataset.classes
-    elif isinstance(dataset, torch.utils.data.Subset):
+    elif isinstance(dataset, (torch.utils.data.Subset, SeededDataset)):
         return _get_label_from_dataset(dataset.dataset)
     else:
         raise NotImplementedError
@@ -106,6 +109,10 @@ class TorchTrainer:
         scaler=None,
         device: torch.device = "cpu",
         verbose: int = 1,
+        log_interval: int = 1,
+        logger: Optional[MetricsLogger] = None,
+        batch_transform: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
+        qat: Optional[QATSchedule] = None,
     ) -> None:
         """Initialize TorchTrainer class.
 
@@ -116,6 +123,17 @@ class TorchTrainer:
             optimizer: optimization module
             device: torch device
             verbose: verbosity level.
+            log_interval: loss and metrics are kept on the device and copied to
+                the host only every {log_interval} steps and at the end of epoch.
+                1 synchronizes every step.
+            logger: metrics logger. wandb logger is used if None is given,
+                which is closed by close().
+            batch_transform: augmentation of the training batch on the device,
+                e.g. BatchPolicy.batch. Not applied to the validation batches.
+            qat: quantization-aware training schedule. {model} must be a
+                prepare_qat() model. BatchNorm and observers are frozen at the
+                epochs of the schedule and the int8 model is saved with the
+                QAT checkpoint.
         """
 
         self.model = model
@@ -127,12 +145,30 @@ class TorchTrainer:
         self.scaler = scaler
         self.verbose = verbose
         self.device = device
+        self.log_interval = max(int(log_interval), 1)
+        self._owns_logger = logger is None
+        self.logger = logger if logger is not None else MetricsLogger(WandbBackend())
+        self.batch_transform = batch_transform
+        self.qat = qat
+
+    def close(self) -> None:
+        """Close the logger if it was created by the trainer.
+
+        A logger given to __init__ is left open to be closed by its owner.
+        """
+        if self._owns_logger:
+            self.logger.close()
+
+    def _is_log_step(self, batch: int, n_batch: int) -> bool:
+        """Whether device metrics should be copied to the host at this step."""
+        return (batch + 1) % self.log_interval == 0 or batch + 1 == n_batch
 
     def train(
         self,
         train_dataloader: DataLoader,
         n_epoch: int,
         val_dataloader: Optional[DataLoader] = None,
+        epoch_callback: Optional[Callable[[int, float, float], None]] = None,
     ) -> Tuple[float, float]:
         """Train model.
 
@@ -140,6 +176,9 @@ class TorchTrainer:
             train_dataloader: data loader module which is a iterator that returns (data, labels)
             n_epoch: number of total epochs for training
             val_dataloader: dataloader for validation
+            epoch_callback: called with (epoch, val f1, val acc) after the
+                validation of every epoch. epoch is 1-based. Training stops
+                if it raises (e.g. optuna.TrialPruned).
 
         Returns:
             loss and accuracy
@@ -148,15 +187,20 @@ class TorchTrainer:
         best_test_f1 = -1.0
         num_classes = _get_len_label_from_dataset(train_dataloader.dataset)
         label_list_name = _get_label_from_dataset(train_dataloader.dataset)
-        label_list = [i for i in range(num_classes)]
+        metric = ConfusionMatrix(num_classes, device=self.device)
 
         for epoch in range(n_epoch):
-            running_loss, correct, total = 0.0, 0, 0
-            preds, gt = [], []
+            running_loss = torch.zeros((), device=self.device)
+            metric.reset()
             pbar = tqdm(enumerate(train_dataloader), total=len(train_dataloader))
             self.model.train()
+            if self.qat is not None:
+                self.qat.step(self.model, epoch)
             for batch, (data, labels) in pbar:
-                data, labels = data.to(self.device), labels.to(self.device)
+                data = data.to(self.device, non_blocking=True)
+                labels = labels.to(self.device, non_blocking=True)
+                if self.batch_transform is not None:
+                    data = self.batch_transform(data)
 
                 if self.scaler:
                     with torch.cuda.amp.autocast():
@@ -178,47 +222,53 @@ class TorchTrainer:
                 self.scheduler.step()
 
                 _, pred = torch.max(outputs, 1)
-                total += labels.size(0)
-                correct += (pred == labels).sum().item()
-                preds += pred.to("cpu").tolist()
-                gt += labels.to("cpu").tolist()
+                metric.update(pred, labels)
 
-                running_loss += loss.item()
+                running_loss += loss.detach()
 
-                # wandb 
-                wandb.log({
+                pbar.update()
+                if not self._is_log_step(batch, len(train_dataloader)):
+                    continue
+                train_loss = running_loss.item() / (batch + 1)
+                train_acc, train_f1 = metric.scores()
+
+                self.logger.log({
                     'lr': get_learning_rate(self.optimizer)[0],
-                    'train/loss': running_loss / (batch + 1),
-                    'train/acc': (correct / total) * 100,
-                    'train/f1' : f1_score(y_true=gt, y_pred=preds, labels=label_list, average='macro', zero_division=0)
+                    'train/loss': train_loss,
+                    'train/acc': train_acc * 100,
+                    'train/f1' : train_f1
                 })
 
-                pbar.update()
                 pbar.set_description(
                     f"Train: [{epoch + 1:03d}] "
-                    f"Loss: {(running_loss / (batch + 1)):.3f}, "
-                    f"Acc: {(correct / total) * 100:.2f}% "
-                    f"F1(macro): {f1_score(y_true=gt, y_pred=preds, labels=label_list, average='macro', zero_division=0):.2f}"
+                    f"Loss: {train_loss:.3f}, "
+                    f"Acc: {train_acc * 100:.2f}% "
+                    f"F1(macro): {train_f1:.2f}"
                 )
-            wandb.log({'train_conf_mat' : wandb.plot.confusion_matrix(probs=None,y_true=gt, preds=preds,class_names=label_list_name) })
+            self.logger.log_confusion_matrix(
+                "train_conf_mat", metric.compute(), label_list_name
+            )
 
             pbar.close()
 
             _, test_f1, test_acc = self.test(
                 model=self.model, test_dataloader=val_dataloader
             )
-            if best_test_f1 > test_f1:
-                continue
-            best_test_acc = test_acc
-            best_test_f1 = test_f1
-            print(f"Model saved. Current best test f1: {best_test_f1:.3f}")
-            save_model(
-                model=self.model,
-                path=self.model_path,
-                data=data,
-                device=self.device,
-            )
+            if best_test_f1 <= test_f1:
+                best_test_acc = test_acc
+                best_test_f1 = test_f1
+                print(f"Model saved. Current best test f1: {best_test_f1:.3f}")
+                save_model(
+                    model=self.model,
+                    path=self.model_path,
+                    data=data,
+                    device=self.device,
+                    qat_backend=self.qat.backend if self.qat else None,
+                )
+            if epoch_callback is not None:
+                epoch_callback(epoch + 1, test_f1, test_acc)
 
+        self.logger.flush()
         return best_test_acc, best_test_f1
 
     """Knowledge Distillation
@@ -230,13 +280,17 @@ class TorchTrainer:
         train_dataloader: DataLoader,
         n_epoch: int,
         val_dataloader: Optional[DataLoader] = None,
+        teacher_logits: Optional[TeacherLogitStore] = None,
     ) -> Tuple[float, float]:
         """Train model.
 
         Args:
             train_dataloader: data loader module which is a iterator that returns (data, labels)
+                or (data, labels, keys) of get_seeded_dataloader if {teacher_logits} is given
             n_epoch: number of total epochs for training
             val_dataloader: dataloader for validation
+            teacher_logits: precomputed teacher logits of the (view, index) keys.
+                The teacher runs on every batch without autograd if None is given.
 
         Returns:
             loss and accuracy
@@ -245,18 +299,30 @@ class TorchTrainer:
         best_test_f1 = -1.0
         num_classes = _get_len_label_from_dataset(train_dataloader.dataset)
         label_list_name = _get_label_from_dataset(train_dataloader.dataset)
-        label_list = [i for i in range(num_classes)]
+        metric = ConfusionMatrix(num_classes, device=self.device)
+
+        if teacher_logits is None:
+            self.teacher_model.eval()
+            # frozen teacher only needs the forward pass
+            if torch.device(self.device).type == "cuda":
+                self.teacher_model.half()
 
         for epoch in range(n_epoch):
-            running_loss, correct, total = 0.0, 0, 0
-            preds, gt = [], []
+            running_loss = torch.zeros((), device=self.device)
+            metric.reset()
+            if hasattr(train_dataloader.sampler, "set_epoch"):
+                train_dataloader.sampler.set_epoch(epoch)
             pbar = tqdm(enumerate(train_dataloader), total=len(train_dataloader))
 
             self.model.train()
-            self.teacher_model.eval()
-
-            for batch, (data, labels) in pbar:
-                data, labels = data.to(self.device), labels.to(self.device)
+            if self.qat is not None:
+                self.qat.step(self.model, epoch)
+
+            for batch, (data, labels, *keys) in pbar:
+                data = data.to(self.device, non_blocking=True)
+                labels = labels.to(self.device, non_blocking=True)
+                if self.batch_transform is not None:
+                    data = self.batch_transform(data)
                 
                 # student output
                 if self.scaler:
@@ -267,11 +333,12 @@ class TorchTrainer:
                 outputs = torch.squeeze(outputs)
 
                 # teacher output
-                if self.scaler:
-                    with torch.cuda.amp.autocast():
-                        outputs_teacher = self.teacher_model(data)
+                if teacher_logits is not None:
+                    outputs_teacher = teacher_logits.read(keys[0]).to(
+                        self.device, non_blocking=True
+                    )
                 else:
-                    outputs_teacher = self.teacher_model(data)
+                    outputs_teacher = teacher_forward(self.teacher_model, data)
 
                 loss = self.criterion(outputs, labels, outputs_teacher) 
                 self.optimizer.zero_grad()
@@ -286,29 +353,32 @@ class TorchTrainer:
                 self.scheduler.step()
 
                 _, pred = torch.max(outputs, 1)
-                total += labels.size(0)
-                correct += (pred == labels).sum().item()
-                preds += pred.to("cpu").tolist()
-                gt += labels.to("cpu").tolist()
+                metric.update(pred, labels)
 
-                running_loss += loss.item()
+                running_loss += loss.detach()
 
-                # wandb 
-                wandb.log({
+                pbar.update()
+                if not self._is_log_step(batch, len(train_dataloader)):
+                    continue
+                train_loss = running_loss.item() / (batch + 1)
+                train_acc, train_f1 = metric.scores()
+
+                self.logger.log({
                     'lr': get_learning_rate(self.optimizer)[0],
-                    'train/loss': running_loss / (batch + 1),
-                    'train/acc': (correct / total) * 100,
-                    'train/f1' : f1_score(y_true=gt, y_pred=preds, labels=label_list, average='macro', zero_division=0)
+                    'train/loss': train_loss,
+                    'train/acc': train_acc * 100,
+                    'train/f1' : train_f1
                 })
 
-                pbar.update()
                 pbar.set_description(
                     f"Train: [{epoch + 1:03d}] "
-                    f"Loss: {(running_loss / (batch + 1)):.3f}, "
-                    f"Acc: {(correct / total) * 100:.2f}% "
-                    f"F1(macro): {f1_score(y_true=gt, y_pred=preds, labels=label_list, average='macro', zero_division=0):.2f}"
+                    f"Loss: {train_loss:.3f}, "
+                    f"Acc: {train_acc * 100:.2f}% "
+                    f"F1(macro): {train_f1:.2f}"
                 )
-            wandb.log({'train_conf_mat' : wandb.plot.confusion_matrix(probs=None,y_true=gt, preds=preds,class_names=label_list_name) })
+            self.logger.log_confusion_matrix(
+                "train_conf_mat", metric.compute(), label_list_name
+            )
 
             pbar.close()
 
@@ -325,8 +395,10 @@ class TorchTrainer:
                 path=self.model_path,
                 data=data,
                 device=self.device,
+                qat_backend=self.qat.backend if self.qat else None,
             )
 
+        self.logger.flush()
         return best_test_acc, best_test_f1
 
     @torch.no_grad()
@@ -344,21 +416,18 @@ class TorchTrainer:
 
         n_batch = _get_n_batch_from_dataloader(test_dataloader)
 
-        running_loss = 0.0
-        preds = []
-        gt = []
-        correct = 0
-        total = 0
+        running_loss = torch.zeros((), device=self.device)
 
         num_classes = _get_len_label_from_dataset(test_dataloader.dataset)
         label_list_name = _get_label_from_dataset(test_dataloader.dataset)
-        label_list = [i for i in range(num_classes)]
+        metric = ConfusionMatrix(num_classes, device=self.device)
 
         pbar = tqdm(enumerate(test_dataloader), total=len(test_dataloader))
         model.to(self.device)
         model.eval()
         for batch, (data, labels) in pbar:
-            data, labels = data.to(self.device), labels.to(self.device)
+            data = data.to(self.device, non_blocking=True)
+            labels = labels.to(self.device, non_blocking=True)
 
             if self.scaler:
                 with torch.cuda.amp.autocast():
@@ -366,32 +435,30 @@ class TorchTrainer:
             else:
                 outputs = model(data)
             outputs = torch.squeeze(outputs)
-            running_loss += self.criterion(outputs, labels).item()
+            running_loss += self.criterion(outputs, labels).detach()
 
             _, pred = torch.max(outputs, 1)
-            total += labels.size(0)
-            correct += (pred == labels).sum().item()
+            metric.update(pred, labels)
 
-            preds += pred.to("cpu").tolist()
-            gt += labels.to("cpu").tolist()
             pbar.update()
-            pbar.set_description(
-                f" Val: {'':5} Loss: {(running_loss / (batch + 1)):.3f}, "
-                f"Acc: {(correct / total) * 100:.2f}% "
-                f"F1(macro): {f1_score(y_true=gt, y_pred=preds, labels=label_list, average='macro', zero_division=0):.2f}"
-            )
-        loss = running_loss / len(test_dataloader)
-        accuracy = correct / total
-        f1 = f1_score(
-            y_true=gt, y_pred=preds, labels=label_list, average="macro", zero_division=0
-        )
+            if self._is_log_step(batch, len(test_dataloader)):
+                val_acc, val_f1 = metric.scores()
+                pbar.set_description(
+                    f" Val: {'':5} Loss: {(running_loss.item() / (batch + 1)):.3f}, "
+                    f"Acc: {val_acc * 100:.2f}% "
+                    f"F1(macro): {val_f1:.2f}"
+                )
+        loss = running_loss.item() / len(test_dataloader)
+        accuracy, f1 = metric.scores()
 
-        wandb.log({
+        self.logger.log({
             'val/loss': loss,
             'val/acc': accuracy * 100,
             'val/f1': f1,
-            'valid_conf_mat' : wandb.plot.confusion_matrix(probs=None,y_true=gt, preds=preds,class_names=label_list_name)
         })
+        self.logger.log_confusion_matrix(
+            "valid_conf_mat", metric.compute(), label_list_name
+        )
 
         return loss, f1, accuracy
 
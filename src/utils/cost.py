@@ -0,0 +1,272 @@
+"""Analytic cost model of the parsed modules.
+
+Params, MACs and activation size are computed from the module arguments and
+the input shape without instantiating any module.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy.optimize import nnls
+
+Size = Tuple[int, int]
+
+OP_KINDS = ("conv", "pwconv", "dwconv", "linear", "pool", "elementwise")
+
+
+class Cost:
+    """Analytic cost of a module or a model."""
+
+    def __init__(self) -> None:
+        """Initialize empty cost.
+
+        Attributes:
+            params: number of parameters.
+            macs: multiply-accumulates per operation kind(OP_KINDS).
+                Number of elements for the pooling and elementwise operations.
+            ops: number of operations per operation kind.
+            activations: number of output elements of conv, linear and
+                pooling operations. Batch size 1.
+        """
+        self.params = 0
+        self.macs: Dict[str, int] = {kind: 0 for kind in OP_KINDS}
+        self.ops: Dict[str, int] = {kind: 0 for kind in OP_KINDS}
+        self.activations = 0
+
+    @property
+    def total_macs(self) -> int:
+        """MACs of conv and linear operations."""
+        return sum(self.macs[k] for k in ("conv", "pwconv", "dwconv", "linear"))
+
+    @property
+    def activation_bytes(self) -> int:
+        """Size of the activations in float32."""
+        return self.activations * 4
+
+    def add(
+        self, kind: str, params: int, macs: int, out_elements: int = 0
+    ) -> None:
+        """Add an operation.
+
+        Args:
+            kind: operation kind. One of OP_KINDS.
+            params: number of parameters.
+            macs: multiply-accumulates(elements for pooling and elementwise).
+            out_elements: output elements counted as activation.
+        """
+        self.params += params
+        self.macs[kind] += macs
+        self.ops[kind] += 1
+        self.activations += out_elements
+
+    def __iadd__(self, other: "Cost") -> "Cost":
+        self.params += other.params
+        for kind in OP_KINDS:
+            self.macs[kind] += other.macs[kind]
+            self.ops[kind] += other.ops[kind]
+        self.activations += other.activations
+        return self
+
+    def __repr__(self) -> str:
+        return (
+            f"Cost(params={self.params:,d}, macs={self.total_macs:,d}, "
+            f"activations={self.activations:,d})"
+        )
+
+
+def conv2d(
+    cost: Cost,
+    in_channel: int,
+    out_channel: int,
+    kernel_size: int,
+    size: Size,
+    stride: int = 1,
+    padding: int = 0,
+    groups: int = 1,
+    bias: bool = False,
+    bn: bool = True,
+    pad_total: Optional[int] = None,
+) -> Size:
+    """Add nn.Conv2d(+ nn.BatchNorm2d) to the cost.
+
+    Args:
+        cost: cost to add to.
+        size: input (height, width).
+        padding: symmetric padding.
+        bias: whether the convolution has bias.
+        bn: whether batch normalization follows.
+        pad_total: total padding of each dimension. Overrides {padding}.
+            Used for the asymmetric padding of nn.ZeroPad2d.
+
+    Returns:
+        output (height, width)
+    """
+    if pad_total is None:
+        pad_total = 2 * padding
+    out_size = (
+        (size[0] + pad_total - kernel_size) // stride + 1,
+        (size[1] + pad_total - kernel_size) // stride + 1,
+    )
+    weight = out_channel * (in_channel // groups) * kernel_size * kernel_size
+    params = weight + (out_channel if bias else 0) + (2 * out_channel if bn else 0)
+    if groups > 1 and groups == in_channel:
+        kind = "dwconv"
+    elif kernel_size == 1:
+        kind = "pwconv"
+    else:
+        kind = "conv"
+    out_elements = out_channel * out_size[0] * out_size[1]
+    cost.add(kind, params, weight * out_size[0] * out_size[1], out_elements)
+    return out_size
+
+
+def linear(cost: Cost, in_features: int, out_features: int, bias: bool = True) -> None:
+    """Add nn.Linear to the cost."""
+    cost.add(
+        "linear",
+        in_features * out_features + (out_features if bias else 0),
+        in_features * out_features,
+        out_features,
+    )
+
+
+def pool2d(
+    cost: Cost,
+    channel: int,
+    kernel_size: int,
+    size: Size,
+    stride: Optional[int] = None,
+    padding: int = 0,
+) -> Size:
+    """Add max or average pooling to the cost.
+
+    Returns:
+        output (height, width)
+    """
+    stride = stride or kernel_size
+    out_size = (
+        (size[0] + 2 * padding - kernel_size) // stride + 1,
+        (size[1] + 2 * padding - kernel_size) // stride + 1,
+    )
+    out_elements = channel * out_size[0] * out_size[1]
+    cost.add("pool", 0, out_elements * kernel_size * kernel_size, out_elements)
+    return out_size
+
+
+def global_pool(cost: Cost, channel: int, size: Size, output_size: int = 1) -> Size:
+    """Add adaptive average pooling to the cost.
+
+    Returns:
+        output (height, width)
+    """
+    cost.add(
+        "pool", 0, channel * size[0] * size[1], channel * output_size * output_size
+    )
+    return (output_size, output_size)
+
+
+def elementwise(cost: Cost, channel: int, size: Size) -> None:
+    """Add an elementwise operation(activation, residual add, scale) to the cost."""
+    cost.add("elementwise", 0, channel * size[0] * size[1])
+
+
+def squeeze_excitation(
+    cost: Cost, channel: int, squeeze_channel: int, size: Size
+) -> None:
+    """Add squeeze-and-excitation(pool, fc, act, fc, gate, scale) to the cost."""
+    global_pool(cost, channel, size)
+    conv2d(cost, channel, squeeze_channel, 1, (1, 1), bias=True, bn=False)
+    elementwise(cost, squeeze_channel, (1, 1))
+    conv2d(cost, squeeze_channel, channel, 1, (1, 1), bias=True, bn=False)
+    elementwise(cost, channel, (1, 1))
+    elementwise(cost, channel, size)
+
+
+def sum_costs(costs: Iterable[Cost]) -> Cost:
+    """Sum of the costs."""
+    total = Cost()
+    for cost in costs:
+        total += cost
+    return total
+
+
+class LatencyModel:
+    """Linear latency model on the analytic cost.
+
+    latency(ms) = intercept + sum_k(ns_per_mac[k] * macs[k]) * 1e-6
+                  + sum_k(us_per_op[k] * ops[k]) * 1e-3
+    """
+
+    # Fitted with fit() on 60 random models of the AutoML_NAS search space
+    # timed by benchmark_runtime on one CPU thread, 112x112, batch size 1
+    # (about 17% error on held-out models). linear uses the pwconv rate.
+    # Refit with fit() for the target device.
+    DEFAULT_NS_PER_MAC = {
+        "conv": 0.015,
+        "pwconv": 0.015,
+        "dwconv": 0.24,
+        "linear": 0.015,
+        "pool": 1.0,
+        "elementwise": 1.9,
+    }
+    DEFAULT_US_PER_OP = {
+        "conv": 65.0,
+        "pwconv": 33.0,
+        "dwconv": 14.0,
+        "linear": 0.0,
+        "pool": 0.0,
+        "elementwise": 0.0,
+    }
+
+    def __init__(
+        self,
+        ns_per_mac: Optional[Dict[str, float]] = None,
+        us_per_op: Optional[Dict[str, float]] = None,
+        intercept: float = 0.0,
+    ) -> None:
+        """Initialize.
+
+        Args:
+            ns_per_mac: nanoseconds per MAC of each operation kind.
+            us_per_op: microseconds of overhead per operation of each kind.
+            intercept: constant latency(ms).
+        """
+        self.ns_per_mac = dict(ns_per_mac or self.DEFAULT_NS_PER_MAC)
+        self.us_per_op = dict(us_per_op or self.DEFAULT_US_PER_OP)
+        self.intercept = intercept
+
+    def __call__(self, cost: Cost) -> float:
+        """Estimated latency(ms) of the cost."""
+        return (
+            self.intercept
+            + sum(self.ns_per_mac[k] * cost.macs[k] for k in OP_KINDS) * 1e-6
+            + sum(self.us_per_op[k] * cost.ops[k] for k in OP_KINDS) * 1e-3
+        )
+
+    @classmethod
+    def fit(cls, costs: List[Cost], latencies: List[float]) -> "LatencyModel":
+        """Fit the coefficients to the measured latencies with non-negative least squares.
+
+        Args:
+            costs: analytic costs of the models.
+            latencies: measured latency(ms) of the models.
+
+        Returns:
+            Fitted LatencyModel.
+        """
+        features = np.array(
+            [
+                [c.macs[k] * 1e-6 for k in OP_KINDS]
+                + [c.ops[k] * 1e-3 for k in OP_KINDS]
+                + [1.0]
+                for c in costs
+            ]
+        )
+        scale = np.maximum(features.max(axis=0), 1e-12)
+        coef, _ = nnls(features / scale, np.asarray(latencies, dtype=np.float64))
+        coef = coef / scale
+        n_kinds = len(OP_KINDS)
+        return cls(
+            ns_per_mac=dict(zip(OP_KINDS, coef[:n_kinds].tolist())),
+            us_per_op=dict(zip(OP_KINDS, coef[n_kinds : 2 * n_kinds].tolist())),
+            intercept=float(coef[-1]),
+        )
@@ -8,17 +8,18 @@
 
 import random
 from multiprocessing import Pool
-from typing import Tuple
+from typing import Optional, Tuple
 
 
 def get_rand_bbox_coord(
-    w: int, h: int, len_ratio: float
+    w: int, h: int, len_ratio: float, rng: Optional[random.Random] = None
 ) -> Tuple[Tuple[int, int], Tuple[int, int]]:
-    """Get a coordinate of random box."""
+    """Get a coordinate of random box. Drawn from {rng} if given."""
+    rng = rng or random
     size_hole_w = int(len_ratio * w)
     size_hole_h = int(len_ratio * h)
-    x = random.randint(0, w)  # [0, w]
-    y = random.randint(0, h)  # [0, h]
+    x = rng.randint(0, w)  # [0, w]
+    y = rng.randint(0, h)  # [0, h]
 
     x0 = max(0, x - size_hole_w // 2)
     y0 = max(0, y - size_hole_h // 2)
@@ -0,0 +1,118 @@
+"""Batched inference with sampled per-image timing.
+
+Shared by inference.py and inference_swin.py.
+"""
+import json
+import os
+import time
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torchvision.transforms import Resize
+from tqdm import tqdm
+
+from src.utils.torch_utils import RuntimeResult, benchmark_runtime
+
+
+def synchronize(device: torch.device) -> None:
+    """Wait for every queued kernel to finish so that the host timer is valid."""
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def profile_times(runtime: RuntimeResult) -> Dict[str, float]:
+    """Single image latency in seconds keyed by "cuda" and "cpu".
+
+    Both keys are always present as in the autograd profiler output.
+    The device which did not run the model reports 0.
+    """
+    device_type = torch.device(runtime.device).type
+    return {
+        key: runtime.mean_ms / 1000 if key == device_type else 0.0
+        for key in ("cuda", "cpu")
+    }
+
+
+@torch.no_grad()
+def inference(
+    model: Any,
+    dataloader: DataLoader,
+    dst_path: str,
+    t0: float,
+    device: Union[str, torch.device],
+    classes: List[str],
+    profile_every: int = 1,
+) -> Dict[str, Any]:
+    """Run inference with given model and dataloader.
+
+    Args:
+        model: PyTorch model, TorchScript module or OnnxRuntimeModel.
+        dataloader: dataloader which returns (image, label, file name).
+        dst_path: destination path for inference result to be written.
+        t0: initial time prior to creating model and dataset
+            by time.monotonic().
+        device: device to run the model on.
+        classes: class name of each model output.
+        profile_every: time every {profile_every}-th batch and record the
+            per-image time of its images. 0 disables per-image timing.
+
+    Returns:
+        result written to {dst_path}/output.csv.
+    """
+    device = torch.device(device)
+    model = model.to(device)
+    model.eval()
+
+    profile_size = [3, 512, 512]
+    for transform in dataloader.dataset.transform.transforms:
+        if isinstance(transform, Resize):
+            profile_size = [3, *transform.size]
+            break
+
+    print(f"Profile input shape: {[1, *profile_size]}")
+    runtime = benchmark_runtime(model, profile_size, device, repeat=100)
+    print(f"Profile: {runtime}")
+
+    result: Dict[str, Any] = {
+        "inference": {},
+        "time": {
+            "profile": profile_times(runtime),
+            "runtime": {"all": 0, "inference_only": 0},
+            "inference": {},
+        },
+        "macs": float("inf"),
+    }
+    preds, fnames = [], []
+    synchronize(device)
+    t_loop = time.monotonic()
+    for batch, (img, _, fname) in enumerate(tqdm(dataloader, "Running inference ...")):
+        profile = profile_every > 0 and batch % profile_every == 0
+        if profile:
+            synchronize(device)
+            t_start = time.perf_counter()
+
+        img = img.to(device, non_blocking=True)
+        pred = model(img)
+        preds.append(torch.argmax(pred.view(pred.size(0), -1), dim=1))
+        fnames += fname
+
+        if profile:
+            synchronize(device)
+            t_inference = (time.perf_counter() - t_start) / len(fname)
+            for f in fname:
+                result["time"]["inference"][f] = t_inference
+
+    pred_classes = np.array(classes)[torch.cat(preds).cpu().numpy()]
+    synchronize(device)
+    time_measure_inference = time.monotonic() - t_loop
+    result["inference"] = dict(zip(fnames, pred_classes.tolist()))
+
+    result["time"]["runtime"]["all"] = time.monotonic() - t0
+    result["time"]["runtime"]["inference_only"] = time_measure_inference
+
+    save_path = os.path.join(dst_path, "output.csv")
+    with open(save_path, "w") as outfile:
+        json.dump(result, outfile)
+    return result
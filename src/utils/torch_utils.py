@@ -4,9 +4,15 @@
 - Contact: lim.jeikei@gmail.com
 """
 
+import argparse
+import copy
+import inspect
+import io
+import json
 import math
 import os
-from typing import List, Optional, Tuple, Union
+import time
+from typing import List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -15,17 +21,22 @@ from torch.utils.data import Subset
 
 
 def convert_model_to_torchscript(
-    model: nn.Module, path: Optional[str] = None
+    model: nn.Module, path: Optional[str] = None, fuse: bool = False
 ) -> torch.jit.ScriptModule:
     """Convert PyTorch Module to TorchScript.
 
     Args:
         model: PyTorch Module.
+        path: save path of TorchScript module.
+        fuse: fold BatchNorm into convolution before the conversion.
+            {model} itself is not modified.
 
     Return:
         TorchScript module.
     """
     model.eval()
+    if fuse:
+        model = fuse_model(copy.deepcopy(model))
     jit_model = torch.jit.script(model)
 
     if path:
@@ -34,6 +45,271 @@ def convert_model_to_torchscript(
     return jit_model
 
 
+EXPORT_DEVICE_FILE = "device"
+
+
+def _reload(jit_model: torch.jit.ScriptModule) -> torch.jit.ScriptModule:
+    """Save and load back the module in memory."""
+    buffer = io.BytesIO()
+    torch.jit.save(jit_model, buffer)
+    buffer.seek(0)
+    return torch.jit.load(buffer)
+
+
+@torch.no_grad()
+def export_torchscript(
+    model: nn.Module,
+    path: str,
+    img_size: List[int],
+    method: str = "script",
+    device: Union[str, torch.device] = "cpu",
+    optimize: bool = True,
+    n_checks: int = 3,
+    rtol: float = 1e-3,
+    atol: float = 1e-4,
+) -> torch.jit.ScriptModule:
+    """Export the model as a frozen TorchScript module for the deployment.
+
+    The model is fused, scripted or traced and frozen, which inlines the
+    weights as constants, folds the constants and the Conv-BN pairs and
+    removes dropout. torch.jit.optimize_for_inference fuses the ops further
+    but its module is kept only if it can be loaded back and runs faster
+    with a single image, since neither holds for every model. The loaded
+    module is checked against {model} with random inputs.
+
+    Args:
+        model: PyTorch Module. {model} itself is not modified.
+        path: save path of TorchScript module. inference.py loads it directly.
+        img_size: input size without the batch dimension. e.g) [3, 224, 224]
+        method: "script" or "trace". Trace is used if the scripting fails.
+        device: device to run the module on. Frozen modules keep their
+            constants on this device, which is saved as an extra file.
+        optimize: try torch.jit.optimize_for_inference.
+        n_checks: number of random inputs with batch size 1 to {n_checks}.
+        rtol: relative tolerance of the check.
+        atol: absolute tolerance of the check.
+
+    Raises:
+        RuntimeError: if the output of the exported module differs from {model}.
+
+    Returns:
+        exported TorchScript module.
+    """
+    assert method in ("script", "trace"), f"Unknown export method: {method}"
+    device = torch.device(device)
+    model = copy.deepcopy(model).to(device).eval()
+    fused = fuse_model(copy.deepcopy(model))
+    example = torch.rand(1, *img_size, device=device)
+
+    if method == "script":
+        try:
+            jit_model = torch.jit.script(fused)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Scripting failed, tracing instead: {error}")
+            method = "trace"
+    if method == "trace":
+        jit_model = torch.jit.trace(fused, example)
+
+    jit_model = torch.jit.freeze(jit_model.eval())
+    if optimize:
+        try:
+            # the pass rewrites the graph of its argument in place
+            optimized = torch.jit.optimize_for_inference(_reload(jit_model))
+            optimized = _reload(optimized)
+            times = [
+                benchmark_runtime(m, img_size, device, repeat=30).mean_ms
+                for m in (jit_model, optimized)
+            ]
+            print(f"optimize_for_inference: {times[0]:.2f}ms -> {times[1]:.2f}ms")
+            if times[1] < times[0]:
+                jit_model = optimized
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Skip optimize_for_inference: {error}")
+    jit_model = _reload(jit_model)
+
+    for batch_size in range(1, n_checks + 1):
+        inputs = torch.randn(batch_size, *img_size, device=device)
+        expected, output = model(inputs), jit_model(inputs)
+        if not torch.allclose(expected, output, rtol=rtol, atol=atol):
+            max_diff = (expected - output).abs().max().item()
+            raise RuntimeError(
+                f"Exported model differs from the model by {max_diff:.3g} "
+                f"with batch size {batch_size}"
+            )
+
+    torch.jit.save(jit_model, path, _extra_files={EXPORT_DEVICE_FILE: str(device)})
+    return jit_model
+
+
+class OnnxRuntimeModel(nn.Module):
+    """ONNX Runtime CPU session which runs like the PyTorch model.
+
+    Takes and returns torch.Tensor so that inference() and benchmark_runtime()
+    run it as they run the PyTorch models.
+    """
+
+    def __init__(
+        self, path: str, intra_op_threads: int = 0, inter_op_threads: int = 0
+    ) -> None:
+        """Create the inference session.
+
+        Args:
+            path: ONNX model path.
+            intra_op_threads: threads of an operator. 0 uses the ONNX Runtime default.
+            inter_op_threads: threads running independent operators in parallel.
+                0 or 1 runs the operators sequentially.
+        """
+        super().__init__()
+        import onnxruntime  # pylint: disable=import-outside-toplevel
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """Run the session on CPU."""
+        output = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})
+        return torch.from_numpy(output[0]).to(x.device)
+
+
+@torch.no_grad()
+def export_onnx(
+    model: nn.Module,
+    path: str,
+    img_size: List[int],
+    opset_version: int = 11,
+    n_checks: int = 3,
+    rtol: float = 1e-3,
+    atol: float = 1e-4,
+) -> None:
+    """Export the model as ONNX with a dynamic batch dimension.
+
+    The exported model is checked against {model} with ONNX Runtime on
+    random inputs.
+
+    Args:
+        model: PyTorch Module. {model} itself is not modified.
+        path: save path of ONNX model. inference.py loads it directly.
+        img_size: input size without the batch dimension. e.g) [3, 224, 224]
+        opset_version: ONNX opset. 11 is supported from torch 1.7.
+        n_checks: number of random inputs with batch size 1 to {n_checks}.
+        rtol: relative tolerance of the check.
+        atol: absolute tolerance of the check.
+
+    Raises:
+        RuntimeError: if the output of the exported model differs from {model}.
+    """
+    model = copy.deepcopy(model).cpu().eval()
+    fused = fuse_model(copy.deepcopy(model))
+    for module in fused.modules():
+        # autopad gives [p], ONNX Conv needs the pads of both dimensions
+        if isinstance(module, nn.Conv2d) and len(module.padding) == 1:
+            module.padding = tuple(module.padding) * 2
+
+    kwargs = {}
+    # torch>=2.5 exports with dynamo by default, which drops dynamic_axes
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    torch.onnx.export(
+        fused,
+        torch.rand(1, *img_size),
+        path,
+        input_names=["input"],
+        output_names=["output"],
+        dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+        opset_version=opset_version,
+        **kwargs,
+    )
+
+    onnx_model = OnnxRuntimeModel(path)
+    for batch_size in range(1, n_checks + 1):
+        inputs = torch.randn(batch_size, *img_size)
+        expected, output = model(inputs), onnx_model(inputs)
+        if not torch.allclose(expected, output, rtol=rtol, atol=atol):
+            max_diff = (expected - output).abs().max().item()
+            raise RuntimeError(
+                f"Exported model differs from the model by {max_diff:.3g} "
+                f"with batch size {batch_size}"
+            )
+
+
+@torch.no_grad()
+def fuse_conv_and_bn(conv: nn.Conv2d, bn: nn.BatchNorm2d) -> nn.Conv2d:
+    """Fold BatchNorm into the preceding convolution.
+
+    Args:
+        conv: convolution followed by {bn}.
+        bn: BatchNorm with running statistics.
+
+    Returns:
+        biased convolution which equals bn(conv(x)) in eval mode.
+    """
+    fused = nn.Conv2d(
+        conv.in_channels,
+        conv.out_channels,
+        kernel_size=conv.kernel_size,
+        stride=conv.stride,
+        padding=conv.padding,
+        dilation=conv.dilation,
+        groups=conv.groups,
+        bias=True,
+        padding_mode=conv.padding_mode,
+    ).to(conv.weight.device)
+
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    fused.weight.copy_(conv.weight * scale.view(-1, 1, 1, 1))
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    fused.bias.copy_(bn.bias + (bias - bn.running_mean) * scale)
+
+    return fused
+
+
+def fuse_model(model: nn.Module) -> nn.Module:
+    """Fold every Conv2d + BatchNorm2d pair of the model in place.
+
+    Handles modules which have (conv, bn) attributes such as Conv, DWConv and
+    Conv2d followed by BatchNorm2d in nn.Sequential such as InvertedResidualv2/v3,
+    MBConv, ShuffleNetV2. Folded BatchNorm is replaced with nn.Identity so that
+    the module forwards as its fused forward and still can be scripted.
+
+    Args:
+        model: PyTorch Module. Switched to eval mode.
+
+    Returns:
+        {model} with fused convolutions.
+    """
+    model.eval()
+    for module in list(model.modules()):
+        conv, bn = getattr(module, "conv", None), getattr(module, "bn", None)
+        if _is_foldable(conv, bn):
+            module.conv = fuse_conv_and_bn(conv, bn)
+            module.bn = nn.Identity()
+
+        if isinstance(module, nn.Sequential):
+            for i in range(len(module) - 1):
+                if _is_foldable(module[i], module[i + 1]):
+                    module[i] = fuse_conv_and_bn(module[i], module[i + 1])
+                    module[i + 1] = nn.Identity()
+
+    return model
+
+
+def _is_foldable(conv: Optional[nn.Module], bn: Optional[nn.Module]) -> bool:
+    """Check {bn} can be folded into {conv}."""
+    return (
+        isinstance(conv, nn.Conv2d)
+        and isinstance(bn, nn.BatchNorm2d)
+        and bn.track_running_stats
+        and conv.out_channels == bn.num_features
+    )
+
+
 def split_dataset_index(
     train_dataset: torch.utils.data.Dataset, n_data: int, split_ratio: float = 0.1
 ) -> Tuple[Subset, Subset]:
@@ -59,13 +335,29 @@ def split_dataset_index(
     return train_subset, valid_subset
 
 
-def save_model(model, path, data, device):
-    """save model to torch script, onnx."""
+def save_model(model, path, data, device, qat_backend: Optional[str] = None):
+    """save model to torch script.
+
+    The float model is saved as "{name}.ts" next to its state_dict. ONNX is
+    exported once after the training by export.py --format onnx.
+    The state_dict of a prepare_qat() model is saved as the QAT checkpoint
+    and its int8 model as "{name}_int8.ts" if {qat_backend} is given.
+    """
     try:
         torch.save(model.state_dict(), f=path)
         print(f"Model saved at {path}")
+        if qat_backend is not None:
+            # pylint: disable=import-outside-toplevel
+            from src.quantization import convert_qat, save_int8_torchscript
+
+            ts_path = os.path.splitext(path)[0] + "_int8.ts"
+            save_int8_torchscript(
+                convert_qat(model), ts_path, data[:1], backend=qat_backend
+            )
+            print(f"int8 model saved at {ts_path}")
+            return
         ts_path = os.path.splitext(path)[:-1][0] + ".ts"
-        convert_model_to_torchscript(model, ts_path)
+        convert_model_to_torchscript(model, ts_path, fuse=True)
     except Exception:
         print("Failed to save torch")
 
@@ -102,36 +394,120 @@ def model_info(model, verbose=False):
     )
 
 
+class RuntimeResult(NamedTuple):
+    """Latency benchmark result. Times are per batch in milliseconds."""
+
+    device: str
+    batch_size: int
+    num_threads: int
+    repeat: int
+    mean_ms: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    throughput: float  # images per second
+
+
 @torch.no_grad()
+def benchmark_runtime(
+    model: nn.Module,
+    img_size: List[int],
+    device: Union[str, torch.device] = "cpu",
+    batch_size: int = 1,
+    repeat: int = 100,
+    warmup: int = 10,
+    num_threads: Optional[int] = None,
+) -> RuntimeResult:
+    """Measure the inference latency of the model on CPU or CUDA.
+
+    CUDA is timed with CUDA events and CPU is timed with perf_counter_ns.
+
+    Args:
+        model: PyTorch model.
+        img_size: input size without the batch dimension. e.g) [3, 224, 224]
+        device: device to run the model on.
+        batch_size: number of images per forward.
+        repeat: number of timed forwards.
+        warmup: number of untimed forwards before measuring.
+        num_threads: number of CPU threads. Current setting is used if None is given.
+
+    Returns:
+        RuntimeResult. mean_ms is the mean of the measures without
+        the fastest and slowest 10%.
+    """
+    device = torch.device(device)
+    prev_threads = torch.get_num_threads()
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    # frozen TorchScript modules have no training mode
+    was_training = getattr(model, "training", None)
+    if was_training is not None:
+        model.eval()
+    img_tensor = torch.rand([batch_size, *img_size]).to(device)
+
+    for _ in range(warmup):
+        model(img_tensor)
+
+    measure = []
+    if device.type == "cuda":
+        start = torch.cuda.Event(enable_timing=True)
+        end = torch.cuda.Event(enable_timing=True)
+        torch.cuda.synchronize(device)
+        for _ in range(repeat):
+            start.record()
+            model(img_tensor)
+            end.record()
+            # Waits for everything to finish running
+            torch.cuda.synchronize(device)
+            measure.append(start.elapsed_time(end))
+    else:
+        for _ in range(repeat):
+            start_ns = time.perf_counter_ns()
+            model(img_tensor)
+            measure.append((time.perf_counter_ns() - start_ns) / 1e6)
+
+    if was_training is not None:
+        model.train(was_training)
+    n_threads = torch.get_num_threads()
+    torch.set_num_threads(prev_threads)
+
+    measure_np = np.sort(np.array(measure))
+    k = int(round(len(measure_np) * 0.1))
+    trimmed = measure_np[k : len(measure_np) - k] if len(measure_np) > 2 * k else measure_np
+    p50, p90, p99 = np.percentile(measure_np, [50, 90, 99])
+    return RuntimeResult(
+        device=str(device),
+        batch_size=batch_size,
+        num_threads=n_threads,
+        repeat=repeat,
+        mean_ms=float(np.mean(trimmed)),
+        p50_ms=float(p50),
+        p90_ms=float(p90),
+        p99_ms=float(p99),
+        throughput=float(batch_size * 1000 / np.mean(measure_np)),
+    )
+
+
 def check_runtime(
     model: nn.Module, img_size: List[int], device: torch.device, repeat: int = 100
 ) -> float:
-    repeat = min(repeat, 20)
-    img_tensor = torch.rand([1, *img_size]).to(device)
-    measure = []
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
+    """Measure single image latency in milliseconds.
 
-    model.eval()
-    for _ in range(repeat):
-        start.record()
-        _ = model(img_tensor)
-        end.record()
-        # Waits for everything to finish running
-        torch.cuda.synchronize()
-        measure.append(start.elapsed_time(end))
-
-    measure.sort()
-    n = len(measure)
-    k = int(round(n * (0.2) / 2))
-    trimmed_measure = measure[k + 1 : n - k]
-
-    with torch.autograd.profiler.profile(use_cuda=True) as prof:
-        _ = model(img_tensor)
-    print(prof)
-    print("measured time(ms)", np.mean(trimmed_measure))
-    model.train()
-    return np.mean(trimmed_measure)
+    Args:
+        model: PyTorch model.
+        img_size: input size without the batch dimension. e.g) [3, 224, 224]
+        device: device to run the model on.
+        repeat: number of timed forwards.
+
+    Returns:
+        mean latency without the fastest and slowest 10%.
+    """
+    result = benchmark_runtime(model, img_size, device, repeat=repeat)
+    print(
+        f"measured time(ms) {result.mean_ms:.3f} "
+        f"(p50: {result.p50_ms:.3f}, p90: {result.p90_ms:.3f}, p99: {result.p99_ms:.3f})"
+    )
+    return result.mean_ms
 
 
 def make_divisible(v: float, divisor: int = 8, min_value: Optional[int] = None) -> int:
@@ -188,5 +564,30 @@ class Activation:
 
 
 if __name__ == "__main__":
-    # test
-    check_runtime(None, [32, 32] + [3])
+    parser = argparse.ArgumentParser(description="Benchmark model latency.")
+    parser.add_argument(
+        "--model", default="configs/model/mobilenetv3.yaml", type=str, help="model config"
+    )
+    parser.add_argument("--img_size", default=224, type=int, help="input image size")
+    parser.add_argument("--device", default="cpu", type=str, help="cpu or cuda")
+    parser.add_argument("--batch_sizes", default=[1], type=int, nargs="+")
+    parser.add_argument("--num_threads", default=[0], type=int, nargs="+", help="0 uses current setting")
+    parser.add_argument("--repeat", default=100, type=int)
+    parser.add_argument("--warmup", default=10, type=int)
+    args = parser.parse_args()
+
+    from src.model import Model  # pylint: disable=import-outside-toplevel
+
+    bench_model = Model(args.model).model.to(args.device)
+    for bench_batch_size in args.batch_sizes:
+        for bench_threads in args.num_threads:
+            bench_result = benchmark_runtime(
+                bench_model,
+                [3, args.img_size, args.img_size],
+                args.device,
+                batch_size=bench_batch_size,
+                repeat=args.repeat,
+                warmup=args.warmup,
+                num_threads=bench_threads or None,
+            )
+            print(json.dumps(bench_result._asdict()))
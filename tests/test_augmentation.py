@@ -0,0 +1,152 @@
+"""Seeded augmentation test."""
+
+import random
+
+import albumentations as A
+import numpy as np
+import torch
+from albumentations.pytorch import ToTensorV2
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+from src.augmentation import policies
+from src.augmentation.batch import (
+    OPS_INFO,
+    BatchAugmentation,
+    BatchPolicy,
+    apply_op,
+)
+from src.augmentation.seed import augmentation_seed, seed_albumentations
+from src.dataset import SeededDataset, SeededSampler
+
+POLICIES = [
+    policies.simple_augment_train,
+    policies.randaugment_train,
+    policies.custom_augment_train,
+]
+
+
+def _image(seed: int = 0) -> Image.Image:
+    rng = np.random.RandomState(seed)
+    return Image.fromarray(rng.randint(0, 256, (40, 48, 3), dtype=np.uint8))
+
+
+class _PolicyDataset(Dataset):
+    """Random images with the randaugment policy."""
+
+    def __init__(self):
+        self.transform = policies.randaugment_train("TACO", 32)
+
+    def __len__(self) -> int:
+        return 6
+
+    def __getitem__(self, index):
+        return self.transform(_image(index)), 0
+
+
+class TestAugmentation:
+    """Test policies give the same output for the same seed."""
+
+    # pylint: disable=no-self-use
+
+    def test_policies(self):
+        """Test the seed argument and the seed context."""
+        img = _image()
+        for policy in POLICIES:
+            transform = policy("TACO", 32)
+            output = transform(img, seed=7)
+            assert torch.equal(output, transform(img, seed=7))
+            with augmentation_seed(7):
+                assert torch.equal(output, transform(img))
+            outputs = [transform(img, seed=seed) for seed in range(5)]
+            assert any(not torch.equal(outputs[0], o) for o in outputs[1:])
+
+    def test_global_state(self):
+        """Test the seeded augmentation does not change the global generators."""
+        random.seed(0)
+        np.random.seed(0)
+        torch.manual_seed(0)
+        expected = (random.random(), np.random.rand(), torch.rand(1))
+        random.seed(0)
+        np.random.seed(0)
+        torch.manual_seed(0)
+        with augmentation_seed(3):
+            policies.randaugment_train("TACO", 32)(_image())
+        assert (random.random(), np.random.rand(), torch.rand(1)) == expected
+
+    def test_albumentations(self):
+        """Test an albumentations Compose is seeded in the context."""
+        transform = A.Compose(
+            [A.HorizontalFlip(p=0.5), A.RandomBrightnessContrast(p=1.0), ToTensorV2()]
+        )
+        img = np.array(_image())
+        outputs = []
+        for _ in range(2):
+            with augmentation_seed(5):
+                seed_albumentations(transform)
+                outputs.append(transform(image=img)["image"])
+        assert torch.equal(outputs[0], outputs[1])
+
+    def test_workers(self):
+        """Test worker processes give the same samples as the main process."""
+        dataset = SeededDataset(_PolicyDataset(), seed=1)
+
+        def samples(num_workers):
+            sampler = SeededSampler(len(dataset), n_views=2, shuffle=False)
+            sampler.set_epoch(1)
+            loader = DataLoader(
+                dataset, sampler=sampler, batch_size=2, num_workers=num_workers
+            )
+            return torch.cat([data for data, _, _ in loader])
+
+        assert torch.equal(samples(0), samples(2))
+
+    def test_batch_ops(self):
+        """Test the batch operations with per-sample magnitudes."""
+        x = torch.rand(4, 3, 16, 16)
+        zero = torch.zeros(4)
+        for name in OPS_INFO:
+            if name not in ("AutoContrast", "Solarize", "Posterize"):
+                assert torch.allclose(apply_op(x, name, zero), x, atol=1e-5), name
+        assert torch.equal(apply_op(x, "Solarize", torch.full((4,), 256.0)), x)
+        magnitude = torch.tensor([0.0, 0.5, -0.5, 0.0])
+        output = apply_op(x, "Brightness", magnitude)
+        assert torch.equal(output[[0, 3]], x[[0, 3]])
+        assert torch.allclose(output[1], (x[1] * 1.5).clamp(max=1.0))
+        assert torch.allclose(output[2], x[2] * 0.5)
+
+    def test_batch_policy(self):
+        """Test the batch policies on a uint8 batch."""
+        for name in ("batch_simple_augment_train", "batch_randaugment_train"):
+            policy = getattr(policies, name)("TACO", 32)
+            assert isinstance(policy, BatchPolicy)
+            images = torch.stack([policy.sample(_image(i)) for i in range(6)])
+            assert images.dtype == torch.uint8
+            outputs = [
+                policy.batch(images, generator=torch.Generator().manual_seed(0))
+                for _ in range(2)
+            ]
+            assert outputs[0].shape == (6, 3, 32, 32)
+            assert torch.equal(outputs[0], outputs[1])
+
+        # the full image without flips is the normalized image
+        transform = BatchAugmentation(
+            24,
+            (0.0, 0.0, 0.0),
+            (1.0, 1.0, 1.0),
+            hflip=0.0,
+            scale=(1.0, 1.0),
+            ratio=(1.0, 1.0),
+        )
+        images = torch.randint(0, 256, (2, 3, 24, 24), dtype=torch.uint8)
+        assert torch.allclose(transform(images), images.float() / 255, atol=1e-5)
+
+
+if __name__ == "__main__":
+    test = TestAugmentation()
+    test.test_policies()
+    test.test_global_state()
+    test.test_albumentations()
+    test.test_workers()
+    test.test_batch_ops()
+    test.test_batch_policy()
@@ -0,0 +1,70 @@
+"""Latency benchmark test."""
+
+import torch
+from torch import nn
+
+from src.utils.torch_utils import RuntimeResult, benchmark_runtime, check_runtime
+
+
+class _CountingModel(nn.Module):
+    """Conv model which records the input shape and mode of every forward."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.conv = nn.Conv2d(3, 4, 3)
+        self.shapes = []
+        self.modes = []
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        self.shapes.append(tuple(x.shape))
+        self.modes.append(self.training)
+        return self.conv(x)
+
+
+class TestBenchmarkRuntime:
+    """Test benchmark_runtime on CPU."""
+
+    # pylint: disable=no-self-use
+
+    def test_counts(self):
+        """Test batch size and the number of warmup and timed forwards."""
+        model = _CountingModel()
+        result = benchmark_runtime(
+            model, [3, 16, 16], "cpu", batch_size=4, repeat=12, warmup=3
+        )
+        assert isinstance(result, RuntimeResult)
+        assert len(model.shapes) == 3 + 12
+        assert set(model.shapes) == {(4, 3, 16, 16)}
+        assert result.device == "cpu"
+        assert result.batch_size == 4 and result.repeat == 12
+
+    def test_statistics(self):
+        """Test the percentiles are ordered and check_runtime returns the mean."""
+        result = benchmark_runtime(_CountingModel(), [3, 16, 16], batch_size=2, repeat=30)
+        assert 0 < result.p50_ms <= result.p90_ms <= result.p99_ms
+        assert result.mean_ms > 0 and result.throughput > 0
+        assert check_runtime(_CountingModel(), [3, 16, 16], "cpu", repeat=5) > 0
+
+    def test_restore_state(self):
+        """Test the thread count and the training mode are restored."""
+        prev_threads = torch.get_num_threads()
+        model = _CountingModel()
+        model.train()
+        result = benchmark_runtime(
+            model, [3, 16, 16], repeat=3, warmup=1, num_threads=prev_threads + 1
+        )
+        assert result.num_threads == prev_threads + 1
+        assert torch.get_num_threads() == prev_threads
+        assert model.modes == [False] * 4
+        assert model.training
+
+        model.eval()
+        benchmark_runtime(model, [3, 16, 16], repeat=1, warmup=0)
+        assert not model.training
+
+
+if __name__ == "__main__":
+    test = TestBenchmarkRuntime()
+    test.test_counts()
+    test.test_statistics()
+    test.test_restore_state()
@@ -0,0 +1,244 @@
+"""Dataset loading test."""
+
+import os
+import random
+import tempfile
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from torchvision import transforms
+from torchvision.datasets import ImageFolder
+
+from src.augmentation import policies
+from src.dataloader import autotune_dataloader, get_dataloader, get_dataset
+from src.dataset import (
+    EXIF_ORIENTATION,
+    AlbuImageFolder,
+    CachedImageFolder,
+    decode_size,
+    reduced_loader,
+    split_transform,
+)
+from src.shard import ShardDataset, ShardShuffleSampler, pack_image_folder
+
+
+def _write_image_folder(root: str, n_images: int = 2) -> None:
+    rng = np.random.RandomState(0)
+    for split in ("train", "val", "test"):
+        for label in ("a", "b"):
+            os.makedirs(os.path.join(root, split, label))
+            for i in range(n_images):
+                img = rng.randint(0, 256, (300, 400, 3), dtype=np.uint8)
+                Image.fromarray(img).save(os.path.join(root, split, label, f"{i}.jpg"))
+
+
+class TestDataset:
+    """Test the reduced size JPEG decode."""
+
+    # pylint: disable=no-self-use
+
+    def test_reduced_loader(self):
+        """Test JPEG is decoded at the smallest scale larger than the size."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write_image_folder(tmpdir, n_images=1)
+            path = os.path.join(tmpdir, "train", "a", "0.jpg")
+            assert reduced_loader(path).size == (400, 300)
+            assert reduced_loader(path, 140).size == (200, 150)
+            assert reduced_loader(path, 37).size == (50, 38)
+            assert reduced_loader(path, 151).size == (400, 300)
+            assert reduced_loader(path, 140).mode == "RGB"
+
+    def test_exif_orientation(self):
+        """Test the albumentations path is rotated by EXIF as with cv2.imread."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write_image_folder(tmpdir, n_images=1)
+            path = os.path.join(tmpdir, "train", "a", "0.jpg")
+            exif = Image.Exif()
+            # rotated 90 degrees clockwise by the camera
+            exif[EXIF_ORIENTATION] = 6
+            Image.open(path).save(path, exif=exif)
+
+            assert reduced_loader(path).size == (400, 300)
+            assert reduced_loader(path, exif_transpose=True).size == (300, 400)
+            assert reduced_loader(path, 140, exif_transpose=True).size == (150, 200)
+            sample, _ = AlbuImageFolder(os.path.join(tmpdir, "train"))[0]
+            assert sample.shape == (400, 300, 3)
+            try:
+                import cv2  # pylint: disable=import-outside-toplevel
+            except ImportError:
+                return
+            expected = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+            assert expected.shape == sample.shape
+            assert np.abs(expected.astype(int) - sample.astype(int)).mean() < 3
+
+    def test_split_transform(self):
+        """Test the prefix ends at the last fixed size deterministic transform."""
+        train = policies.simple_augment_train("TACO", img_size=32)
+        prefix, tail = split_transform(train)
+        assert [t.__class__.__name__ for t in prefix] == ["SquarePad", "Resize"]
+        assert tail == train.transforms[2:]
+
+        # Resize of an int keeps the aspect ratio, so the shape is not fixed
+        prefix, tail = split_transform(
+            transforms.Compose([transforms.Resize(32), transforms.ToTensor()])
+        )
+        assert prefix == [] and len(tail) == 2
+
+    def test_cached_image_folder(self):
+        """Test the cached samples are the same as the uncached ones."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write_image_folder(tmpdir)
+            root = os.path.join(tmpdir, "train")
+            cache_dir = os.path.join(tmpdir, "cache")
+            transform = policies.simple_augment_test("TACO", img_size=32)
+            uncached = ImageFolder(root, transform=transform)
+            cached = CachedImageFolder(
+                root,
+                transform,
+                cache_dir,
+                img_size=32,
+                num_workers=0,
+                reduced_decode=False,
+            )
+            assert len(cached) == len(uncached)
+            assert cached.data.shape == (len(uncached), 32, 32, 3)
+            for (sample, target), (expected, expected_target) in zip(cached, uncached):
+                assert target == expected_target
+                assert torch.equal(sample, expected)
+
+            # cache is reused with the same prefix, rebuilt if the prefix changes
+            again = CachedImageFolder(
+                root,
+                transform,
+                cache_dir,
+                img_size=32,
+                num_workers=0,
+                reduced_decode=False,
+            )
+            assert again.cache_path == cached.cache_path
+            resized = CachedImageFolder(
+                root,
+                policies.simple_augment_test("TACO", img_size=24),
+                cache_dir,
+                img_size=32,
+                num_workers=0,
+                reduced_decode=False,
+            )
+            assert resized.cache_path != cached.cache_path
+            assert resized.data.shape == (len(uncached), 24, 24, 3)
+            assert len(os.listdir(cache_dir)) == 2
+
+            with pytest.raises(ValueError):
+                CachedImageFolder(
+                    root,
+                    transforms.Compose(
+                        [transforms.RandomResizedCrop(32), transforms.ToTensor()]
+                    ),
+                    cache_dir,
+                    img_size=32,
+                    num_workers=0,
+                )
+
+    def test_decode_size(self):
+        """Test the decode size of the policies."""
+        assert decode_size(policies.simple_augment_train("TACO", 100)) == 120
+        assert decode_size(policies.randaugment_train("TACO", 100)) == 100
+        policy = policies.batch_simple_augment_train("TACO", 100)
+        assert decode_size(policy.sample) == 120
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write_image_folder(tmpdir)
+            train, _, test = get_dataset(tmpdir, "TACO", img_size=32)
+            assert train[0][0].shape == test[0][0].shape == (3, 32, 32)
+            assert train.loader.keywords["size"] == 38
+            assert test.loader.keywords["size"] == 32
+
+    def test_shard(self):
+        """Test the packed samples and the shard shuffle order."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write_image_folder(tmpdir, n_images=5)
+            train = os.path.join(tmpdir, "train")
+            out = os.path.join(tmpdir, "shard")
+            assert pack_image_folder(train, out, shard_size=30000) > 1
+            dataset = ShardDataset(out)
+            folder = get_dataset(tmpdir, "TACO", img_size=32)[0]
+            assert dataset.classes == folder.classes
+            assert len(dataset) == len(folder)
+
+            # every packed sample is decoded as the image file
+            files = {}
+            for path, target in folder.samples:
+                with open(path, "rb") as f:
+                    files[f.read()] = (path, target)
+            for index in range(len(dataset)):
+                shard, offset, length, _ = dataset.index[index]
+                with open(dataset.shard_files[shard], "rb") as f:
+                    f.seek(offset)
+                    path, target = files.pop(f.read(length))
+                sample, label = dataset[index]
+                assert label == target
+                expected = np.asarray(reduced_loader(path))
+                assert np.array_equal(np.asarray(sample), expected)
+            assert not files
+
+            sampler = ShardShuffleSampler(dataset, buffer_size=3, seed=1)
+            orders = [list(sampler) for _ in range(2)]
+            assert sorted(orders[0]) == list(range(len(dataset)))
+            assert orders[0] != orders[1]
+            sampler.set_epoch(0)
+            assert list(sampler) == orders[0]
+
+    def test_loader_config(self):
+        """Test the worker settings and the autotune."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write_image_folder(tmpdir)
+            datasets = get_dataset(tmpdir, "TACO", img_size=32)
+            train, valid, _ = get_dataloader(
+                *datasets, batch_size=2, persistent_workers=True, num_workers=0
+            )
+            assert train.num_workers == 0 and not train.persistent_workers
+            assert not valid.persistent_workers
+            _, valid, test = get_dataloader(
+                *datasets,
+                batch_size=2,
+                persistent_workers=True,
+                eval_persistent_workers=True,
+                num_workers=0,
+            )
+            assert valid.persistent_workers and test.persistent_workers
+
+            random.seed(0)
+            torch.manual_seed(0)
+            expected = (random.random(), torch.rand(1))
+            random.seed(0)
+            torch.manual_seed(0)
+            train, _, _ = get_dataloader(
+                *datasets, batch_size=2, num_workers="auto", autotune_batches=2
+            )
+            assert (random.random(), torch.rand(1)) == expected
+            assert len(list(train)) == 2
+
+            best = autotune_dataloader(
+                lambda workers, prefetch: get_dataloader(
+                    *datasets,
+                    batch_size=2,
+                    num_workers=workers,
+                    prefetch_factor=prefetch,
+                )[0],
+                n_batches=2,
+                candidates=[(0, 2), (1, 4)],
+            )
+            assert best in [(0, 2), (1, 4)]
+
+
+if __name__ == "__main__":
+    test = TestDataset()
+    test.test_reduced_loader()
+    test.test_exif_orientation()
+    test.test_split_transform()
+    test.test_cached_image_folder()
+    test.test_decode_size()
+    test.test_shard()
+    test.test_loader_config()
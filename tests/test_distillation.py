@@ -0,0 +1,79 @@
+"""Teacher logit store test."""
+
+import os
+import random
+import tempfile
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import Dataset
+
+from src.dataset import SeededDataset, SeededSampler
+from src.distillation import precompute_teacher_logits, teacher_forward
+
+
+class _RandomDataset(Dataset):
+    """Samples augmented with every global random generator."""
+
+    def __len__(self) -> int:
+        return 10
+
+    def __getitem__(self, index):
+        sample = torch.full((3, 8, 8), float(index))
+        sample += torch.rand(3, 8, 8) + random.random() + float(np.random.rand())
+        return sample, index % 2
+
+
+def _teacher() -> nn.Module:
+    torch.manual_seed(0)
+    return nn.Sequential(
+        nn.Conv2d(3, 4, 3), nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(4, 6)
+    )
+
+
+class TestDistillation:
+    """Test reproducible views and the teacher logits."""
+
+    # pylint: disable=no-self-use
+
+    def test_seeded_dataset(self):
+        """Test the same (view, index) gives the same sample."""
+        dataset = SeededDataset(_RandomDataset(), seed=3)
+        sample, target, key = dataset[(1, 4)]
+        assert torch.equal(sample, dataset[(1, 4)][0])
+        assert not torch.equal(sample, dataset[(0, 4)][0])
+        assert target == 0 and key.tolist() == [1, 4]
+
+        sampler = SeededSampler(len(dataset), n_views=2, seed=3)
+        sampler.set_epoch(3)
+        keys = list(sampler)
+        assert sorted(index for _, index in keys) == list(range(10))
+        assert {view for view, _ in keys} == {1}
+
+    def test_teacher_logits(self):
+        """Test the stored logits are the teacher logits of the views."""
+        teacher = _teacher()
+        dataset = _RandomDataset()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "teacher.npy")
+            store = precompute_teacher_logits(
+                teacher, dataset, path, n_views=2, seed=3, batch_size=4, num_workers=0
+            )
+            assert store.complete
+
+            seeded = SeededDataset(dataset, seed=3)
+            keys = torch.tensor([[0, 1], [1, 1], [1, 9]])
+            data = torch.stack([seeded[tuple(key.tolist())][0] for key in keys])
+            expected = teacher_forward(teacher, data)
+            assert torch.allclose(store.read(keys), expected, atol=1e-2)
+
+            # reused without the teacher
+            reloaded = precompute_teacher_logits(None, dataset, path, n_views=2, seed=3)
+            assert torch.equal(reloaded.read(keys), store.read(keys))
+
+
+if __name__ == "__main__":
+    test = TestDistillation()
+    test.test_seeded_dataset()
+    test.test_teacher_logits()
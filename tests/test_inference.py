@@ -0,0 +1,91 @@
+"""Batched inference test."""
+
+import json
+import os
+import tempfile
+import time
+
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+from torchvision.transforms import Compose, Resize
+
+from src.utils.inference import inference
+
+CLASSES = ["a", "b", "c"]
+
+
+class _FileDataset(Dataset):
+    """(image, label, file name) samples whose image encodes the label."""
+
+    def __init__(self, n_samples: int) -> None:
+        self.n_samples = n_samples
+        self.transform = Compose([Resize((16, 16))])
+
+    def __len__(self) -> int:
+        return self.n_samples
+
+    def __getitem__(self, index: int):
+        img = torch.zeros(3, 16, 16)
+        img[0] = index % len(CLASSES)
+        return img, 0, f"{index}.jpg"
+
+
+class _LabelModel(nn.Module):
+    """One-hot logits of the class written in the first channel."""
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        label = x[:, 0, 0, 0].long()
+        return nn.functional.one_hot(label, len(CLASSES)).float()
+
+
+class TestInference:
+    """Test batched inference and the sampled per-image timing."""
+
+    # pylint: disable=no-self-use
+
+    def _run(self, batch_size: int, profile_every: int):
+        dataloader = DataLoader(_FileDataset(7), batch_size=batch_size)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = inference(
+                _LabelModel(),
+                dataloader,
+                tmpdir,
+                time.monotonic(),
+                "cpu",
+                CLASSES,
+                profile_every=profile_every,
+            )
+            with open(os.path.join(tmpdir, "output.csv")) as f:
+                assert json.load(f) == result
+        return result
+
+    def test_batched(self):
+        """Test every image is predicted with any batch size."""
+        expected = {f"{i}.jpg": CLASSES[i % len(CLASSES)] for i in range(7)}
+        for batch_size in (1, 3):
+            result = self._run(batch_size, profile_every=1)
+            assert result["inference"] == expected
+            assert set(result["time"]["inference"]) == set(expected)
+
+        profile = result["time"]["profile"]
+        assert set(profile) == {"cuda", "cpu"}
+        assert profile["cuda"] == 0.0 and 0.0 < profile["cpu"] < float("inf")
+
+    def test_sampled_profiling(self):
+        """Test only every profile_every-th batch is timed."""
+        # batches of [0, 1], [2, 3], [4, 5], [6]
+        result = self._run(batch_size=2, profile_every=2)
+        assert sorted(result["time"]["inference"]) == ["0.jpg", "1.jpg", "4.jpg", "5.jpg"]
+        times = result["time"]["inference"]
+        assert times["0.jpg"] == times["1.jpg"] and times["0.jpg"] > 0
+
+        result = self._run(batch_size=2, profile_every=0)
+        assert result["time"]["inference"] == {}
+        assert len(result["inference"]) == 7
+
+
+if __name__ == "__main__":
+    test = TestInference()
+    test.test_batched()
+    test.test_sampled_profiling()
@@ -0,0 +1,93 @@
+"""Latency lookup table test."""
+
+import pytest
+
+from src.model import ModelParser
+from src.nas import LatencyTable, layer_key, sample_model_configs
+
+
+def _model_config(width_multiple, out_channel):
+    return {
+        "input_channel": 3,
+        "depth_multiple": 1.0,
+        "width_multiple": width_multiple,
+        "INPUT_SIZE": [32, 32],
+        "backbone": [
+            [1, "Conv", [out_channel, 3, 2]],
+            [2, "InvertedResidualv3", [3, 4.0, out_channel, 1, 0, 2]],
+            [1, "GlobalAvgPool", []],
+        ],
+    }
+
+
+def _keys(cfg):
+    size = cfg["INPUT_SIZE"]
+    keys = []
+    for _, repeat, _, generator in ModelParser(cfg, build=False).generators():
+        keys.append(layer_key(generator, repeat, size))
+        _, size = generator.estimate(size, repeat=repeat)
+    return keys
+
+
+class TestLatencyTable:
+    """Test layer keys and latency prediction."""
+
+    # pylint: disable=no-self-use
+
+    def test_layer_key(self):
+        """Test layer keys do not depend on width_multiple."""
+        assert _keys(_model_config(0.5, 64)) == _keys(_model_config(1.0, 32))
+        assert _keys(_model_config(1.0, 64)) != _keys(_model_config(1.0, 32))
+
+    def test_canonical_key(self):
+        """Test omitted and default optional args give the same key."""
+        cfg, default_cfg = _model_config(1.0, 32), _model_config(1.0, 32)
+        default_cfg["backbone"][0] = [1, "Conv", [32, 3, 2, None, 1, "ReLU"]]
+        assert _keys(cfg) == _keys(default_cfg)
+        default_cfg["backbone"][0] = [1, "Conv", [32, 3, 2, None, 1, "Hardswish"]]
+        assert _keys(cfg)[0] != _keys(default_cfg)[0]
+
+    def test_search_space(self):
+        """Test the table built from the search space hits the trial configs."""
+        configs = sample_model_configs(3, {"input_channel": 3}, 32, seed=1)
+        table = LatencyTable()
+        table.build_from_configs(configs, n_repeat=1, warmup=0)
+        for cfg in configs:
+            prediction = table.predict(cfg)
+            assert prediction.n_missing == 0
+            assert all(source == "table" for _, _, source in prediction.layers)
+
+    def test_predict(self):
+        """Test prediction sums the table and estimates the missing layers."""
+        cfg = _model_config(1.0, 32)
+        keys = _keys(cfg)
+        table = LatencyTable()
+        table.table = {keys[0]: 1.0, keys[2]: 0.5}
+        prediction = table.predict(cfg)
+        assert prediction.n_missing == 1
+        assert [source for _, _, source in prediction.layers] == [
+            "table",
+            "estimated",
+            "table",
+        ]
+        assert abs(prediction.latency_ms - 1.5 - prediction.layers[1][1]) < 1e-9
+
+        prediction = table.predict(cfg, measure_missing=True)
+        assert prediction.n_missing == 0
+        assert keys[1] in table.table
+
+        # shipped configs have no INPUT_SIZE
+        with pytest.raises(ValueError, match="INPUT_SIZE"):
+            table.predict("configs/model/mobilenetv3.yaml")
+        prediction = table.predict(
+            "configs/model/mobilenetv3.yaml", input_size=[32, 32]
+        )
+        assert prediction.latency_ms > 0
+
+
+if __name__ == "__main__":
+    test = TestLatencyTable()
+    test.test_layer_key()
+    test.test_canonical_key()
+    test.test_search_space()
+    test.test_predict()
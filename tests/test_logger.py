@@ -0,0 +1,154 @@
+"""Metrics logger test."""
+
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import torch
+
+from src.logger import CSVBackend, JSONLBackend, LoggerBackend, MetricsLogger
+
+
+class _ListBackend(LoggerBackend):
+    """Backend which keeps every write call in memory."""
+
+    def __init__(self) -> None:
+        self.writes = []
+        self.matrices = []
+        self.closed = False
+
+    def write(self, records):
+        self.writes.append(list(records))
+
+    def write_confusion_matrix(self, name, matrix, class_names, step):
+        self.matrices.append((name, step))
+
+    def close(self):
+        self.closed = True
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    """Poll {condition} until it is true or {timeout} seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class TestMetricsLogger:
+    """Test the buffered metrics logger and its backends."""
+
+    # pylint: disable=no-self-use
+
+    def test_buffering(self):
+        """Test records are written in batches of flush_steps."""
+        backend = _ListBackend()
+        logger = MetricsLogger(backend, flush_steps=3, flush_secs=60.0)
+        logger.log({"loss": torch.tensor(1.0)})
+        logger.log({"loss": 2.0})
+        time.sleep(0.1)
+        assert backend.writes == []
+
+        logger.log({"loss": 3.0})
+        assert _wait_for(lambda: len(backend.writes) == 1)
+        assert [r["step"] for r in backend.writes[0]] == [1, 2, 3]
+        assert [r["loss"] for r in backend.writes[0]] == [1.0, 2.0, 3.0]
+        assert isinstance(backend.writes[0][0]["loss"], float)
+
+        logger.log({"loss": 4.0})
+        logger.log_confusion_matrix("conf_mat", np.eye(2), ["a", "b"])
+        logger.flush()
+        assert [r["step"] for r in backend.writes[1]] == [4]
+        assert backend.matrices == [("conf_mat", 4)]
+        logger.close()
+        assert backend.closed
+
+    def test_flush_interval(self):
+        """Test buffered records are written after flush_secs."""
+        backend = _ListBackend()
+        logger = MetricsLogger(backend, flush_steps=100, flush_secs=0.2)
+        logger.log({"loss": 1.0})
+        time.sleep(0.05)
+        assert backend.writes == []
+        assert _wait_for(lambda: len(backend.writes) == 1, timeout=2.0)
+        assert backend.writes[0][0]["loss"] == 1.0
+        logger.close()
+
+    def test_after_close(self):
+        """Test flush and log after close do not block or write."""
+        backend = _ListBackend()
+        logger = MetricsLogger(backend, flush_steps=100, flush_secs=60.0)
+        logger.log({"loss": 1.0})
+        logger.close()
+        assert len(backend.writes) == 1
+
+        done = threading.Event()
+
+        def _after_close():
+            logger.log({"loss": 2.0})
+            logger.log_confusion_matrix("conf_mat", np.eye(2), ["a", "b"])
+            logger.flush()
+            logger.close()
+            done.set()
+
+        threading.Thread(target=_after_close, daemon=True).start()
+        assert done.wait(timeout=5.0)
+        assert len(backend.writes) == 1
+        assert backend.matrices == []
+
+    def test_jsonl(self):
+        """Test the jsonl backend writes one record per line."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "metrics.jsonl")
+            logger = MetricsLogger(JSONLBackend(path), flush_steps=100)
+            logger.log({"train/loss": torch.tensor(0.5), "train/acc": 80.0})
+            logger.log({"train/loss": 0.25})
+            logger.log_confusion_matrix("conf_mat", np.eye(2), ["a", "b"])
+            logger.close()
+
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        assert [r["step"] for r in records] == [1, 2, 2]
+        assert records[0]["train/loss"] == 0.5
+        assert records[0]["train/acc"] == 80.0
+        assert records[1]["train/loss"] == 0.25
+        assert records[2]["conf_mat"] == {
+            "class_names": ["a", "b"],
+            "matrix": [[1.0, 0.0], [0.0, 1.0]],
+        }
+
+    def test_csv(self):
+        """Test the csv backend writes a (step, time, key, value) row per metric."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "metrics.csv")
+            logger = MetricsLogger(CSVBackend(path), flush_steps=100)
+            logger.log({"train/loss": 0.5, "train/acc": 80.0})
+            logger.close()
+            # Reopened file is appended without a second header.
+            logger = MetricsLogger(CSVBackend(path), flush_steps=100)
+            logger.log({"val/loss": 0.75})
+            logger.close()
+
+            with open(path, newline="") as f:
+                rows = list(csv.reader(f))
+        assert rows[0] == ["step", "time", "key", "value"]
+        assert [(r[0], r[2], r[3]) for r in rows[1:]] == [
+            ("1", "train/loss", "0.5"),
+            ("1", "train/acc", "80.0"),
+            ("1", "val/loss", "0.75"),
+        ]
+
+
+if __name__ == "__main__":
+    test = TestMetricsLogger()
+    test.test_buffering()
+    test.test_flush_interval()
+    test.test_after_close()
+    test.test_jsonl()
+    test.test_csv()
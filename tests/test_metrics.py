@@ -0,0 +1,54 @@
+"""Streaming metric test."""
+
+import torch
+from sklearn.metrics import f1_score
+
+from src.metrics import ConfusionMatrix
+
+
+class TestConfusionMatrix:
+    """Test streaming confusion matrix."""
+
+    # pylint: disable=no-self-use
+
+    NUM_CLASSES = 6
+
+    def test_matches_sklearn(self):
+        """Test accuracy and macro F1 against sklearn over several updates."""
+        metric = ConfusionMatrix(TestConfusionMatrix.NUM_CLASSES)
+        preds, gt = [], []
+        for _ in range(5):
+            pred = torch.randint(0, TestConfusionMatrix.NUM_CLASSES - 1, (32,))
+            label = torch.randint(0, TestConfusionMatrix.NUM_CLASSES - 1, (32,))
+            metric.update(pred, label)
+            preds += pred.tolist()
+            gt += label.tolist()
+
+        expected_f1 = f1_score(
+            y_true=gt,
+            y_pred=preds,
+            labels=list(range(TestConfusionMatrix.NUM_CLASSES)),
+            average="macro",
+            zero_division=0,
+        )
+        expected_acc = sum(p == g for p, g in zip(preds, gt)) / len(gt)
+
+        assert metric.total == len(gt)
+        assert abs(metric.f1() - expected_f1) < 1e-9
+        assert abs(metric.accuracy() - expected_acc) < 1e-9
+        assert metric.scores() == (metric.accuracy(), metric.f1())
+
+    def test_reset(self):
+        """Test reset clears the accumulated counts."""
+        metric = ConfusionMatrix(TestConfusionMatrix.NUM_CLASSES)
+        metric.update(torch.tensor([0, 1]), torch.tensor([0, 2]))
+        metric.reset()
+        assert metric.total == 0
+        assert metric.f1() == 0.0
+        assert metric.accuracy() == 0.0
+
+
+if __name__ == "__main__":
+    test = TestConfusionMatrix()
+    test.test_matches_sklearn()
+    test.test_reset()
@@ -10,7 +10,13 @@ import os
 import torch
 
 from src.model import Model
-from src.utils.torch_utils import convert_model_to_torchscript
+from src.utils.torch_utils import (
+    EXPORT_DEVICE_FILE,
+    OnnxRuntimeModel,
+    convert_model_to_torchscript,
+    export_onnx,
+    export_torchscript,
+)
 
 
 class TestModelConversion:
@@ -44,8 +50,43 @@ class TestModelConversion:
         """Test convert example model to TorchScript."""
         self._convert_evaluation(os.path.join("configs", "model", "example.yaml"))
 
+    def test_export(self):
+        """Test the frozen export is loaded back with the same output."""
+        for cfg in ("mobilenetv3", "shufflenetv2"):
+            model = Model(os.path.join("configs", "model", f"{cfg}.yaml")).model
+            export_torchscript(model, TestModelConversion.SAVE_PATH, [3, 64, 64])
+            extra_files = {EXPORT_DEVICE_FILE: ""}
+            ts_model = torch.jit.load(
+                TestModelConversion.SAVE_PATH, _extra_files=extra_files
+            )
+            os.remove(TestModelConversion.SAVE_PATH)
+            assert extra_files[EXPORT_DEVICE_FILE] == b"cpu"
+            # frozen: weights are constants of the graph, not module attributes
+            assert "prim::GetAttr" not in str(ts_model.graph)
+            assert not list(ts_model.parameters())
+
+            inputs = torch.rand(2, 3, 64, 64)
+            with torch.no_grad():
+                assert torch.allclose(model.eval()(inputs), ts_model(inputs), atol=1e-4)
+
+    def test_export_onnx(self):
+        """Test the ONNX model runs any batch size with ONNX Runtime."""
+        path = os.path.splitext(TestModelConversion.SAVE_PATH)[0] + ".onnx"
+        for cfg in ("mobilenetv3", "model_98"):
+            model = Model(os.path.join("configs", "model", f"{cfg}.yaml")).model
+            export_onnx(model, path, [3, 64, 64])
+            onnx_model = OnnxRuntimeModel(path, intra_op_threads=1, inter_op_threads=2)
+            os.remove(path)
+
+            inputs = torch.rand(5, 3, 64, 64)
+            with torch.no_grad():
+                expected = model.eval()(inputs)
+            assert torch.allclose(expected, onnx_model(inputs), atol=1e-4)
+
 
 if __name__ == "__main__":
     test = TestModelConversion()
     test.test_mobilenetv3()
     test.test_example()
+    test.test_export()
+    test.test_export_onnx()
@@ -0,0 +1,111 @@
+"""Analytic model cost test."""
+
+import glob
+
+import pytest
+import torch
+import torch.nn as nn
+
+from src.model import Model, ModelParser
+
+
+def _count_macs(model: nn.Module, input_size) -> int:
+    """Count conv and linear MACs with forward hooks."""
+    macs = [0]
+
+    def hook(module, _, output):
+        if isinstance(module, nn.Conv2d):
+            macs[0] += (
+                output.numel()
+                * module.in_channels
+                // module.groups
+                * module.kernel_size[0]
+                * module.kernel_size[1]
+            )
+        elif isinstance(module, nn.Linear):
+            macs[0] += module.in_features * module.out_features
+
+    handles = [m.register_forward_hook(hook) for m in model.modules()]
+    model.eval()
+    with torch.no_grad():
+        model(torch.zeros(1, 3, *input_size))
+    for handle in handles:
+        handle.remove()
+    return macs[0]
+
+
+class TestModelCost:
+    """Test analytic params and MACs match the instantiated model."""
+
+    # pylint: disable=no-self-use
+
+    INPUT_SIZE = [97, 97]
+
+    def _check(self, cfg):
+        model = Model(cfg)
+        cost = ModelParser(cfg, build=False).estimate(TestModelCost.INPUT_SIZE)
+        assert cost.params == sum(p.numel() for p in model.parameters())
+        assert cost.total_macs == _count_macs(model.model, TestModelCost.INPUT_SIZE)
+
+    def test_model_configs(self):
+        """Test every model config."""
+        for cfg in glob.glob("configs/model/*.yaml"):
+            self._check(cfg)
+
+    def test_input_size(self):
+        """Test a shipped config without INPUT_SIZE needs an explicit input size."""
+        cfg = "configs/model/mobilenetv3.yaml"
+        parser = ModelParser(cfg, build=False)
+        assert "INPUT_SIZE" not in parser.cfg
+        with pytest.raises(ValueError, match="INPUT_SIZE"):
+            parser.estimate()
+        cost = parser.estimate(TestModelCost.INPUT_SIZE)
+        assert cost.params == sum(p.numel() for p in Model(cfg).parameters())
+
+        parser = ModelParser(
+            dict(parser.cfg, INPUT_SIZE=TestModelCost.INPUT_SIZE), build=False
+        )
+        assert parser.estimate().total_macs == cost.total_macs
+
+    def test_modules(self):
+        """Test modules which are not used in the model configs."""
+        self._check(
+            {
+                "input_channel": 3,
+                "depth_multiple": 0.5,
+                "width_multiple": 0.75,
+                "backbone": [
+                    [2, "Conv", [16, 3, 2, None, 1, "Hardswish"]],
+                    [1, "MaxPool", [3, 2, 1]],
+                    [3, "DWConv", [32, 5, 2, None, "ReLU"]],
+                    [2, "Bottleneck", [48, True, 1, 0.5, "ReLU"]],
+                    [2, "ResBottleneck", [48]],
+                    [1, "AvgPool", [2]],
+                    [1, "GlobalAvgPool", []],
+                    [1, "Flatten", []],
+                    [1, "Linear", [6]],
+                ],
+            }
+        )
+        # ShuffleNetV2 out_channel is valid only for width_multiple 1.0
+        self._check(
+            {
+                "input_channel": 3,
+                "depth_multiple": 1.0,
+                "width_multiple": 1.0,
+                "backbone": [
+                    [1, "Conv", [24, 3, 2]],
+                    [1, "ShuffleNetV2", [2]],
+                    [3, "ShuffleNetV2", [1]],
+                    [1, "GlobalAvgPool", []],
+                    [1, "FixedConv", [6, 1, 1, None, 1, None]],
+                ],
+            }
+        )
+
+
+if __name__ == "__main__":
+    test = TestModelCost()
+    test.test_model_configs()
+    test.test_input_size()
+    test.test_modules()
@@ -0,0 +1,68 @@
+"""Conv-BN fusion test."""
+
+import os
+
+import torch
+from torch import nn
+
+from src.model import Model
+
+
+class TestModelFusion:
+    """Test Conv-BN fusion."""
+
+    # pylint: disable=no-self-use
+
+    INPUT = torch.rand(2, 3, 64, 64)
+
+    def _fuse_evaluation(self, cfg) -> None:
+        """Fused model gives the same output without BatchNorm."""
+        model = Model(cfg)
+        # Give BatchNorm non-trivial running statistics.
+        model.train()
+        with torch.no_grad():
+            for _ in range(3):
+                model(torch.rand(4, 3, 64, 64))
+        model.eval()
+        with torch.no_grad():
+            expected = model(TestModelFusion.INPUT)
+            fused = model.fuse()(TestModelFusion.INPUT)
+
+        assert not any(isinstance(m, nn.BatchNorm2d) for m in model.modules())
+        assert torch.allclose(expected, fused, atol=1e-4)
+
+    def test_mobilenetv3(self):
+        """Test fusion of Conv, InvertedResidualv3."""
+        self._fuse_evaluation(os.path.join("configs", "model", "mobilenetv3.yaml"))
+
+    def test_model_98(self):
+        """Test fusion of Conv, DWConv, InvertedResidualv2/v3, MBConv."""
+        self._fuse_evaluation(os.path.join("configs", "model", "model_98.yaml"))
+
+    def test_shufflenetv2(self):
+        """Test fusion of ShuffleNetV2."""
+        self._fuse_evaluation(os.path.join("configs", "model", "shufflenetv2.yaml"))
+
+    def test_bottleneck(self):
+        """Test fusion of Bottleneck."""
+        self._fuse_evaluation(
+            {
+                "input_channel": 3,
+                "depth_multiple": 1.0,
+                "width_multiple": 1.0,
+                "backbone": [
+                    [1, "Conv", [16, 3, 2]],
+                    [2, "Bottleneck", [16]],
+                    [1, "GlobalAvgPool", []],
+                    [1, "FixedConv", [6, 1, 1, None, 1, None]],
+                ],
+            }
+        )
+
+
+if __name__ == "__main__":
+    test = TestModelFusion()
+    test.test_mobilenetv3()
+    test.test_model_98()
+    test.test_shufflenetv2()
+    test.test_bottleneck()
@@ -0,0 +1,60 @@
+"""Architecture cache test."""
+
+import os
+import tempfile
+
+from src.model import Model
+from src.nas import ArchitectureCache, architecture_hash
+
+
+def _model_config(backbone, depth_multiple=1.0, width_multiple=1.0):
+    return {
+        "input_channel": 3,
+        "depth_multiple": depth_multiple,
+        "width_multiple": width_multiple,
+        "backbone": backbone,
+    }
+
+
+class TestArchitectureCache:
+    """Test architecture hash and the persistent cache."""
+
+    # pylint: disable=no-self-use
+
+    HEAD = [[1, "GlobalAvgPool", []], [1, "FixedConv", [6, 1, 1, None, 1, None]]]
+
+    def test_resolved_duplicates(self):
+        """Test configs which resolve to the same model share the hash."""
+        model1 = Model(
+            _model_config([[3, "Conv", [16, 3, 2]]] + self.HEAD, depth_multiple=0.25)
+        )
+        model2 = Model(_model_config([[1, "Conv", [16, 3, 2]]] + self.HEAD))
+        # make_divisible(14) == make_divisible(16) == 16
+        model3 = Model(_model_config([[1, "Conv", [14, 3, 2]]] + self.HEAD))
+        assert architecture_hash(model1.model) == architecture_hash(model2.model)
+        assert architecture_hash(model2.model) == architecture_hash(model3.model)
+
+        model4 = Model(_model_config([[1, "Conv", [16, 3, 1]]] + self.HEAD))
+        assert architecture_hash(model2.model) != architecture_hash(model4.model)
+
+    def test_cache(self):
+        """Test results are persisted per (architecture, context)."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            ArchitectureCache(path).put(
+                "arch", "ctx", ArchitectureCache.COMPLETE, 0.5, 1000, 1.5
+            )
+            cache = ArchitectureCache(path)
+            assert cache.get("arch", "ctx") == {
+                "status": ArchitectureCache.COMPLETE,
+                "f1": 0.5,
+                "params": 1000,
+                "mean_time": 1.5,
+            }
+            assert cache.get("arch", "other") is None
+
+
+if __name__ == "__main__":
+    test = TestArchitectureCache()
+    test.test_resolved_duplicates()
+    test.test_cache()
@@ -0,0 +1,85 @@
+"""Study data service test."""
+
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from src.nas import StudyDataService
+
+
+def _write_image_folder(root: str, n_images: int = 2) -> None:
+    rng = np.random.RandomState(0)
+    for split in ("train", "val", "test"):
+        for label in ("a", "b"):
+            os.makedirs(os.path.join(root, split, label))
+            for i in range(n_images):
+                img = rng.randint(0, 256, (60, 80, 3), dtype=np.uint8)
+                Image.fromarray(img).save(os.path.join(root, split, label, f"{i}.jpg"))
+
+
+def _data_config(data_path: str) -> dict:
+    return {
+        "DATA_PATH": data_path,
+        "DATASET": "TACO",
+        "IMG_SIZE": 32,
+        "AUG_TRAIN": "simple_augment_train",
+        "AUG_TEST": "simple_augment_test",
+        "AUG_TRAIN_PARAMS": None,
+        "BATCH_SIZE": 2,
+        "VAL_RATIO": 0.0,
+        "NUM_WORKERS": 0,
+        "EVAL_NUM_WORKERS": 0,
+    }
+
+
+class TestStudyDataService:
+    """Test the dataloaders shared by the NAS trials."""
+
+    # pylint: disable=no-self-use
+
+    def test_shared_loaders(self):
+        """Test the loaders read the cache and are shared by every trial."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write_image_folder(tmpdir)
+            cache_dir = os.path.join(tmpdir, "cache")
+            config = _data_config(tmpdir)
+            service = StudyDataService(config, cache_dir=cache_dir)
+
+            assert "CACHE_DIR" not in config
+            assert service.config["CACHE_DIR"] == cache_dir
+            assert service.loaders() == service.loaders()
+            train_loader, val_loader, _ = service.loaders()
+            assert train_loader.dataset.cache_path.startswith(cache_dir)
+            data, labels = next(iter(train_loader))
+            assert data.shape == (2, 3, 32, 32) and labels.shape == (2,)
+            assert len(val_loader.dataset) == 4
+            assert service.batch_transform is None
+
+    def test_build_cache(self):
+        """Test the cache built by the parent is reused by the workers."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write_image_folder(tmpdir)
+            cache_dir = os.path.join(tmpdir, "cache")
+            config = dict(_data_config(tmpdir), CACHE_DIR=cache_dir)
+            assert StudyDataService.build_cache(config, "unused") == cache_dir
+            files = {
+                name: os.path.getmtime(os.path.join(cache_dir, name))
+                for name in os.listdir(cache_dir)
+            }
+            # one cache of each of the train, val and test folders
+            assert len(files) == 3
+
+            service = StudyDataService(config)
+            assert service.config["CACHE_DIR"] == cache_dir
+            assert {
+                name: os.path.getmtime(os.path.join(cache_dir, name))
+                for name in os.listdir(cache_dir)
+            } == files
+
+
+if __name__ == "__main__":
+    test = TestStudyDataService()
+    test.test_shared_loaders()
+    test.test_build_cache()
@@ -0,0 +1,111 @@
+"""Parallel NAS worker test."""
+
+import os
+import tempfile
+import warnings
+
+import optuna
+
+from src.nas import (
+    NAS_STUDY,
+    SUPERNET_STUDY,
+    SuperNet,
+    create_storage,
+    create_study,
+    partition_cpus,
+    split_trials,
+    study_name,
+    suggest_model_config,
+)
+
+
+class TestParallelWorkers:
+    """Test the CPU partition, the trial split and the shared storage."""
+
+    # pylint: disable=no-self-use
+
+    def test_partition_cpus(self):
+        """Test every worker is pinned to a disjoint set of cores."""
+        cpus = {7, 0, 3, 1, 2, 6, 5, 4}
+        partition = partition_cpus(cpus, 3)
+        assert partition == [[0, 3, 6], [1, 4, 7], [2, 5]]
+        assert sorted(sum(partition, [])) == sorted(cpus)
+
+        assert partition_cpus(cpus, 8) == [[i] for i in range(8)]
+        assert partition_cpus({0, 1}, 3) == [None, None, None]
+
+    def test_split_trials(self):
+        """Test the trials are split as evenly as possible."""
+        assert split_trials(10, 3) == [4, 3, 3]
+        assert split_trials(2, 3) == [1, 1, 0]
+        assert sum(split_trials(100, 7)) == 100
+
+    def test_create_storage(self):
+        """Test the storage options and that the workers share the trials."""
+        assert create_storage(None) is None
+        with tempfile.TemporaryDirectory() as tmpdir:
+            url = f"sqlite:///{os.path.join(tmpdir, 'nas.db')}"
+            with warnings.catch_warnings():
+                # heartbeat and the retry callback are experimental in optuna
+                warnings.simplefilter("ignore")
+                storage = create_storage(url)
+                assert storage.engine_kwargs == {"connect_args": {"timeout": 60}}
+                assert storage.heartbeat_interval == 60
+                assert storage.grace_period == 180
+                assert isinstance(
+                    storage.failed_trial_callback,
+                    optuna.storages.RetryFailedTrialCallback,
+                )
+
+                storages = [create_storage(url) for _ in range(2)]
+                studies = [
+                    optuna.create_study(
+                        study_name="NAS", storage=worker_storage, load_if_exists=True
+                    )
+                    for worker_storage in storages
+                ]
+                studies[0].optimize(lambda trial: trial.suggest_float("x", 0, 1), 2)
+                studies[1].optimize(lambda trial: trial.suggest_float("x", 0, 1), 1)
+                assert len(studies[0].trials) == 3
+                for rdb_storage in [storage, *storages]:
+                    rdb_storage.engine.dispose()
+
+    def test_supernet_study(self):
+        """Test supernet and regular trials share a storage in separate studies."""
+        supernet = SuperNet("configs/nas/supernet.yaml")
+
+        def regular_objective(trial):
+            suggest_model_config(trial, {"input_channel": 3}, 32)
+            return 0.0, 0.0, 0.0
+
+        def supernet_objective(trial):
+            supernet.suggest_arch(trial)
+            return 0.0, 0.0, 0.0
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            url = f"sqlite:///{os.path.join(tmpdir, 'nas.db')}"
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                for supernet_mode, objective in (
+                    (False, regular_objective),
+                    (True, supernet_objective),
+                ):
+                    study = create_study(
+                        0,
+                        url,
+                        study_name(supernet_mode),
+                        sampler=optuna.samplers.RandomSampler(seed=0),
+                    )
+                    study.optimize(objective, n_trials=1)
+                    assert [t.state for t in study.trials] == [
+                        optuna.trial.TrialState.COMPLETE
+                    ]
+                names = [s.study_name for s in optuna.get_all_study_summaries(url)]
+        assert sorted(names) == [NAS_STUDY, SUPERNET_STUDY]
+
+if __name__ == "__main__":
+    test = TestParallelWorkers()
+    test.test_partition_cpus()
+    test.test_split_trials()
+    test.test_create_storage()
+    test.test_supernet_study()
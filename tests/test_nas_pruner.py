@@ -0,0 +1,76 @@
+"""NAS pruner test."""
+
+import optuna
+import pytest
+import torch
+import torch.nn as nn
+
+from src.model import Model
+from src.nas import SuccessiveHalvingPruner, compute_proxy, reject_by_proxy
+
+
+class TestNASPruner:
+    """Test successive halving and proxy rejection on a multi-objective study."""
+
+    # pylint: disable=no-self-use
+
+    def test_rung(self):
+        """Test rung placement."""
+        pruner = SuccessiveHalvingPruner(min_resource=2, reduction_factor=3)
+        assert [pruner.rung(e) for e in range(1, 19)] == [
+            None, 0, None, None, None, 1, None, None, None,
+            None, None, None, None, None, None, None, None, 2,
+        ]
+
+    def test_successive_halving(self):
+        """Test only the top 1 / reduction_factor trials are promoted."""
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        study = optuna.create_study(directions=["maximize", "minimize"])
+        pruner = SuccessiveHalvingPruner(min_resource=1, reduction_factor=3)
+        for score in [0.5, 0.6, 0.7]:
+            trial = study.ask()
+            pruner.report(trial, 1, score)
+            study.tell(trial, [score, 1])
+
+        trial = study.ask()
+        with pytest.raises(optuna.TrialPruned):
+            pruner.report(trial, 1, 0.6)
+        study.tell(trial, state=optuna.trial.TrialState.PRUNED)
+
+        trial = study.ask()
+        pruner.report(trial, 1, 0.8)
+        pruner.report(trial, 2, 0.0)
+
+    def test_reject_by_proxy(self):
+        """Test proxy rejection after warm up."""
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        study = optuna.create_study(directions=["maximize", "minimize"])
+        for score in [1.0, 2.0, 3.0, 4.0]:
+            trial = study.ask()
+            reject_by_proxy(trial, score, quantile=0.5, n_warmup=4)
+            study.tell(trial, [score, 1])
+
+        trial = study.ask()
+        with pytest.raises(optuna.TrialPruned):
+            reject_by_proxy(trial, 2.0, quantile=0.5, n_warmup=4)
+        assert trial.user_attrs["proxy"] == 2.0
+
+    def test_proxy(self):
+        """Test proxy scores are finite and do not change the weights."""
+        model = Model("configs/model/mobilenetv3.yaml").model
+        state = {k: v.clone() for k, v in model.state_dict().items()}
+        data = torch.rand(2, 3, 32, 32)
+        labels = torch.tensor([0, 1])
+        for name in ["gradnorm", "synflow"]:
+            score = compute_proxy(name, model, data, labels, nn.CrossEntropyLoss())
+            assert 0.0 < score < float("inf")
+        for key, value in model.state_dict().items():
+            assert torch.equal(value, state[key])
+
+
+if __name__ == "__main__":
+    test = TestNASPruner()
+    test.test_rung()
+    test.test_successive_halving()
+    test.test_reject_by_proxy()
+    test.test_proxy()
@@ -0,0 +1,83 @@
+"""Structured channel pruning test."""
+
+import os
+
+import torch
+from torch import nn
+
+from src.model import Model
+from src.pruning import prune_channels
+from src.utils.common import read_yaml
+
+
+class TestPruning:
+    """Test the pruned config and weights."""
+
+    # pylint: disable=no-self-use
+
+    INPUT = torch.rand(2, 3, 64, 64)
+
+    def _prune(self, cfg, ratio, criterion="l1"):
+        """Pruned model is rebuilt from its config and has fewer parameters."""
+        model_config = read_yaml(cfg) if isinstance(cfg, str) else cfg
+        model = Model(model_config).eval()
+        pruned_config, pruned = prune_channels(model_config, model, ratio, criterion)
+        rebuilt = Model(pruned_config)
+        rebuilt.load_state_dict(pruned.state_dict())
+        with torch.no_grad():
+            expected = model(TestPruning.INPUT)
+            output = pruned.eval()(TestPruning.INPUT)
+        assert output.shape == expected.shape
+        return model, pruned, expected, output
+
+    def test_mobilenetv3(self):
+        """Test Conv, InvertedResidualv3 with SE and Linear."""
+        cfg = os.path.join("configs", "model", "mobilenetv3.yaml")
+        _, _, expected, output = self._prune(cfg, 0.0)
+        assert torch.allclose(expected, output, atol=1e-5)
+
+        for criterion in ("l1", "bn"):
+            model, pruned, _, _ = self._prune(cfg, 0.5, criterion)
+            n_params = sum(p.numel() for p in model.parameters())
+            assert sum(p.numel() for p in pruned.parameters()) < n_params / 2
+
+    def test_model_79(self):
+        """Test DWConv, InvertedResidualv2, repeated Conv and FixedConv."""
+        self._prune(os.path.join("configs", "model", "model_79.yaml"), 0.3)
+
+    def test_keep_important(self):
+        """Test the channels without contribution are removed."""
+        model_config = {
+            "input_channel": 3,
+            "depth_multiple": 1.0,
+            "width_multiple": 1.0,
+            "backbone": [
+                [1, "Conv", [16, 3, 2]],
+                [2, "InvertedResidualv2", [32, 4, 1]],
+                [1, "Conv", [64, 1, 1]],
+                [1, "GlobalAvgPool", []],
+                [1, "Flatten", []],
+                [1, "Linear", [6]],
+            ],
+        }
+        model = Model(model_config).eval()
+        # odd channels of every BatchNorm output zero
+        for module in model.modules():
+            if isinstance(module, nn.BatchNorm2d):
+                module.weight.data[1::2] = 0
+                module.bias.data[1::2] = 0
+        pruned_config, pruned = prune_channels(model_config, model, 0.5, "bn")
+        assert [args[0] for _, _, args in pruned_config["backbone"][:3]] == [8, 16, 32]
+        assert pruned_config["backbone"][1][2][1] == 4
+        with torch.no_grad():
+            expected = model(TestPruning.INPUT)
+            output = pruned.eval()(TestPruning.INPUT)
+        assert torch.allclose(expected, output, atol=1e-5)
+
+
+if __name__ == "__main__":
+    test = TestPruning()
+
+    test.test_mobilenetv3()
+    test.test_model_79()
+    test.test_keep_important()
@@ -0,0 +1,102 @@
+"""int8 quantization test."""
+
+import os
+import tempfile
+
+import torch
+from torch import nn
+from torch.nn.intrinsic import qat as nniqat
+
+from src.model import Model
+from src.quantization import (
+    INT8_BACKEND_FILE,
+    FloatFallback,
+    QATSchedule,
+    convert_qat,
+    prepare_qat,
+    quantizable,
+    quantize_static,
+    save_int8_torchscript,
+)
+
+
+class TestQuantization:
+    """Test the quantizable rewrite and the int8 conversion."""
+
+    # pylint: disable=no-self-use
+
+    INPUT = torch.rand(4, 3, 64, 64)
+
+    def _quantize(self, cfg) -> nn.Module:
+        """Rewritten float model is exact and int8 model is close to it."""
+        model = Model(cfg).model.eval()
+        with torch.no_grad():
+            expected = model(TestQuantization.INPUT)
+            rewritten = quantizable(model)(TestQuantization.INPUT)
+        assert torch.allclose(expected, rewritten, atol=1e-4)
+
+        calib = [(torch.rand(4, 3, 64, 64), None) for _ in range(4)]
+        int8_model = quantize_static(model, calib + [(TestQuantization.INPUT, None)])
+        with torch.no_grad():
+            output = int8_model(TestQuantization.INPUT)
+        assert output.shape == expected.shape and output.dtype == torch.float32
+        assert torch.nn.functional.cosine_similarity(output, expected).min() > 0.9
+        return int8_model
+
+    def test_mobilenetv3(self):
+        """Test Conv, InvertedResidualv3 with SE and HardSwish."""
+        self._quantize(os.path.join("configs", "model", "mobilenetv3.yaml"))
+
+    def test_model_98(self):
+        """Test Conv, DWConv, InvertedResidualv2/v3, MBConv with Swish."""
+        self._quantize(os.path.join("configs", "model", "model_98.yaml"))
+
+    def test_float_fallback(self):
+        """Test layers without int8 kernels run in float."""
+        int8_model = self._quantize(
+            os.path.join("configs", "model", "shufflenetv2.yaml")
+        )
+        assert any(isinstance(m, FloatFallback) for m in int8_model)
+
+    def test_qat(self):
+        """Test the QAT freeze schedule and the int8 conversion."""
+        model = Model(os.path.join("configs", "model", "model_79.yaml")).model
+        qat_model = prepare_qat(model, "qnnpack")
+        conv_bns = [m for m in qat_model.modules() if isinstance(m, nniqat.ConvBn2d)]
+        assert conv_bns and qat_model.training
+
+        optimizer = torch.optim.SGD(qat_model.parameters(), lr=0.01)
+        schedule = QATSchedule("qnnpack", freeze_bn_epoch=1, freeze_observer_epoch=2)
+        for epoch in range(3):
+            schedule.step(qat_model, epoch)
+            assert all(m.freeze_bn == (epoch >= 1) for m in conv_bns)
+            for _ in range(2):
+                loss = qat_model(TestQuantization.INPUT).square().mean()
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+        fake_quants = [m for m in qat_model.modules() if hasattr(m, "observer_enabled")]
+        assert fake_quants and not any(m.observer_enabled for m in fake_quants)
+
+        qat_model.eval()
+        with torch.no_grad():
+            expected = qat_model(TestQuantization.INPUT)
+        int8_model = convert_qat(qat_model)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "best_int8.ts")
+            save_int8_torchscript(int8_model, path, TestQuantization.INPUT, "qnnpack")
+            extra_files = {INT8_BACKEND_FILE: ""}
+            scripted = torch.jit.load(path, _extra_files=extra_files)
+        assert extra_files[INT8_BACKEND_FILE] == b"qnnpack"
+        with torch.no_grad():
+            output = scripted(TestQuantization.INPUT)
+        assert torch.nn.functional.cosine_similarity(output, expected).min() > 0.9
+
+
+if __name__ == "__main__":
+    test = TestQuantization()
+
+    test.test_mobilenetv3()
+    test.test_model_98()
+    test.test_float_fallback()
+    test.test_qat()
@@ -0,0 +1,67 @@
+"""Weight-sharing supernet test."""
+
+import random
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+from src.model import ModelParser
+from src.nas import SuperNet, train_supernet
+
+SUPERNET_CONFIG = "configs/nas/supernet.yaml"
+
+
+def _randomize_bn(model: nn.Module) -> None:
+    """Non-trivial BatchNorm parameters and statistics."""
+    for m in model.modules():
+        if isinstance(m, nn.BatchNorm2d):
+            m.running_mean.uniform_(-0.1, 0.1)
+            m.running_var.uniform_(0.5, 1.5)
+            m.weight.data.uniform_(0.5, 1.5)
+            m.bias.data.uniform_(-0.1, 0.1)
+
+
+class TestSuperNet:
+    """Test sub-architectures of the supernet."""
+
+    # pylint: disable=no-self-use
+
+    def test_export(self):
+        """Test the exported model gives the same output as the supernet."""
+        supernet = SuperNet(SUPERNET_CONFIG)
+        _randomize_bn(supernet)
+        supernet.eval()
+        rng = random.Random(0)
+        x = torch.randn(2, 3, 64, 64)
+        archs = [supernet.max_arch(), supernet.min_arch()]
+        archs += [supernet.sample_arch(rng) for _ in range(4)]
+        for arch in archs:
+            model = supernet.export(arch).eval()
+            with torch.no_grad():
+                expected = supernet.set_arch(arch)(x)
+                output = model(x)
+            assert torch.allclose(expected, output, atol=1e-5)
+
+            cfg = supernet.to_model_config(arch)
+            cost = ModelParser(cfg, build=False).estimate([64, 64])
+            assert cost.params == sum(p.numel() for p in model.parameters())
+
+    def test_train(self):
+        """Test the sandwich rule updates the shared weights."""
+        supernet = SuperNet(SUPERNET_CONFIG)
+        dataloader = DataLoader(
+            TensorDataset(torch.randn(8, 3, 32, 32), torch.randint(0, 6, (8,))),
+            batch_size=4,
+        )
+        optimizer = torch.optim.SGD(supernet.parameters(), lr=0.1)
+        weight = supernet.stem.conv.weight.detach().clone()
+        loss = train_supernet(supernet, dataloader, optimizer, nn.CrossEntropyLoss())
+        assert loss > 0
+        assert not torch.equal(weight, supernet.stem.conv.weight)
+
+
+if __name__ == "__main__":
+    test = TestSuperNet()
+    test.test_export()
+    test.test_train()
@@ -6,7 +6,7 @@
 import argparse
 import os
 from datetime import datetime
-from typing import Any, Dict, Tuple, Union
+from typing import Any, Dict, Optional, Tuple, Union
 
 import torch
 import torch.nn as nn
@@ -14,9 +14,11 @@ import torch.optim as optim
 import yaml
 import wandb
 
-from src.dataloader import create_dataloader
+from src.dataloader import create_dataloader, get_batch_transform
+from src.logger import create_logger
 from src.loss import CustomCriterion
 from src.model import Model
+from src.quantization import QATSchedule, default_backend, prepare_qat
 from src.trainer import TorchTrainer
 from src.utils.common import get_label_counts, read_yaml
 from src.utils.torch_utils import check_runtime, model_info
@@ -29,8 +31,13 @@ def train(
     log_dir: str,
     fp16: bool,
     device: torch.device,
+    init_weight: Optional[str] = None,
 ) -> Tuple[float, float, float]:
-    """Train."""
+    """Train.
+
+    {init_weight} is the state_dict to start from, e.g. the pruned weights of
+    prune.py for the fine-tuning.
+    """
     # save model_config, data_config
     with open(os.path.join(log_dir, "data.yml"), "w") as f:
         yaml.dump(data_config, f, default_flow_style=False)
@@ -41,14 +48,31 @@ def train(
     model_path = os.path.join(log_dir, "best.pt")
     print(f"Model save path: {model_path}")
 
-    model_instance.model.to(device)
+    model = model_instance.model
+    if init_weight:
+        model.load_state_dict(torch.load(init_weight, map_location="cpu"))
+    qat = None
+    if data_config.get("QAT", False):
+        if data_config.get("QAT_WEIGHT"):
+            model.load_state_dict(
+                torch.load(data_config["QAT_WEIGHT"], map_location="cpu")
+            )
+        qat = QATSchedule(
+            backend=data_config.get("QAT_BACKEND") or default_backend(),
+            freeze_bn_epoch=data_config.get("QAT_FREEZE_BN_EPOCH"),
+            freeze_observer_epoch=data_config.get("QAT_FREEZE_OBSERVER_EPOCH"),
+        )
+        model = prepare_qat(model, qat.backend)
+        # fake quantization runs in fp32
+        fp16 = False
+    model.to(device)
 
     # Create dataloader
     train_dl, val_dl, test_dl = create_dataloader(data_config)
 
     # Create optimizer, scheduler, criterion
     optimizer = torch.optim.SGD(
-        model_instance.model.parameters(), lr=data_config["INIT_LR"], momentum=0.9
+        model.parameters(), lr=data_config["INIT_LR"], momentum=0.9
     )
     scheduler = torch.optim.lr_scheduler.OneCycleLR(
         optimizer=optimizer,
@@ -67,10 +91,11 @@ def train(
     scaler = (
         torch.cuda.amp.GradScaler() if fp16 and device != torch.device("cpu") else None
     )
+    logger = create_logger(data_config, log_dir)
 
     # Create trainer
     trainer = TorchTrainer(
-        model=model_instance.model,
+        model=model,
         criterion=criterion,
         optimizer=optimizer,
         scheduler=scheduler,
@@ -78,6 +103,10 @@ def train(
         device=device,
         model_path=model_path,
         verbose=1,
+        log_interval=data_config.get("LOG_INTERVAL", 1),
+        logger=logger,
+        batch_transform=get_batch_transform(data_config),
+        qat=qat,
     )
     best_acc, best_f1 = trainer.train(
         train_dataloader=train_dl,
@@ -86,10 +115,11 @@ def train(
     )
 
     # evaluate model with test set
-    model_instance.model.load_state_dict(torch.load(model_path))
+    model.load_state_dict(torch.load(model_path))
     test_loss, test_f1, test_acc = trainer.test(
-        model=model_instance.model, test_dataloader=val_dl if val_dl else test_dl
+        model=model, test_dataloader=val_dl if val_dl else test_dl
     )
+    logger.close()
     return test_loss, test_f1, test_acc
 
 
@@ -129,11 +159,12 @@ if __name__ == "__main__":
     os.makedirs(log_dir, exist_ok=True)
 
     # for wandb
-    wandb.init(project='lightweight', entity='cv4', name = args.run_name, save_code = True)
-    wandb.run.name = args.run_name
-    wandb.run.save()
-    wandb.config.update(model_config)
-    wandb.config.update(data_config)
+    if data_config.get("LOGGER", "wandb") == "wandb":
+        wandb.init(project='lightweight', entity='cv4', name = args.run_name, save_code = True)
+        wandb.run.name = args.run_name
+        wandb.run.save()
+        wandb.config.update(model_config)
+        wandb.config.update(data_config)
 
     test_loss, test_f1, test_acc = train(
         model_config=model_config,
@@ -0,0 +1,83 @@
+"""Weight-sharing supernet train
+
+Train the supernet of configs/nas/supernet.yaml once with the sandwich rule.
+AutoML_NAS --supernet evaluates the sub-architectures with the inherited
+weights instead of training each trial.
+
+    python train_supernet.py --supernet configs/nas/supernet.yaml --data configs/data/taco_tune.yaml
+"""
+
+import argparse
+import os
+
+import torch
+import torch.nn as nn
+import yaml
+
+from src.dataloader import create_dataloader
+from src.nas.supernet import SuperNet, train_supernet
+from src.utils.common import read_yaml
+from src.utils.setseed import setSeed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train weight-sharing supernet.")
+    parser.add_argument(
+        "--supernet",
+        default="configs/nas/supernet.yaml",
+        type=str,
+        help="supernet search space config",
+    )
+    parser.add_argument(
+        "--data", default="configs/data/taco_tune.yaml", type=str, help="data config"
+    )
+    parser.add_argument(
+        "--n_random",
+        default=2,
+        type=int,
+        help="number of sampled sub-architectures per step besides the largest and the smallest",
+    )
+    parser.add_argument("--seed", default=42, type=int, help="seed")
+    parser.add_argument(
+        "--log_dir", default="exp/supernet", type=str, help="checkpoint directory"
+    )
+    args = parser.parse_args()
+
+    data_config = read_yaml(cfg=args.data)
+    setSeed(args.seed)
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    os.makedirs(args.log_dir, exist_ok=True)
+
+    supernet = SuperNet(args.supernet)
+    with open(os.path.join(args.log_dir, "supernet.yml"), "w") as f:
+        yaml.dump(supernet.cfg, f, default_flow_style=False)
+    with open(os.path.join(args.log_dir, "data.yml"), "w") as f:
+        yaml.dump(data_config, f, default_flow_style=False)
+
+    train_dl, _, _ = create_dataloader(data_config)
+    optimizer = torch.optim.SGD(
+        supernet.parameters(), lr=data_config["INIT_LR"], momentum=0.9
+    )
+    scheduler = torch.optim.lr_scheduler.OneCycleLR(
+        optimizer=optimizer,
+        max_lr=data_config["INIT_LR"],
+        steps_per_epoch=len(train_dl),
+        epochs=data_config["EPOCHS"],
+        pct_start=0.05,
+    )
+    criterion = nn.CrossEntropyLoss()
+
+    model_path = os.path.join(args.log_dir, "supernet.pt")
+    for epoch in range(data_config["EPOCHS"]):
+        loss = train_supernet(
+            supernet,
+            train_dl,
+            optimizer,
+            criterion,
+            scheduler=scheduler,
+            device=device,
+            n_random=args.n_random,
+        )
+        print(f"Epoch: [{epoch + 1} | {data_config['EPOCHS']}] Loss: {loss:.3f}")
+        torch.save(supernet.state_dict(), model_path)
+    print(f"Supernet saved at {model_path}")
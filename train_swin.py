@@ -104,6 +104,7 @@ def train(
     test_loss, test_f1, test_acc = trainer.test(
         model=model, test_dataloader=val_dl if val_dl else test_dl
     )
+    trainer.close()
     return test_loss, test_f1, test_acc
 
 